@@ -0,0 +1,25 @@
+"""add an index on the time of history entries for keyset pagination
+
+Revision ID: 3c71d5a2b8e4
+Revises: 8f4e7b2c9d10
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3c71d5a2b8e4"
+down_revision: Union[str, None] = "8f4e7b2c9d10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_history_time_id", "history", ["time", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_history_time_id", table_name="history")
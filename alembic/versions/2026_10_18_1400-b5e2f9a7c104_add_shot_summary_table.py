@@ -0,0 +1,52 @@
+"""add the shot_summary table
+
+The summaries of existing shots are filled in by the backend after the upgrade,
+see ShotManager.backfillSummaries.
+
+Revision ID: b5e2f9a7c104
+Revises: 3c71d5a2b8e4
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b5e2f9a7c104"
+down_revision: Union[str, None] = "3c71d5a2b8e4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "shot_summary",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("history_id", sa.Integer(), nullable=False),
+        sa.Column("points", sa.Integer(), nullable=False),
+        sa.Column("total_time", sa.Float(), nullable=True),
+        sa.Column("extraction_time", sa.Float(), nullable=True),
+        sa.Column("final_weight", sa.Float(), nullable=True),
+        sa.Column("peak_pressure", sa.Float(), nullable=True),
+        sa.Column("avg_pressure", sa.Float(), nullable=True),
+        sa.Column("peak_flow", sa.Float(), nullable=True),
+        sa.Column("avg_flow", sa.Float(), nullable=True),
+        sa.Column("min_temperature", sa.Float(), nullable=True),
+        sa.Column("max_temperature", sa.Float(), nullable=True),
+        sa.Column("avg_temperature", sa.Float(), nullable=True),
+        sa.Column("end_status", sa.Text(), nullable=True),
+        sa.Column("preview", sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["history_id"],
+            ["history.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("history_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("shot_summary")
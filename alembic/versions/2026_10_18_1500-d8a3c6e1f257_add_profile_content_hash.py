@@ -0,0 +1,97 @@
+"""add a content hash to profiles to find stored profiles by
+
+The hash is the sha256 of the profile fields as JSON with sorted keys, the way
+shot_database.profile_content_hash computes it. The canonicalization is copied
+here so this migration keeps hashing the same way if the backend changes.
+
+Profiles stored more than once keep their hash on the oldest row only, the
+newer copies stay referenced by their shots but are never matched again.
+
+Revision ID: d8a3c6e1f257
+Revises: b5e2f9a7c104
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+import hashlib
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d8a3c6e1f257"
+down_revision: Union[str, None] = "b5e2f9a7c104"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Profiles missing one of these were stored with its default, so the stored values
+# hash the same as the profile they came from
+FIELDS = (
+    "id",
+    "author",
+    "author_id",
+    "display",
+    "final_weight",
+    "last_changed",
+    "name",
+    "temperature",
+    "stages",
+    "variables",
+    "previous_authors",
+)
+JSON_FIELDS = ("display", "stages", "variables", "previous_authors")
+
+
+def _canonical(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def _content_hash(row: dict) -> str:
+    fields = {}
+    for name in FIELDS:
+        value = row[name]
+        if name in JSON_FIELDS and isinstance(value, str):
+            value = json.loads(value)
+        fields[name] = _canonical(value)
+    canonical = json.dumps(fields, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("profile", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("content_hash", sa.Text(), nullable=True))
+
+    connection = op.get_bind()
+    columns = ", ".join(f'"{name}"' for name in FIELDS)
+    rows = connection.execute(sa.text(f'SELECT "key", {columns} FROM profile ORDER BY "key"'))
+
+    seen = set()
+    updates = []
+    for row in rows.mappings():
+        content_hash = _content_hash(row)
+        if content_hash in seen:
+            continue
+        seen.add(content_hash)
+        updates.append({"key": row["key"], "content_hash": content_hash})
+
+    if updates:
+        connection.execute(
+            sa.text('UPDATE profile SET content_hash = :content_hash WHERE "key" = :key'),
+            updates,
+        )
+
+    op.create_index("ix_profile_content_hash", "profile", ["content_hash"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_profile_content_hash", table_name="profile")
+    with op.batch_alter_table("profile", schema=None) as batch_op:
+        batch_op.drop_column("content_hash")
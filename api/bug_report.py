@@ -1,4 +1,3 @@
-import asyncio
 import json
 import os
 import re
@@ -21,6 +20,7 @@ from sqlalchemy import and_, desc, func, insert, or_, select, update
 from config import DATABASE_URL, DEBUG_HISTORY_PATH
 from database_models import bug_reports
 from log import MeticulousLogger
+from runtime import Runtime
 from shot_database import ShotDataBase
 
 from .api import API, APIVersion
@@ -352,13 +352,7 @@ def _select_debug_files(
 async def _capture_incomplete_debug_shot(draft_dir: Path) -> str | None:
     from shot_debug_manager import ShotDebugManager
 
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-
-    return await loop.run_in_executor(
-        None,
+    return await Runtime.run_blocking(
         ShotDebugManager.write_current_incomplete_debug_shot,
         draft_dir.joinpath(DEBUG_ARCHIVE_DIR),
     )
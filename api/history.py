@@ -3,21 +3,41 @@ import os
 
 import tornado
 import tornado.web
-import zstandard as zstd
 from pydantic import ValidationError
 from typing import Optional
 
 from log import MeticulousLogger
-from shot_database import SearchParams, ShotDataBase, SearchOrder, SearchOrderBy
+from shot_database import (
+    InvalidCursor,
+    SearchParams,
+    ShotDataBase,
+    SearchOrder,
+    SearchOrderBy,
+)
 from config import DEBUG_HISTORY_PATH, SHOT_PATH
+from shot_file import (
+    ShotDictionaries,
+    frame_dictionary_id,
+    read_zst,
+    recompress_without_dictionary,
+)
+from shot_format_v2 import ShotFileV2, is_shot_v2
 from shot_manager import ShotManager
+from history_rebuild import HistoryRebuild
 
 from .api import API, APIVersion
 from .base_handler import BaseHandler
 import asyncio
 from shot_debug_manager import ShotDebugManager
 from pathlib import Path
-from config import MeticulousConfig, CONFIG_SYSTEM, DEVICE_IDENTIFIER
+from config import (
+    MeticulousConfig,
+    CONFIG_SYSTEM,
+    CONFIG_USER,
+    DEVICE_IDENTIFIER,
+    SHOT_ZSTD_DICTIONARY,
+)
+from runtime import Runtime
 
 logger = MeticulousLogger.getLogger(__name__)
 last_version_path = f"/api/{APIVersion.latest_version().name.lower()}"
@@ -127,6 +147,8 @@ class ZstdHistoryHandler(tornado.web.StaticFileHandler):
             self.set_status(404)
             self.write({"status": "error", "error": "history entry not found", "path": path})
             return
+        elif is_shot_v2(full_path) and not serve_compressed:
+            return self.serve_shot_v2(full_path)
         elif full_path.endswith(".zst") and not serve_compressed:
             logger.info("dealing")
             # Handle .zstd compressed file
@@ -134,7 +156,7 @@ class ZstdHistoryHandler(tornado.web.StaticFileHandler):
         else:
             logger.info("File exists on disk")
             # Fallback to default behavior for regular files
-            if full_path.endswith(".zst"):
+            if full_path.endswith(".zst") or is_shot_v2(full_path):
                 self.set_header("Content-Type", "application/octet-stream")
                 device_name = "".join(MeticulousConfig[CONFIG_SYSTEM][DEVICE_IDENTIFIER])
                 file_date_formatted = path.split(os.path.sep)[0].replace("-", "_")
@@ -147,26 +169,57 @@ class ZstdHistoryHandler(tornado.web.StaticFileHandler):
                 )
             else:
                 self.set_header("Content-Type", "application/json")
+            if full_path.endswith(".zst") and self._uses_dictionary(full_path):
+                # Clients do not have the dictionary of this machine
+                self.write(recompress_without_dictionary(full_path))
+                self.finish()
+                return
             await super().get(path, True)
             self.finish()
 
+    @staticmethod
+    def _uses_dictionary(full_path):
+        with open(full_path, "rb") as file:
+            return frame_dictionary_id(file) != 0
+
+    def serve_shot_v2(self, full_path):
+        """Serves a v2 shot file as the legacy JSON document or, if channels or a time
+        range are requested, only those as {"channels": {name: [values]}}"""
+        channels = self.get_query_argument("channels", None)
+        start_ms = self.get_query_argument("start_ms", None)
+        end_ms = self.get_query_argument("end_ms", None)
+        shot_file = ShotFileV2.open(full_path)
+        if channels is None and start_ms is None and end_ms is None:
+            self.write(json.dumps(shot_file.to_legacy_json()))
+            self.finish()
+            return
+
+        try:
+            selected = shot_file.read(
+                channels.split(",") if channels else None,
+                int(start_ms) if start_ms is not None else None,
+                int(end_ms) if end_ms is not None else None,
+            )
+        except (KeyError, ValueError) as e:
+            self.set_status(400)
+            self.write({"status": "error", "error": str(e)})
+            return
+        self.write(json.dumps({"rows": shot_file.rows, "channels": selected}))
+        self.finish()
+
     async def serve_decompressed_file(self, full_path):
         logger.info(f"Serving File: {full_path}")
-        with open(full_path, "rb") as compressed_file:
-            decompressor = zstd.ZstdDecompressor()
-            decompressed_content = decompressor.stream_reader(compressed_file)
-            logger.warning(full_path)
-            raw = decompressed_content.read()
-            if b": Infinity" in raw or b": NaN" in raw:
-                logger.warning(f"Patching non-finite JSON token in shot file: {full_path}")
-                raw = raw.replace(b": Infinity", b": 0.0")
-                raw = raw.replace(b": NaN", b": 0.0")
-            if full_path.endswith(".csv.zst"):
-                self.set_header("Content-Type", "text/csv")
-            else:
-                self.set_header("Content-Type", "application/json")
-            self.write(raw)
-            self.finish()
+        raw = read_zst(full_path)
+        if b": Infinity" in raw or b": NaN" in raw:
+            logger.warning(f"Patching non-finite JSON token in shot file: {full_path}")
+            raw = raw.replace(b": Infinity", b": 0.0")
+            raw = raw.replace(b": NaN", b": 0.0")
+        if full_path.endswith(".csv.zst"):
+            self.set_header("Content-Type", "text/csv")
+        else:
+            self.set_header("Content-Type", "application/json")
+        self.write(raw)
+        self.finish()
 
     async def list_directory(self, full_path):
 
@@ -218,8 +271,13 @@ class LastShotHandler(BaseHandler):
 class HistoryHandler(BaseHandler):
     async def searchHistory(self, params: SearchParams):
         loop = asyncio.get_event_loop()
-        last = await loop.run_in_executor(None, ShotDataBase.search_history, params)
-        return last
+        try:
+            page = await loop.run_in_executor(None, ShotDataBase.search_history_page, params)
+        except InvalidCursor as e:
+            self.set_status(400)
+            self.write({"error": "Invalid cursor", "details": str(e)})
+            return
+        self.write(page)
 
     async def post(self):
         try:
@@ -234,8 +292,7 @@ class HistoryHandler(BaseHandler):
             self.write(e.json())
             return
 
-        results = await self.searchHistory(params)
-        self.write({"history": results})
+        await self.searchHistory(params)
 
     async def get(self):
         # get all entries
@@ -247,11 +304,12 @@ class HistoryHandler(BaseHandler):
             order_by=self.get_query_arguments("order_by", [SearchOrderBy.date]),
             sort=self.get_query_argument("sort", SearchOrder.descending),
             max_results=self.get_query_argument("max_results", 20),
-            dump_data=self.get_query_argument("dump_data", True),
+            dump_data=self.get_query_argument("dump_data", False),
+            summary=self.get_query_argument("summary", False),
+            cursor=self.get_query_argument("cursor", None),
         )
 
-        results = await self.searchHistory(params)
-        self.write({"history": results})
+        await self.searchHistory(params)
 
 
 class StatisticsHandler(BaseHandler):
@@ -306,6 +364,41 @@ class ShotRatingHandler(BaseHandler):
             self.write({"status": "error", "error": "Internal server error"})
 
 
+class ShotDictionaryHandler(BaseHandler):
+    def get(self):
+        current = ShotDictionaries.current()
+        self.write(
+            {
+                "enabled": MeticulousConfig[CONFIG_USER][SHOT_ZSTD_DICTIONARY],
+                "current": current.dict_id() if current is not None else None,
+                "dictionaries": ShotDictionaries.available(),
+            }
+        )
+
+    async def post(self):
+        # Trains a new dictionary on the latest shots
+        dictionary = await Runtime.run_blocking(ShotManager.trainDictionary)
+        if dictionary is None:
+            self.set_status(409)
+            self.write({"status": "error", "error": "Not enough shots to train on"})
+            return
+        self.write({"status": "ok", "current": dictionary.dict_id()})
+
+
+class HistoryRebuildHandler(BaseHandler):
+    def get(self):
+        self.write(HistoryRebuild.status())
+
+    def post(self):
+        # Re-imports the shot files into the database in the background
+        if not HistoryRebuild.start():
+            self.set_status(409)
+            self.write({"status": "error", "error": "A rebuild is already running"})
+            return
+        self.set_status(202)
+        self.write({"status": "ok"})
+
+
 API.register_handler(APIVersion.V1, r"/history/search", ProfileSearchHandler),
 API.register_handler(APIVersion.V1, r"/history/current", CurrentShotHandler),
 API.register_handler(APIVersion.V1, r"/history/last", LastShotHandler),
@@ -314,6 +407,8 @@ API.register_handler(APIVersion.V1, r"/history/stats", StatisticsHandler),
 API.register_handler(APIVersion.V1, r"/history", HistoryHandler),
 API.register_handler(APIVersion.V1, r"/history/last-debug-file", LastDebugFileHandler),
 API.register_handler(APIVersion.V1, r"/history/rating/(.*)", ShotRatingHandler),
+API.register_handler(APIVersion.V1, r"/history/zstd-dictionary", ShotDictionaryHandler),
+API.register_handler(APIVersion.V1, r"/history/rebuild", HistoryRebuildHandler),
 
 API.register_handler(
     APIVersion.V1,
@@ -4,9 +4,11 @@ import subprocess
 from hostname import HostnameManager
 from log import MeticulousLogger
 from machine import Machine
+from machine_bus import MachineBus
+from persistence import PersistenceService
 from wifi import WifiManager
 from enum import Enum
-import asyncio
+from runtime import Runtime
 
 from .api import API, APIVersion
 from .base_handler import BaseHandler, LocalAccessHandler
@@ -143,20 +145,11 @@ class UpdateOSStatus(BaseHandler):
         cls.last_progress = current_progress
         cls.last_status = current_status
         if cls.__sio:
-            loop = (
-                asyncio.get_event_loop()
-                if asyncio.get_event_loop().is_running()
-                else asyncio.new_event_loop()
-            )
-            asyncio.set_event_loop(loop)
 
             async def sendUpdateStatus():
                 await cls.__sio.emit("OSUpdate", cls.to_json())
 
-            if not loop.is_running():
-                loop.run_until_complete(sendUpdateStatus())
-            else:
-                asyncio.create_task(sendUpdateStatus())
+            Runtime.spawn(sendUpdateStatus(), "os-update-status")
 
     @classmethod
     def sendLastStatus(cls):
@@ -251,8 +244,42 @@ class MachineTimeHandler(BaseHandler):
         self.write({"status": "success"})
 
 
+class MachineBusStatsHandler(BaseHandler):
+    def get(self):
+        self.write(json.dumps(MachineBus.stats()))
+
+
+class MachinePersistenceStatsHandler(BaseHandler):
+    def get(self):
+        self.write(json.dumps(PersistenceService.stats()))
+
+
+class MachineSerialStatsHandler(BaseHandler):
+    def get(self):
+        stats = Machine.link_stats.to_dict()
+        stats["esp_log"] = Machine.esp_log.stats.to_dict()
+        if Machine.serial_reader is not None:
+            stats["framer"] = Machine.serial_reader.framer.stats.to_dict()
+        if Machine.telemetry is not None:
+            stats["telemetry"] = {
+                "mode": Machine.telemetry.mode,
+                "rate_hz": Machine.telemetry_rate_hz,
+            }
+        self.write(json.dumps(stats))
+
+
+class MachineCrashesHandler(BaseHandler):
+    def get(self):
+        crashes = [crash.to_dict() for crash in Machine.crash_detector.crashes]
+        self.write(json.dumps(crashes))
+
+
 API.register_handler(APIVersion.V1, r"/machine", MachineInfoHandler)
 API.register_handler(APIVersion.V1, r"/machine/backlight", MachineBacklightController)
 API.register_handler(APIVersion.V1, r"/machine/factory_reset", MachineResetHandler)
 API.register_handler(APIVersion.V1, r"/machine/OS_update_status", UpdateOSStatus)
 API.register_handler(APIVersion.V1, r"/machine/time", MachineTimeHandler)
+API.register_handler(APIVersion.V1, r"/machine/bus", MachineBusStatsHandler)
+API.register_handler(APIVersion.V1, r"/machine/persistence", MachinePersistenceStatsHandler)
+API.register_handler(APIVersion.V1, r"/machine/serial/stats", MachineSerialStatsHandler)
+API.register_handler(APIVersion.V1, r"/machine/crashes", MachineCrashesHandler)
@@ -85,6 +85,8 @@ def run():
     from log import MeticulousLogger
     from backend import main as backend_main
     from shot_manager import ShotManager
+    from shot_database import ShotDataBase
+    from history_rebuild import HistoryRebuild
 
     # Add ignored errors to sentry now that the import suceeded
     client = sentry_sdk.get_client()
@@ -93,14 +95,21 @@ def run():
     logger = MeticulousLogger.getLogger(__name__)
 
     try:
+        # Journal recovery and the summary backfill need the migrated schema
+        database_ready = False
         try:
-            ShotManager.init()
+            ShotDataBase.init()
+            update_db_migrations()
+            database_ready = True
         except Exception as e:
-            logger.error("Failed to initialize ShotManager", exc_info=e)
+            logger.error("Failed to initialize or migrate the database", exc_info=e)
         try:
-            update_db_migrations()
+            ShotManager.init(database_ready)
         except Exception as e:
-            logger.error("Failed to run database migrations", exc_info=e)
+            logger.error("Failed to initialize ShotManager", exc_info=e)
+        if database_ready and ShotDataBase.recreated:
+            logger.warning("The history database was recreated, re-importing the shot files")
+            HistoryRebuild.start()
 
         backend_main()
     except Exception as e:
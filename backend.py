@@ -3,13 +3,13 @@ import socketio
 import tornado.log
 import tornado.web
 import tornado.ioloop
-from named_thread import NamedThread
 import time
 import json
 import os
 import os.path
 import pyprctl
 import asyncio
+import signal
 import sentry_sdk
 
 from esp_serial.data import ButtonEventData
@@ -25,7 +25,9 @@ from config import (
     DEVICE_IDENTIFIER,
     MACHINE_SERIAL_NUMBER,
     CONFIG_LOGGING,
+    CONFIG_USER,
     LOGGING_SENSOR_MESSAGES,
+    TELEMETRY_BROADCAST_RATE,
 )
 
 from machine import Machine
@@ -40,6 +42,8 @@ from api.emulation import register_emulation_handlers
 from api.web_ui import WEB_UI_HANDLER
 
 from log import MeticulousLogger
+from persistence import PersistenceService
+from runtime import Runtime
 
 from dbus_monitor import DBusMonitor
 
@@ -119,11 +123,7 @@ def calibrate(sid, data=True):
     Machine.write(str.encode(_input))
 
 
-send_data_thread = None
-
-
 async def live():
-    SAMPLE_TIME = 0.1
     elapsed_time = 0
     i = 0
     _time = time.time()
@@ -139,7 +139,15 @@ async def live():
             _time = time.time()
             Machine.action("info")
 
-        machine_status = {**Machine.data_sensors.to_sio()}
+        # Everything the ESP sent since the last broadcast is averaged so that
+        # broadcasting at a lower rate than the telemetry does not hide changes
+        telemetry = Machine.broadcast_telemetry.take()
+        if telemetry is not None:
+            shot_data, sensor_data = telemetry
+        else:
+            shot_data, sensor_data = Machine.data_sensors, Machine.sensor_sensors
+
+        machine_status = {**shot_data.to_sio()}
         # We can enrich the machines functionality from within the backend
         # as we know which profile was last loaded
         last_profile_entry = ProfileManager.get_last_profile()
@@ -164,27 +172,24 @@ async def live():
 
         await sio.emit("status", machine_status)
 
-        if Machine.sensor_sensors is not None:
-            await sio.emit("sensors", Machine.sensor_sensors.to_sio_sensors())
+        if sensor_data is not None:
+            await sio.emit("sensors", sensor_data.to_sio_sensors())
+            Machine.link_stats.record_emit()
 
-        await sio.sleep(SAMPLE_TIME)
+        # Broadcasting faster than the ESP sends telemetry would only repeat the same values
+        broadcast_rate = min(
+            MeticulousConfig[CONFIG_USER][TELEMETRY_BROADCAST_RATE], Machine.telemetry_rate_hz
+        )
+        await sio.sleep(1.0 / broadcast_rate if broadcast_rate > 0 else 0.1)
         i = i + 1
 
 
-def send_data_loop():
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
-    loop.run_until_complete(send_data())
-    loop.close()
-
-
 async def send_data():  # noqa: C901
     noti = Notification("", ["Ok", "Not okay"])
     while True:
         print("> ", end="")
         try:
-            _input = input()
+            _input = await Runtime.run_blocking(input)
         except EOFError:
             logger.warning("no STDIN attached, not listening to commands!")
             break
@@ -229,7 +234,7 @@ async def send_data():  # noqa: C901
             Machine.write(str.encode(_input))
 
         elif _input.startswith("update"):
-            Machine.startUpdate()
+            await Runtime.run_blocking(Machine.startUpdate)
 
         elif _input.startswith("notification"):
             notification = _input[12:]
@@ -264,10 +269,11 @@ async def send_data():  # noqa: C901
 
 
 def main():
-    global send_data_thread
     parse_command_line()
 
     pyprctl.set_name("Main")
+    # Everything asynchronous runs on the loop tornado is started on below
+    Runtime.init(tornado.ioloop.IOLoop.current().asyncio_loop)
 
     DBusMonitor.init()
     HostnameManager.init()
@@ -297,8 +303,7 @@ def main():
     USBManager.init()
     DBusMonitor.enableUSBTest()
 
-    send_data_thread = NamedThread("SendSocketIO", target=send_data_loop)
-    send_data_thread.start()
+    Runtime.spawn(send_data(), "command-line")
 
     GATTServer.getServer().start()
 
@@ -334,4 +339,8 @@ def main():
     sio.start_background_task(live)
 
     DiscImager.flash_if_required()
+    Runtime.loop().add_signal_handler(signal.SIGTERM, tornado.ioloop.IOLoop.current().stop)
     tornado.ioloop.IOLoop.current().start()
+
+    # Shots and debug shots still queued are written before exiting
+    PersistenceService.shutdown()
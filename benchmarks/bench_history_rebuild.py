@@ -0,0 +1,121 @@
+"""Times rebuilding the history database from shot files.
+
+Synthetic shot files (2000 of 600 datapoints by default) are written once, then
+imported one shot per transaction through `insert_history` the way shots are
+saved, and through `HistoryRebuild` with batches and 0 to N worker processes.
+
+    python benchmarks/bench_history_rebuild.py [--shots N] [--points N] [--workers N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("CONFIG_PATH", "/tmp/meticulous-bench/config")
+os.environ.setdefault("LOG_PATH", "/tmp/meticulous-bench/logs")
+
+backend_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_root not in sys.path:
+    sys.path.insert(0, backend_root)
+
+import shot_database  # noqa: E402
+from database_models import metadata  # noqa: E402
+from history_rebuild import HistoryRebuild, _read_shot, shot_files  # noqa: E402
+from shot_database import ShotDataBase  # noqa: E402
+from shot_file import write_json_zst  # noqa: E402
+
+STAGES = "preinfusion soak bloom ramp extraction decline hold".split()
+
+
+def write_shots(shot_path: Path, shots: int, points: int, seed: int = 7):
+    rng = random.Random(seed)
+    profiles = [
+        {
+            "id": f"profile-{i}",
+            "author": "bench",
+            "author_id": "bench",
+            "display": {},
+            "final_weight": 36,
+            "name": f"Profile {i}",
+            "temperature": 92,
+            "stages": [{"key": f"s{j}", "name": s} for j, s in enumerate(STAGES)],
+        }
+        for i in range(20)
+    ]
+    start = 1_700_000_000
+    for i in range(shots):
+        profile = rng.choice(profiles)
+        data = [
+            {
+                "shot": {"pressure": rng.uniform(0, 9), "flow": 2.0, "weight": t / 10},
+                "sensors": {"external_1": 90.0},
+                "time": t * 100,
+                "status": "brewing",
+            }
+            for t in range(points)
+        ]
+        shot = {
+            "id": f"shot-{i}",
+            "time": start + i * 600,
+            "profile_name": profile["name"],
+            "profile": profile,
+            "data": data,
+        }
+        write_json_zst(shot, shot_path / f"{i // 100:04d}" / f"{i:06d}.shot.json.zst")
+
+
+def open_database(path: Path):
+    if path.exists():
+        path.unlink()
+    shot_database.DATABASE_URL = f"sqlite:///{path}"
+    shot_database.ABSOLUTE_DATABASE_FILE = path
+    shot_database.HISTORY_PATH = str(path.parent)
+    for name in list(metadata.tables):
+        if name.endswith("_fts"):
+            metadata.remove(metadata.tables[name])
+    ShotDataBase.init()
+    metadata.create_all(ShotDataBase.engine)
+
+
+def one_by_one(shot_path: Path):
+    for file_entry in shot_files(shot_path):
+        entry, summary, _error = _read_shot(shot_path, file_entry)
+        ShotDataBase.insert_history(entry, summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shots", type=int, default=2000)
+    parser.add_argument("--points", type=int, default=600)
+    parser.add_argument("--workers", type=int, default=HistoryRebuild.WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        shot_path = Path(directory) / "shots"
+        database = Path(directory) / "history.sqlite"
+        start = time.perf_counter()
+        write_shots(shot_path, args.shots, args.points)
+        print(f"wrote {args.shots} shots in {time.perf_counter() - start:.1f} s")
+
+        open_database(database)
+        start = time.perf_counter()
+        one_by_one(shot_path)
+        elapsed = time.perf_counter() - start
+        print(f"{'one by one':16} {elapsed:7.2f} s {args.shots / elapsed:8.0f} shots/s")
+
+        for workers in sorted({0, args.workers}):
+            open_database(database)
+            start = time.perf_counter()
+            status = HistoryRebuild.run(shot_path, workers=workers)
+            elapsed = time.perf_counter() - start
+            assert status["done"] == args.shots, status
+            label = f"rebuild {workers} workers"
+            print(f"{label:16} {elapsed:7.2f} s {args.shots / elapsed:8.0f} shots/s")
+
+
+if __name__ == "__main__":
+    main()
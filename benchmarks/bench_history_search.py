@@ -0,0 +1,156 @@
+"""Compares the LIKE scans history searches used to do with the FTS5 MATCH search.
+
+A synthetic history is built once (50k shots of a few hundred profiles by default)
+and every query is timed through the old join / DISTINCT / LIKE statements and
+through `ShotDataBase`, for a page of search results and for the autocompletion.
+
+    python benchmarks/bench_history_search.py [--shots N] [--profiles N] [--database PATH]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+os.environ.setdefault("CONFIG_PATH", "/tmp/meticulous-bench/config")
+os.environ.setdefault("LOG_PATH", "/tmp/meticulous-bench/logs")
+
+backend_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_root not in sys.path:
+    sys.path.insert(0, backend_root)
+
+from sqlalchemy import insert, text  # noqa: E402
+
+import shot_database  # noqa: E402
+from database_models import history, metadata  # noqa: E402
+from shot_database import SearchParams, ShotDataBase  # noqa: E402
+
+WORDS = (
+    "espresso lungo ristretto bloom turbo slayer londinium classic allongé crema "
+    "blooming sweet fruity chocolate gentle soup filter italian light dark adaptive"
+).split()
+STAGES = "preinfusion soak bloom ramp extraction decline hold pressure flow".split()
+QUERIES = ("espresso", "bloom", "esp cre", "ressi", "tur", "zzz")
+
+LEGACY_SEARCH = """
+SELECT DISTINCT history.id, history.uuid, history.file, history.time, profile.*
+FROM history JOIN profile ON history.profile_key = profile.key
+LEFT OUTER JOIN profile_fts ON profile.key = profile_fts.profile_key
+LEFT OUTER JOIN stage_fts ON profile.key = stage_fts.profile_key
+WHERE profile_fts.name LIKE :q OR stage_fts.stage_name LIKE :q
+ORDER BY history.time DESC, history.id DESC LIMIT 20
+"""
+LEGACY_AUTOCOMPLETE = (
+    "SELECT DISTINCT name FROM profile_fts WHERE name LIKE :q",
+    "SELECT DISTINCT profile_name, stage_name FROM stage_fts WHERE stage_name LIKE :q",
+)
+
+
+def open_database(path: Path):
+    url = f"sqlite:///{path}"
+    shot_database.DATABASE_URL = url
+    shot_database.ABSOLUTE_DATABASE_FILE = path
+    shot_database.HISTORY_PATH = str(path.parent)
+    ShotDataBase.init()
+    metadata.create_all(ShotDataBase.engine)
+
+
+def build(shots: int, profiles: int, seed: int = 7):
+    rng = random.Random(seed)
+    keys = []
+    for i in range(profiles):
+        name = " ".join(rng.sample(WORDS, rng.randint(1, 3))).title()
+        stages = rng.sample(STAGES, rng.randint(3, 6))
+        profile = {
+            "id": f"profile-{i}",
+            "author": "bench",
+            "author_id": "bench",
+            "display": {},
+            "final_weight": 36,
+            "name": f"{name} {i}",
+            "temperature": 92,
+            "stages": [{"key": f"s{j}", "name": s.title()} for j, s in enumerate(stages)],
+        }
+        keys.append((ShotDataBase.insert_profile(profile), profile))
+
+    start = 1_700_000_000
+    rows = []
+    for i in range(shots):
+        key, profile = rng.choice(keys)
+        rows.append(
+            {
+                "uuid": f"shot-{i}",
+                "file": f"{i}.shot.json.zst",
+                "time": datetime.fromtimestamp(start + i * 600, timezone.utc),
+                "profile_name": profile["name"],
+                "profile_id": profile["id"],
+                "profile_key": key,
+            }
+        )
+    with ShotDataBase.engine.begin() as connection:
+        connection.execute(insert(history), rows)
+
+
+def timed(func, rounds: int) -> float:
+    func()
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def legacy_search(query: str):
+    with ShotDataBase.engine.connect() as connection:
+        return connection.execute(text(LEGACY_SEARCH), {"q": f"%{query}%"}).fetchall()
+
+
+def legacy_autocomplete(query: str):
+    with ShotDataBase.engine.connect() as connection:
+        return [
+            connection.execute(text(statement), {"q": f"%{query}%"}).fetchall()
+            for statement in LEGACY_AUTOCOMPLETE
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shots", type=int, default=50_000)
+    parser.add_argument("--profiles", type=int, default=400)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--database", help="history database to build or reuse")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(args.database or Path(directory) / "history.sqlite")
+        exists = path.exists()
+        open_database(path)
+        if not exists:
+            start = time.perf_counter()
+            build(args.shots, args.profiles)
+            print(f"built {args.shots} shots in {time.perf_counter() - start:.1f} s")
+
+        print(
+            f"{'query':12} {'search LIKE':>12} {'search FTS':>11} {'auto LIKE':>10} {'auto FTS':>9}"
+        )
+        for query in QUERIES:
+            params = SearchParams(query=query)
+            results = [
+                timed(lambda: legacy_search(query), args.rounds),
+                timed(lambda: ShotDataBase.search_history_page(params), args.rounds),
+                timed(lambda: legacy_autocomplete(query), args.rounds),
+                timed(lambda: ShotDataBase.autocomplete_profile_name(query), args.rounds),
+            ]
+            print(
+                f"{query:12} {results[0]:12.2f} {results[1]:11.2f} {results[2]:10.2f} {results[3]:9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
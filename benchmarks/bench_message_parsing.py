@@ -0,0 +1,71 @@
+"""Replays the emulated espresso shot through the ESP message parsers.
+
+Compares the handwritten `split(",")` + `from_args` path that `Machine._read_data`
+used to take with the schema driven `MessageRegistry.parse_line`.
+
+    python benchmarks/bench_message_parsing.py [--rounds N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("CONFIG_PATH", "/tmp/meticulous-bench/config")
+os.environ.setdefault("LOG_PATH", "/tmp/meticulous-bench/logs")
+
+backend_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_root not in sys.path:
+    sys.path.insert(0, backend_root)
+
+from esp_serial.connection.emulation_data import EmulationData  # noqa: E402
+from esp_serial.data import SensorData, ShotData  # noqa: E402
+from esp_serial.message_schema import MessageRegistry  # noqa: E402
+
+
+def legacy_parse(line: str):
+    data_str_sensors = line.split(",")
+    match data_str_sensors:
+        case ["Data", *args]:
+            return ShotData.from_args(args)
+        case ["Sensors", *args]:
+            if len(args) == 1:
+                return SensorData.from_color_coded_args(args[0])
+            return SensorData.from_args(args)
+    return None
+
+
+def schema_parse(line: str):
+    return MessageRegistry.parse_line(line)
+
+
+def run(parser, lines: list[str], rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            parser(line)
+    elapsed = time.perf_counter() - start
+    return len(lines) * rounds / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    EmulationData.init()
+    lines = EmulationData.ESPRESSO_DATA
+    print(f"{len(lines)} lines per round, {args.rounds} rounds")
+
+    # Warm up both paths before measuring
+    run(legacy_parse, lines, 1)
+    run(schema_parse, lines, 1)
+
+    before = run(legacy_parse, lines, args.rounds)
+    after = run(schema_parse, lines, args.rounds)
+    print(f"legacy from_args: {before:12.0f} lines/s")
+    print(f"schema registry:  {after:12.0f} lines/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Replays a raw serial capture through the framing and parsing of `Machine._read_data`.
+
+Without a capture one is generated from the emulated espresso shot, with the lines
+chunked the way the kernel hands them out on the machine.
+
+    python benchmarks/bench_serial_replay.py [--capture PATH] [--rounds N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("CONFIG_PATH", "/tmp/meticulous-bench/config")
+os.environ.setdefault("LOG_PATH", "/tmp/meticulous-bench/logs")
+
+backend_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_root not in sys.path:
+    sys.path.insert(0, backend_root)
+
+from esp_serial.binary_protocol import BinaryFrame, decode_frame  # noqa: E402
+from esp_serial.connection.emulation_data import EmulationData  # noqa: E402
+from esp_serial.line_framer import LineFramer  # noqa: E402
+from esp_serial.message_schema import MessageRegistry  # noqa: E402
+from esp_serial.raw_capture import RawCapture, RawCaptureWriter, capture_files  # noqa: E402
+
+# Data and Sensors usually arrive together in one read
+LINES_PER_CHUNK = 2
+
+
+def generate_capture(directory: str):
+    writer = RawCaptureWriter(directory)
+    lines = [line.strip(" \t\r\n") + "\r\n" for line in EmulationData.ESPRESSO_DATA]
+    lines = [line for line in lines if line != "\r\n"]
+    for i in range(0, len(lines), LINES_PER_CHUNK):
+        writer.write("".join(lines[i : i + LINES_PER_CHUNK]).encode())
+    writer.close()
+    return capture_files(directory)
+
+
+def replay(files, rounds: int):
+    chunks = 0
+    nbytes = 0
+    lines = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        framer = LineFramer()
+        for path in files:
+            with RawCapture(path) as capture:
+                for _timestamp, chunk in capture.records():
+                    chunks += 1
+                    nbytes += len(chunk)
+                    for item in framer.feed(chunk):
+                        lines += 1
+                        if type(item) is BinaryFrame:
+                            decode_frame(item)
+                        else:
+                            MessageRegistry.parse_line(item.decode("utf-8").strip("\r\n"))
+    elapsed = time.perf_counter() - start
+    return chunks / elapsed, lines / elapsed, nbytes / elapsed / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--capture", help="capture file or directory of captures")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.capture:
+            files = capture_files(args.capture)
+        else:
+            EmulationData.init()
+            files = generate_capture(directory)
+        print(f"Replaying {len(files)} capture file(s), {args.rounds} rounds")
+
+        replay(files, 1)
+        chunks, lines, megabytes = replay(files, args.rounds)
+        print(f"{chunks:12.0f} chunks/s {lines:12.0f} lines/s {megabytes:8.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Compares writing shot files through the zstd CLI with the streaming writer.
+
+Every shot is written by both paths, each in a fresh process, and the wall time and
+the peak RSS on top of the loaded shot are reported. The RSS of the CLI path includes
+the zstd child process. Without shot files a shot is generated from synthetic ticks.
+
+    python benchmarks/bench_shot_file.py [--shots PATH] [--limit N] [--rounds N]
+"""
+
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("CONFIG_PATH", "/tmp/meticulous-bench/config")
+os.environ.setdefault("LOG_PATH", "/tmp/meticulous-bench/logs")
+
+backend_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_root not in sys.path:
+    sys.path.insert(0, backend_root)
+
+from esp_serial.data import SensorData, ShotData  # noqa: E402
+from shot_buffer import ShotBuffer  # noqa: E402
+from shot_file import read_json_zst, write_json_zst  # noqa: E402
+
+METHODS = ("cli", "stream")
+
+
+def generate_shot(path: Path, seconds: int = 60, rate: int = 10):
+    buffer = ShotBuffer()
+    for i in range(seconds * rate):
+        t = i / rate
+        buffer.append(
+            ShotData(
+                pressure=9 * math.sin(t / 20),
+                flow=2 + math.cos(t),
+                weight=t * 0.6,
+                status="brewing",
+                time=i * 100,
+                profile_time=i * 100,
+                main_controller_kind="Pressure",
+                main_setpoint=9.0,
+                aux_controller_kind="Flow",
+                aux_setpoint=4.0,
+                gravimetric_flow=0.6,
+            )
+        )
+        buffer.attach_sensors(SensorData(tube=90 + t / 10, motor_position=t, bar_up=92.5))
+    write_json_zst(
+        {"time": time.time(), "profile_name": "bench", "data": buffer.to_list()}, path
+    )
+    return [path]
+
+
+def write_cli(data, path: Path):
+    json_data = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    subprocess.run(
+        ["zstd", "-10", "-f", "-q", "-o", str(path)],
+        input=json_data,
+        capture_output=True,
+        check=True,
+    )
+
+
+def worker(method: str, shot_path: str, rounds: int):
+    data = read_json_zst(shot_path)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as directory:
+        target = Path(directory) / "shot.json.zst"
+        start = time.perf_counter()
+        for _ in range(rounds):
+            if method == "cli":
+                write_cli(data, target)
+            else:
+                write_json_zst(data, target)
+        elapsed = (time.perf_counter() - start) / rounds
+        size = target.stat().st_size
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(
+        json.dumps({"ms": elapsed * 1000, "rss_kb": peak - baseline + children, "size": size})
+    )
+
+
+def measure(method: str, shot_path: Path, rounds: int):
+    result = subprocess.run(
+        [sys.executable, __file__, "--worker", method, "--shots", str(shot_path)]
+        + ["--rounds", str(rounds)],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shots", help="shot file or directory of shot files")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--worker", choices=METHODS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.shots, args.rounds)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.shots:
+            shots = Path(args.shots)
+            files = sorted(shots.rglob("*.json.zst")) if shots.is_dir() else [shots]
+            files = files[: args.limit]
+        else:
+            files = generate_shot(Path(directory) / "generated.shot.json.zst")
+
+        print(f"{'file':40} {'method':8} {'ms':>8} {'peak RSS KiB':>13} {'bytes':>9}")
+        for path in files:
+            for method in METHODS:
+                result = measure(method, path, args.rounds)
+                print(
+                    f"{path.name[-40:]:40} {method:8} {result['ms']:8.1f}"
+                    f" {result['rss_kb']:13d} {result['size']:9d}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Replays the emulated espresso shot through the ShotStateMachine.
+
+The ticks are parsed once up front and fed with a simulated clock, so only the
+state machine itself is measured.
+
+    python benchmarks/bench_shot_state_machine.py [--rounds N]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+os.environ.setdefault("CONFIG_PATH", "/tmp/meticulous-bench/config")
+os.environ.setdefault("LOG_PATH", "/tmp/meticulous-bench/logs")
+
+backend_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_root not in sys.path:
+    sys.path.insert(0, backend_root)
+
+from dataclasses import replace  # noqa: E402
+
+from esp_serial.connection.emulation_data import EmulationData  # noqa: E402
+from esp_serial.message_schema import MessageRegistry  # noqa: E402
+from shot_state_machine import ShotStateMachine  # noqa: E402
+
+# The emulated ESP sends a Data message every 150ms
+TICK_INTERVAL = 0.15
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    EmulationData.init()
+    ticks = []
+    for line in EmulationData.ESPRESSO_DATA:
+        parsed = MessageRegistry.parse_line(line.strip(" \t\r\n"))
+        if parsed is not None and parsed[0] == "Data":
+            ticks.append(parsed[1])
+    print(f"{len(ticks)} ticks per round, {args.rounds} rounds")
+
+    # Shot start / end are logged, which is not what is measured here
+    logging.getLogger("shot_state_machine").setLevel(logging.WARNING)
+    clock = SimulatedClock()
+    state = ShotStateMachine(clock=clock)
+    rounds = [[replace(data) for data in ticks] for _ in range(args.rounds)]
+
+    start = time.perf_counter()
+    for round_ticks in rounds:
+        for data in round_ticks:
+            clock.now += TICK_INTERVAL
+            state.feed(data, True)
+    elapsed = time.perf_counter() - start
+
+    total = len(ticks) * args.rounds
+    print(f"{total / elapsed:12.0f} ticks/s {elapsed / total * 1e6:8.2f} us/tick")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,3 @@
-import asyncio
 import os
 import random
 import string
@@ -12,6 +11,7 @@ import copy
 from mergedeep import merge
 
 from log import MeticulousLogger
+from runtime import Runtime
 
 from manufacturing import CONFIG_MANUFACTURING, Default_manufacturing_config
 
@@ -25,7 +25,12 @@ DATABASE_FILE = "history.sqlite"
 ABSOLUTE_DATABASE_FILE = Path(HISTORY_PATH).joinpath(DATABASE_FILE).resolve()
 DATABASE_URL = f"sqlite:///{ABSOLUTE_DATABASE_FILE}"
 SHOT_PATH = Path(HISTORY_PATH).joinpath("shots")
+SHOT_JOURNAL_PATH = Path(HISTORY_PATH).joinpath("journal")
+ZSTD_DICTIONARY_PATH = Path(HISTORY_PATH).joinpath("zstd-dictionaries")
 DEBUG_HISTORY_PATH = os.getenv("DEBUG_HISTORY_PATH", "/meticulous-user/history/debug")
+RAW_SERIAL_CAPTURE_PATH = os.getenv(
+    "RAW_SERIAL_CAPTURE_PATH", "/meticulous-user/history/raw-serial"
+)
 
 # Config Compontents
 CONFIG_LOGGING = "logging"
@@ -107,6 +112,46 @@ TELEMETRY_SERVICE_DEFAULT_ENABLED = True
 DISALLOW_FIRMWARE_FLASHING = "disallow_firmware_flashing"
 DISALLOW_FIRMWARE_FLASHING_DEFAULT = False
 
+# Ask ESP firmwares that support it to send telemetry as binary frames instead of CSV
+ESP_BINARY_TELEMETRY = "esp_binary_telemetry"
+ESP_BINARY_TELEMETRY_DEFAULT = True
+
+# Telemetry rate requested from ESP firmwares that support it, in Hz. Consumers which
+# can not keep up get the telemetry decimated to their own rate
+TELEMETRY_RATE = "telemetry_rate_hz"
+TELEMETRY_RATE_DEFAULT = 10
+TELEMETRY_SHOT_RATE = "telemetry_shot_rate_hz"
+TELEMETRY_SHOT_RATE_DEFAULT = 10
+TELEMETRY_BROADCAST_RATE = "telemetry_broadcast_rate_hz"
+TELEMETRY_BROADCAST_RATE_DEFAULT = 10
+# "average" or "minmax", see esp_serial/decimation.py
+TELEMETRY_DECIMATION = "telemetry_decimation"
+TELEMETRY_DECIMATION_DEFAULT = "average"
+
+# Record everything read from the ESP to RAW_SERIAL_CAPTURE_PATH for later replay
+# (BACKEND=REPLAY). Files rotate at the given size, only the newest ones are kept
+RAW_SERIAL_CAPTURE = "raw_serial_capture"
+RAW_SERIAL_CAPTURE_DEFAULT = False
+RAW_SERIAL_CAPTURE_FILE_SIZE_MB = "raw_serial_capture_file_size_mb"
+RAW_SERIAL_CAPTURE_FILE_SIZE_MB_DEFAULT = 16
+RAW_SERIAL_CAPTURE_FILES = "raw_serial_capture_files"
+RAW_SERIAL_CAPTURE_FILES_DEFAULT = 4
+
+# Journal the shot in flight to SHOT_JOURNAL_PATH, so it can be recovered after a crash
+SHOT_JOURNAL = "shot_journal"
+SHOT_JOURNAL_DEFAULT = True
+
+# Compress shot files with a zstd dictionary trained on the existing ones
+SHOT_ZSTD_DICTIONARY = "shot_zstd_dictionary"
+SHOT_ZSTD_DICTIONARY_DEFAULT = False
+
+# "json" writes shot files as .shot.json.zst, "v2" in the columnar format of
+# shot_format_v2.py. Both formats are always read
+SHOT_FILE_FORMAT = "shot_file_format"
+SHOT_FILE_FORMAT_JSON = "json"
+SHOT_FILE_FORMAT_V2 = "v2"
+SHOT_FILE_FORMAT_DEFAULT = SHOT_FILE_FORMAT_JSON
+
 # Hidden UI features
 DISABLE_UI_FEATURES = "disable_ui_features"
 DISABLE_UI_FEATURES_DEFAULT = False
@@ -224,6 +269,17 @@ DefaultConfiguration_V1 = {
     CONFIG_USER: {
         SOUNDS_ENABLED: SOUNDS_DEFAULT_ENABLED,
         DISALLOW_FIRMWARE_FLASHING: DISALLOW_FIRMWARE_FLASHING_DEFAULT,
+        ESP_BINARY_TELEMETRY: ESP_BINARY_TELEMETRY_DEFAULT,
+        TELEMETRY_RATE: TELEMETRY_RATE_DEFAULT,
+        TELEMETRY_SHOT_RATE: TELEMETRY_SHOT_RATE_DEFAULT,
+        TELEMETRY_BROADCAST_RATE: TELEMETRY_BROADCAST_RATE_DEFAULT,
+        TELEMETRY_DECIMATION: TELEMETRY_DECIMATION_DEFAULT,
+        RAW_SERIAL_CAPTURE: RAW_SERIAL_CAPTURE_DEFAULT,
+        RAW_SERIAL_CAPTURE_FILE_SIZE_MB: RAW_SERIAL_CAPTURE_FILE_SIZE_MB_DEFAULT,
+        RAW_SERIAL_CAPTURE_FILES: RAW_SERIAL_CAPTURE_FILES_DEFAULT,
+        SHOT_JOURNAL: SHOT_JOURNAL_DEFAULT,
+        SHOT_ZSTD_DICTIONARY: SHOT_ZSTD_DICTIONARY_DEFAULT,
+        SHOT_FILE_FORMAT: SHOT_FILE_FORMAT_DEFAULT,
         DISABLE_UI_FEATURES: DISABLE_UI_FEATURES_DEFAULT,
         DEBUG_SHOT_DATA_RETENTION: DEBUG_SHOT_DATA_RETENTION_DEFAULT,
         PROFILE_AUTO_START: PROFILE_AUTO_START_DEFAULT,
@@ -360,26 +416,10 @@ class MeticulousConfigDict(dict):
 
         if self.__sio:
 
-            # when running in an executor asyncio.get_event_loop() might fail, as there might
-            # not be a loop in the thread created by asyncio
-            try:
-                loop = (
-                    asyncio.get_event_loop()
-                    if asyncio.get_event_loop().is_running()
-                    else asyncio.new_event_loop()
-                )
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-
-            asyncio.set_event_loop(loop)
-
             async def sendSettingsNotification():
                 await self.__sio.emit("settings", {})
 
-            if not loop.is_running():
-                loop.run_until_complete(sendSettingsNotification())
-            else:
-                asyncio.create_task(sendSettingsNotification())
+            Runtime.spawn(sendSettingsNotification(), "settings-notification")
 
 
 MeticulousConfig = MeticulousConfigDict(
@@ -9,6 +9,7 @@ from sqlalchemy import (
     ForeignKey,
     Float,
     Boolean,
+    Index,
 )
 
 metadata = MetaData(
@@ -38,6 +39,9 @@ profile = Table(
     Column("stages", JSON),
     Column("variables", JSON),
     Column("previous_authors", JSON),
+    # sha256 of the canonical JSON of the columns above, see profile_content_hash
+    Column("content_hash", Text),
+    Index("ix_profile_content_hash", "content_hash", unique=True),
 )
 
 history = Table(
@@ -51,6 +55,8 @@ history = Table(
     Column("profile_id", Text, nullable=False),
     Column("profile_key", Integer, ForeignKey("profile.key"), nullable=False),
     Column("debug_file", Text, nullable=True),
+    # History pages are fetched in (time, id) order, see ShotDataBase.search_history
+    Index("ix_history_time_id", "time", "id"),
 )
 
 shot_annotation = Table(
@@ -75,6 +81,27 @@ shot_rating = Table(
     Column("basic", Text, nullable=True),  # "like", "dislike", o null
 )
 
+# Precomputed per shot at ingest, so history lists don't need the shot files
+shot_summary = Table(
+    "shot_summary",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("history_id", Integer, ForeignKey("history.id"), nullable=False, unique=True),
+    Column("points", Integer, nullable=False),
+    Column("total_time", Float),
+    Column("extraction_time", Float),
+    Column("final_weight", Float),
+    Column("peak_pressure", Float),
+    Column("avg_pressure", Float),
+    Column("peak_flow", Float),
+    Column("avg_flow", Float),
+    Column("min_temperature", Float),
+    Column("max_temperature", Float),
+    Column("avg_temperature", Float),
+    Column("end_status", Text),
+    Column("preview", JSON),
+)
+
 bug_reports = Table(
     "bug_reports",
     metadata,
@@ -109,4 +136,16 @@ FTS_TABLES = {
     "stage_fts_content",
     "stage_fts_docsize",
     "stage_fts_config",
+    "profile_trigram_fts",
+    "profile_trigram_fts_data",
+    "profile_trigram_fts_idx",
+    "profile_trigram_fts_content",
+    "profile_trigram_fts_docsize",
+    "profile_trigram_fts_config",
+    "stage_trigram_fts",
+    "stage_trigram_fts_data",
+    "stage_trigram_fts_idx",
+    "stage_trigram_fts_content",
+    "stage_trigram_fts_docsize",
+    "stage_trigram_fts_config",
 }
@@ -0,0 +1,295 @@
+import math
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+
+from log import MeticulousLogger
+
+from .data import ESPInfo, SensorData, ShotData
+from .message_schema import SENSOR_DATA_SCHEMA, SHOT_DATA_SCHEMA
+
+logger = MeticulousLogger.getLogger(__name__)
+
+# Every binary frame on the link looks like this (little endian):
+#
+#   magic    2 bytes   0xAA 0x55, never the start of a CSV line
+#   type     1 byte    one of the FRAME_* constants below
+#   length   2 bytes   length of the payload
+#   payload  length bytes
+#   crc32    4 bytes   zlib.crc32 over type, length and payload
+#
+# Frames are interleaved with the regular CSV lines and are not newline terminated.
+FRAME_MAGIC = b"\xaa\x55"
+FRAME_HEADER = struct.Struct("<2sBH")
+FRAME_CRC = struct.Struct("<I")
+FRAME_OVERHEAD = FRAME_HEADER.size + FRAME_CRC.size
+MAX_PAYLOAD = 1024
+
+FRAME_SHOT_DATA = 0x01
+FRAME_SENSOR_DATA = 0x02
+
+# Capability announced in the ESPInfo message by firmwares which can send binary frames
+BINARY_TELEMETRY_CAPABILITY = "bin1"
+
+# Commands understood by firmwares announcing BINARY_TELEMETRY_CAPABILITY
+TELEMETRY_BINARY_COMMAND = "telemetry,binary\x03"
+TELEMETRY_CSV_COMMAND = "telemetry,csv\x03"
+
+# Capability of firmwares which can change how often they send telemetry
+TELEMETRY_RATE_CAPABILITY = "rate"
+# The ESP sends telemetry at this rate unless told otherwise
+DEFAULT_TELEMETRY_RATE = 10
+
+
+def telemetry_rate_command(rate_hz: int) -> str:
+    return f"telemetry,rate,{int(rate_hz)}\x03"
+
+
+# pressure, flow, weight, temperature, gravimetric_flow, main_setpoint, aux_setpoint,
+# flags, main controller, aux controller, status length, profile length
+_SHOT_DATA = struct.Struct("<7f5B")
+_SHOT_FLAG_STABLE_WEIGHT = 0x01
+_SHOT_FLAG_AUX_ACTIVE = 0x02
+
+# external_1 ... adc_3 (20 floats), water_status, motor_thermistor, weight_prediction
+_SENSOR_DATA = struct.Struct("<20fB2f")
+
+# Index on the wire of the controller kinds the ESP knows
+_CONTROLLER_KINDS = (None, "Flow", "Pressure", "Piston", "Power", "Temperature")
+
+# The ESP sends float32. Rounding gets rid of the float32 artifacts (9.1 -> 9.100000381)
+# that would otherwise end up in every shot file
+_DECIMALS = 4
+
+
+@dataclass(slots=True)
+class BinaryFrame:
+    frame_type: int
+    payload: bytes
+
+    def __len__(self):
+        # Size of the frame on the wire
+        return FRAME_OVERHEAD + len(self.payload)
+
+
+def encode_frame(frame_type: int, payload: bytes) -> bytes:
+    header = FRAME_HEADER.pack(FRAME_MAGIC, frame_type, len(payload))
+    crc = zlib.crc32(payload, zlib.crc32(header[2:]))
+    return header + payload + FRAME_CRC.pack(crc)
+
+
+def frame_length(buf, start: int, end: int):
+    """Inspects a frame starting with FRAME_MAGIC at `start`.
+
+    Returns the total length of the frame if it is complete and its checksum is valid,
+    0 if more bytes are needed and -1 if the bytes are not a valid frame.
+    """
+    if end - start < FRAME_HEADER.size:
+        return 0
+    _magic, _frame_type, length = FRAME_HEADER.unpack_from(buf, start)
+    if length > MAX_PAYLOAD:
+        return -1
+    total = FRAME_OVERHEAD + length
+    if end - start < total:
+        return 0
+    crc_start = start + FRAME_HEADER.size + length
+    (crc,) = FRAME_CRC.unpack_from(buf, crc_start)
+    if zlib.crc32(memoryview(buf)[start + 2 : crc_start]) != crc:
+        return -1
+    return total
+
+
+def _round(value: float):
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return value
+    return round(value, _DECIMALS)
+
+
+def _finite(value: float):
+    if not math.isfinite(value):
+        return 0
+    return round(value, _DECIMALS)
+
+
+def _controller_kind(index: int):
+    if index < len(_CONTROLLER_KINDS):
+        return _CONTROLLER_KINDS[index]
+    return None
+
+
+def _controller_index(kind: str):
+    try:
+        return _CONTROLLER_KINDS.index(kind)
+    except ValueError:
+        return 0
+
+
+def decode_shot_data(payload) -> ShotData:
+    (
+        pressure,
+        flow,
+        weight,
+        temperature,
+        gravimetric_flow,
+        main_setpoint,
+        aux_setpoint,
+        flags,
+        main_kind,
+        aux_kind,
+        status_length,
+        profile_length,
+    ) = _SHOT_DATA.unpack_from(payload)
+    offset = _SHOT_DATA.size
+    status = bytes(payload[offset : offset + status_length]).decode("utf-8")
+    offset += status_length
+    profile = bytes(payload[offset : offset + profile_length]).decode("utf-8")
+
+    data = ShotData(
+        pressure=_round(pressure),
+        flow=_round(flow),
+        weight=_round(weight),
+        stable_weight=bool(flags & _SHOT_FLAG_STABLE_WEIGHT),
+        temperature=_round(temperature),
+        status=status,
+        profile=profile,
+        main_controller_kind=_controller_kind(main_kind),
+        main_setpoint=_finite(main_setpoint),
+        aux_controller_kind=_controller_kind(aux_kind),
+        aux_setpoint=_finite(aux_setpoint),
+        is_aux_controller_active=bool(flags & _SHOT_FLAG_AUX_ACTIVE),
+        gravimetric_flow=_round(gravimetric_flow),
+    )
+    SHOT_DATA_SCHEMA.finalize(data)
+    return data
+
+
+def encode_shot_data(data: ShotData) -> bytes:
+    status = (data.status or "").encode("utf-8")
+    profile = (data.profile or "").encode("utf-8")
+    flags = 0
+    if data.stable_weight:
+        flags |= _SHOT_FLAG_STABLE_WEIGHT
+    if data.is_aux_controller_active:
+        flags |= _SHOT_FLAG_AUX_ACTIVE
+    return (
+        _SHOT_DATA.pack(
+            float(data.pressure),
+            float(data.flow),
+            float(data.weight),
+            float(data.temperature),
+            float(data.gravimetric_flow),
+            float(data.main_setpoint),
+            float(data.aux_setpoint),
+            flags,
+            _controller_index(data.main_controller_kind),
+            _controller_index(data.aux_controller_kind),
+            len(status),
+            len(profile),
+        )
+        + status
+        + profile
+    )
+
+
+def decode_sensor_data(payload) -> SensorData:
+    values = _SENSOR_DATA.unpack_from(payload)
+    return SensorData(
+        *[_finite(value) for value in values[:20]],
+        water_status=bool(values[20]),
+        motor_thermistor=_round(values[21]),
+        weight_prediction=_round(values[22]),
+    )
+
+
+def encode_sensor_data(sensors: SensorData) -> bytes:
+    return _SENSOR_DATA.pack(
+        *[float(getattr(sensors, name)) for name in sensors.__slots__[:20]],
+        1 if sensors.water_status else 0,
+        float(sensors.motor_thermistor),
+        float(sensors.weight_prediction),
+    )
+
+
+_DECODERS = {
+    FRAME_SHOT_DATA: (SHOT_DATA_SCHEMA.prefix, decode_shot_data),
+    FRAME_SENSOR_DATA: (SENSOR_DATA_SCHEMA.prefix, decode_sensor_data),
+}
+
+
+def decode_frame(frame: BinaryFrame):
+    """Decodes a frame into the same (prefix, record) tuple `MessageRegistry.parse_line`
+    returns for the CSV message. Returns None for frame types this backend does not know.
+    """
+    decoder = _DECODERS.get(frame.frame_type)
+    if decoder is None:
+        logger.warning(f"Unknown binary frame type {frame.frame_type}")
+        return None
+    prefix, decode = decoder
+    try:
+        return (prefix, decode(frame.payload))
+    except Exception as e:
+        logger.warning(f"Failed to decode binary {prefix} frame: {e}")
+        return (prefix, None)
+
+
+class TelemetryNegotiator:
+    """Decides which telemetry format to ask the ESP for.
+
+    Binary telemetry is only requested if the ESP announces the capability in its
+    ESPInfo. If the ESP keeps sending CSV telemetry after the request, it is assumed
+    to not support it after all and is told to continue with CSV.
+    """
+
+    CSV = "csv"
+    BINARY = "binary"
+
+    # How long to wait for the first binary frame after requesting binary telemetry
+    SWITCH_TIMEOUT = 2.0
+
+    def __init__(self, enabled: bool = True, clock=time.monotonic) -> None:
+        self.enabled = enabled
+        self._clock = clock
+        self.mode = TelemetryNegotiator.CSV
+        self.failed = False
+        self._requested_at = None
+
+    def reset(self):
+        """The ESP restarted and is back to CSV"""
+        self.mode = TelemetryNegotiator.CSV
+        self._requested_at = None
+
+    def on_info(self, info: ESPInfo):
+        if (
+            not self.enabled
+            or self.failed
+            or self.mode == TelemetryNegotiator.BINARY
+            or self._requested_at is not None
+            or not info.supports(BINARY_TELEMETRY_CAPABILITY)
+        ):
+            return None
+        logger.info("ESP supports binary telemetry, requesting it")
+        self._requested_at = self._clock()
+        return TELEMETRY_BINARY_COMMAND
+
+    def on_binary_telemetry(self):
+        if self.mode != TelemetryNegotiator.BINARY:
+            logger.info("ESP switched to binary telemetry")
+        self.mode = TelemetryNegotiator.BINARY
+        self._requested_at = None
+
+    def on_csv_telemetry(self):
+        if self.mode == TelemetryNegotiator.BINARY:
+            # The ESP restarted without us noticing or dropped back on its own
+            self.reset()
+            return None
+        if self._requested_at is None:
+            return None
+        if self._clock() - self._requested_at < TelemetryNegotiator.SWITCH_TIMEOUT:
+            return None
+        logger.warning("ESP did not switch to binary telemetry, staying with CSV")
+        self.failed = True
+        self._requested_at = None
+        return TELEMETRY_CSV_COMMAND
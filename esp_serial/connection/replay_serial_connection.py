@@ -0,0 +1,101 @@
+from .serial_connection import SerialConnection
+from unittest.mock import MagicMock
+from named_thread import NamedThread
+import time
+import os
+import pty
+import fcntl
+import select
+
+from ..raw_capture import RawCapture, capture_files
+from config import RAW_SERIAL_CAPTURE_PATH
+from log import MeticulousLogger
+
+logger = MeticulousLogger.getLogger(__name__)
+
+# Capture file or directory of capture files to play back
+REPLAY_PATH = os.getenv("REPLAY_PATH", RAW_SERIAL_CAPTURE_PATH)
+# Playback speed in percent of the original timing, 0 plays back as fast as possible
+REPLAY_SPEED = int(os.getenv("REPLAY_SPEED", "100"))
+REPLAY_LOOP = os.getenv("REPLAY_LOOP", "True").lower() in ("true", "1", "y")
+
+
+class ReplaySerialConnection(SerialConnection):
+    """Plays raw serial captures (see esp_serial/raw_capture.py) back into a pty.
+
+    Every captured chunk is written as one piece at its original offset, scaled by
+    `speed`, so the backend sees the same bytes in the same chunks as on the machine
+    the capture was taken on. Commands sent by the backend are read and discarded.
+    """
+
+    def __init__(self, path=REPLAY_PATH, speed: int = REPLAY_SPEED, loop=REPLAY_LOOP) -> None:
+        self.files = capture_files(path)
+        if not self.files:
+            raise RuntimeError(f"No raw serial captures found at {path}")
+
+        # Create virtual serial console (pty) for the backend to attach to
+        self.them, self.us = pty.openpty()
+
+        super().__init__(os.ttyname(self.us))
+        self.speed = speed / 100.0
+        self.loop = loop
+        self.chunks_replayed = 0
+        self.flasher = MagicMock()
+        self.replay_thread = NamedThread("ReplayData", target=self.replay)
+        self.replay_thread.start()
+
+    def _discard_commands(self):
+        try:
+            while os.read(self.them, 2048):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _write(self, chunk):
+        while len(chunk) > 0:
+            try:
+                written = os.write(self.them, chunk)
+                chunk = chunk[written:]
+            except BlockingIOError:
+                # The backend is not keeping up, wait until the pty drains
+                select.select([], [self.them], [], 0.1)
+                self._discard_commands()
+
+    def _replay_file(self, path):
+        with RawCapture(path) as capture:
+            logger.info(f"Replaying {path} at {self.speed * 100:.0f}% speed")
+            started = time.monotonic()
+            for timestamp, chunk in capture.records():
+                if self.speed > 0:
+                    delay = started + timestamp / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                self._discard_commands()
+                self._write(chunk)
+                self.chunks_replayed += 1
+
+    def replay(self):
+        logger.info("Setting replay pty to non-blocking")
+        flags = fcntl.fcntl(self.them, fcntl.F_GETFL)
+        flags = flags | os.O_NONBLOCK
+        fcntl.fcntl(self.them, fcntl.F_SETFL, flags)
+
+        logger.info("Replay thread started, sleeping 2 seconds")
+        time.sleep(2.0)
+        while True:
+            replayed = self.chunks_replayed
+            for path in self.files:
+                try:
+                    self._replay_file(path)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Failed to replay {path}: {e}")
+            if not self.loop or self.chunks_replayed == replayed:
+                break
+        logger.info(f"Replay finished after {self.chunks_replayed} chunks")
+
+    def reset(self, bootloader=False, sleep=0, ignored_bootloader_sleep=0):
+        logger.info("Replayed ESP32 cannot be reset")
+
+    def sendUpdate(self):
+        logger.info("Replayed ESP32 cannot be updated")
+        return None
@@ -0,0 +1,111 @@
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from log import MeticulousLogger
+
+logger = MeticulousLogger.getLogger(__name__)
+
+# One pass over a line finds either the boot banner the ESP prints after every reset
+# or the start of a crash report. The crash keywords are matched case insensitive.
+_SIGNATURES = re.compile(
+    r"(?P<boot>^rst:0x(?=.*boot:0x)(?=.* \(SPI_FAST_FLASH_BOOT\)))"
+    r"|(?P<crash>(?i:guru meditation error|backtrace|register dump))"
+)
+_BACKTRACE_FRAME = re.compile(r"(0x[0-9a-fA-F]{8}):0x[0-9a-fA-F]{8}")
+
+
+@dataclass
+class CrashRecord:
+    """A crash report of the ESP, collected from its first line until the next boot"""
+
+    timestamp: float
+    # First line of the report and the keyword it was recognized by
+    signature: str
+    kind: str
+    lines: list[str] = field(default_factory=list)
+    # Lines beyond CrashDetector.max_lines that were not kept
+    truncated: int = 0
+    # Program counters of the backtrace
+    backtrace: list[str] = field(default_factory=list)
+    # Boot banner printed after the crash, holds the reset reason
+    reset_reason: str = None
+
+    def text(self):
+        return "\n".join(self.lines)
+
+    def to_dict(self):
+        return {
+            "timestamp": self.timestamp,
+            "signature": self.signature,
+            "kind": self.kind,
+            "lines": list(self.lines),
+            "truncated": self.truncated,
+            "backtrace": list(self.backtrace),
+            "reset_reason": self.reset_reason,
+        }
+
+
+class CrashDetector:
+    """Watches the non telemetry lines of the ESP for crash reports and boots.
+
+    Only the lines of a crash report are kept, up to `max_lines` per report, and only
+    the latest `history` reports are remembered.
+    """
+
+    BOOT = "boot"
+    CRASH = "crash"
+
+    def __init__(self, max_lines: int = 64, history: int = 8, clock=time.time) -> None:
+        self.max_lines = max_lines
+        self.crashes: deque[CrashRecord] = deque(maxlen=history)
+        self._clock = clock
+        self._current: CrashRecord = None
+        self._reported: CrashRecord = None
+
+    @property
+    def collecting(self):
+        return self._current is not None
+
+    def feed(self, line: str):
+        """Inspects a line, returns BOOT or CRASH if it is a boot banner or the first
+        line of a crash report and None otherwise"""
+        match = _SIGNATURES.search(line)
+        if match is not None and match.lastgroup == "boot":
+            if self._current is not None:
+                self._current.reset_reason = line
+                self._current = None
+            return CrashDetector.BOOT
+
+        event = None
+        if match is not None and self._current is None:
+            self._current = CrashRecord(self._clock(), line, match.group("crash").lower())
+            self.crashes.append(self._current)
+            logger.warning(f"ESP crash detected: {line}")
+            event = CrashDetector.CRASH
+
+        if self._current is not None:
+            self._append(line)
+        return event
+
+    def _append(self, line: str):
+        record = self._current
+        if len(record.lines) >= self.max_lines:
+            record.truncated += 1
+            return
+        record.lines.append(line)
+        if "backtrace" in line.lower():
+            record.backtrace.extend(_BACKTRACE_FRAME.findall(line))
+
+    @property
+    def last_crash(self):
+        return self.crashes[-1] if self.crashes else None
+
+    def take_unreported(self):
+        """The latest crash if it was not handed out by this method before"""
+        crash = self.last_crash
+        if crash is None or crash is self._reported:
+            return None
+        self._reported = crash
+        return crash
@@ -29,7 +29,7 @@ def safe_float_with_nan(value):
         return "NaN"
 
 
-@dataclass
+@dataclass(slots=True)
 class SensorData:
     """Class respresenting the current state of all sensors"""
 
@@ -131,6 +131,9 @@ class SensorData:
         ]
         return args
 
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
     def to_sio_sensors(self):
         return {
             "t_ext_1": self.external_1,
@@ -174,6 +177,8 @@ class ESPInfo:
     scaleModule: str = ""
     partialRetraction: float = 45.0
     autoPurgeAfterShot: bool = False
+    # "|" separated list of optional features the firmware supports
+    capabilities: str = ""
 
     def from_args(args):
         espPinout = 0
@@ -221,6 +226,9 @@ class ESPInfo:
                 )
             else:
                 info = ESPInfo(args[0], espPinout, float(args[2]))
+
+            if len(args) >= 11:
+                info.capabilities = args[10]
         except Exception as e:
             logger.warning(f"Failed to parse ESPInfo: {args}", exc_info=e)
             return None
@@ -240,8 +248,13 @@ class ESPInfo:
             str(self.partialRetraction),
             "true" if self.autoPurgeAfterShot else "false",
         ]
+        if self.capabilities:
+            args.append(self.capabilities)
         return args
 
+    def supports(self, capability: str) -> bool:
+        return capability in self.capabilities.split("|")
+
     def to_sio(self):
         """Convert ESPInfo to a dictionary for socket.io communication."""
         return {
@@ -294,7 +307,7 @@ class ControlTypes:
     POWER = "Power"
 
 
-@dataclass
+@dataclass(slots=True)
 class ShotData:
     """Class respresenting a Datapoint of the machine in time, used to track a shot"""
 
@@ -327,6 +340,17 @@ class ShotData:
             profile_time=profile_time,
         )
 
+    def stamp_time_and_state(self, shot_start_time, is_brewing, profile_time=-1):
+        """Same as clone_with_time_and_state but updates this record in place.
+
+        Only use this on records nobody else holds a reference to yet, e.g. the one
+        just parsed from the ESP.
+        """
+        self.time = shot_start_time
+        self.is_extracting = is_brewing
+        self.profile_time = profile_time
+        return self
+
     def to_args(self):
         """Convert ShotData to a list of arguments for serial communication."""
         args = [
@@ -0,0 +1,144 @@
+import time
+from dataclasses import fields, replace
+
+from log import MeticulousLogger
+
+from .data import SensorData, ShotData
+
+logger = MeticulousLogger.getLogger(__name__)
+
+
+class DecimationMode:
+    # One sample per bucket holding the mean of every value
+    AVERAGE = "average"
+    # Two samples per bucket holding the minimum and maximum of every value, in the
+    # order they occured. Keeps short peaks visible at the cost of twice the samples
+    MINMAX = "minmax"
+
+
+def _numeric_fields(record_type: type):
+    # Only measurements are aggregated, everything else is taken from the latest sample
+    return tuple(field.name for field in fields(record_type) if field.type is float)
+
+
+_NUMERIC_FIELDS = {
+    ShotData: _numeric_fields(ShotData),
+    SensorData: _numeric_fields(SensorData),
+}
+
+
+def _values(records: list, name: str):
+    # Measurements the ESP could not take are sent as the string "NaN"
+    return [
+        value
+        for value in (getattr(record, name) for record in records)
+        if type(value) is float or type(value) is int
+    ]
+
+
+def average(records: list):
+    """Returns a copy of the last record with all measurements averaged over `records`"""
+    last = records[-1]
+    if len(records) == 1:
+        return last
+    averaged = {}
+    for name in _NUMERIC_FIELDS[type(last)]:
+        values = _values(records, name)
+        if values:
+            averaged[name] = sum(values) / len(values)
+    return replace(last, **averaged)
+
+
+def min_max(records: list):
+    """Returns two records holding the minimum and maximum of every measurement.
+
+    The first record carries whichever extreme of a measurement occured first, so
+    plotting both in order keeps the shape of the signal.
+    """
+    first, last = records[0], records[-1]
+    if len(records) <= 2:
+        return list(records)
+    earlier = {}
+    later = {}
+    for name in _NUMERIC_FIELDS[type(last)]:
+        values = [(getattr(record, name), index) for index, record in enumerate(records)]
+        values = [(value, index) for value, index in values if type(value) in (float, int)]
+        if not values:
+            continue
+        low = min(values)
+        high = max(values)
+        if low[1] <= high[1]:
+            earlier[name], later[name] = low[0], high[0]
+        else:
+            earlier[name], later[name] = high[0], low[0]
+    return [replace(first, **earlier), replace(last, **later)]
+
+
+class Decimator:
+    """Reduces a stream of samples to `rate_hz` by aggregating fixed time buckets.
+
+    A sample is a tuple of records (e.g. ShotData and SensorData received together)
+    which are aggregated field by field. Without a rate every sample is passed through.
+    """
+
+    def __init__(
+        self, rate_hz: float = None, mode: str = DecimationMode.AVERAGE, clock=time.monotonic
+    ) -> None:
+        self.period = 1.0 / rate_hz if rate_hz else None
+        self.mode = mode
+        self._clock = clock
+        self._bucket: list[tuple] = []
+        self._bucket_start = None
+
+    def add(self, *sample) -> list[tuple]:
+        """Adds a sample and returns the samples of the bucket it completed, if any"""
+        if self.period is None:
+            return [sample]
+
+        now = self._clock()
+        completed = []
+        if self._bucket_start is not None and now - self._bucket_start >= self.period:
+            completed = self.flush()
+        if self._bucket_start is None:
+            self._bucket_start = now
+        self._bucket.append(sample)
+        return completed
+
+    def flush(self) -> list[tuple]:
+        """Aggregates and returns the samples of the current bucket"""
+        bucket = self._bucket
+        self._bucket = []
+        self._bucket_start = None
+        if not bucket:
+            return []
+        if self.mode == DecimationMode.MINMAX:
+            columns = [min_max(list(records)) for records in zip(*bucket)]
+            return list(zip(*columns))
+        return [tuple(average(list(records)) for records in zip(*bucket))]
+
+
+class LatestAggregate:
+    """Collects samples from one thread and hands out their average to another.
+
+    Used for broadcasts, which are sent at their own pace: every `take()` returns the
+    average of everything added since the previous call.
+    """
+
+    def __init__(self) -> None:
+        self._samples: list[tuple] = []
+
+    def add(self, *sample):
+        self._samples.append(sample)
+
+    def take(self):
+        samples, self._samples = self._samples, []
+        if not samples:
+            return None
+        return tuple(average(list(records)) for records in zip(*samples))
+
+
+def decimation_rate(target_hz: float, telemetry_hz: float):
+    """Rate to decimate to, None if the consumer can take the full telemetry rate"""
+    if not target_hz or target_hz <= 0 or target_hz >= telemetry_hz:
+        return None
+    return target_hz
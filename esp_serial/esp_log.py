@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+
+import sentry_sdk
+
+from log import MeticulousLogger
+from runtime import Runtime
+
+logger = MeticulousLogger.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average with bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: int, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+@dataclass
+class EspLogStats:
+    received: int = 0
+    coalesced: int = 0
+    dropped: int = 0
+    forwarded: int = 0
+    sentry_captured: int = 0
+    sentry_suppressed: int = 0
+    errors: int = 0
+
+    def to_dict(self):
+        return {
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "forwarded": self.forwarded,
+            "sentry_captured": self.sentry_captured,
+            "sentry_suppressed": self.sentry_suppressed,
+            "errors": self.errors,
+        }
+
+
+@dataclass(slots=True)
+class _PendingLog:
+    log_data: list[str]
+    count: int = 1
+
+
+class EspLogForwarder:
+    """Forwards "Log" messages of the ESP to the backend log and to sentry.
+
+    Lines are collected and written out in batches every `FLUSH_INTERVAL` seconds.
+    Identical lines within a batch are written once together with how often they
+    repeated. Captures to sentry are limited per message with a token bucket, so a
+    firmware stuck in a loop can neither flood the log nor the sentry project.
+    """
+
+    FLUSH_INTERVAL = 0.25
+    # Distinct lines kept per batch, further lines are dropped until the next flush
+    MAX_PENDING = 128
+    # One capture per message and minute on average, after an initial burst
+    SENTRY_RATE = 1 / 60
+    SENTRY_BURST = 3
+    MAX_SENTRY_KEYS = 256
+
+    def __init__(self, sentry_client=None, clock=time.monotonic) -> None:
+        self.sentry_client = sentry_client
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, ...], _PendingLog] = {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self._task = None
+        self.stats = EspLogStats()
+
+    def start(self):
+        """Flushes periodically from a task on the shared loop, which must be running"""
+        if self._task is not None:
+            return
+        self._task = Runtime.spawn(self._run(), "esp-log")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(EspLogForwarder.FLUSH_INTERVAL)
+            # Writing the log and capturing to sentry may block
+            await Runtime.run_blocking(self.flush)
+
+    def submit(self, log_data: list[str]):
+        """Queues the arguments of a "Log" message, never blocks on logging or sentry"""
+        key = tuple(log_data)
+        with self._lock:
+            self.stats.received += 1
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.count += 1
+                self.stats.coalesced += 1
+            elif len(self._pending) >= EspLogForwarder.MAX_PENDING:
+                self.stats.dropped += 1
+            else:
+                self._pending[key] = _PendingLog(log_data)
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            batch = self._pending
+            self._pending = {}
+
+        for pending in batch.values():
+            try:
+                self._forward(pending.log_data, pending.count)
+                self.stats.forwarded += 1
+            except Exception as e:
+                self.stats.errors += 1
+                logger.error(
+                    f"Error '{e}' processing Log from ESP: 'Log,{','.join(pending.log_data)}'",
+                    exc_info=True,
+                )
+
+    def _allow_sentry(self, message: str):
+        now = self._clock()
+        bucket = self._buckets.get(message)
+        if bucket is None:
+            if len(self._buckets) >= EspLogForwarder.MAX_SENTRY_KEYS:
+                self._buckets.pop(next(iter(self._buckets)))
+            bucket = TokenBucket(EspLogForwarder.SENTRY_RATE, EspLogForwarder.SENTRY_BURST, now)
+            self._buckets[message] = bucket
+        if bucket.take(now):
+            self.stats.sentry_captured += 1
+            return True
+        self.stats.sentry_suppressed += 1
+        return False
+
+    @staticmethod
+    def _log_items(log_data: list[str]):
+        items: dict[str, str] = {}
+        for data_str in log_data[2:]:
+            # data in the form: <key>=<value>
+            data = data_str.split("=")
+            if len(data) < 2:
+                logger.warning(f"Error parsing ESP log item: {data_str}")
+                continue
+            items.setdefault(data[0], data[1])
+        return items
+
+    def _forward(self, log_data: list[str], count: int):
+        log_level = log_data[0].lower()
+        message = log_data[1]
+        full_message = ",".join(log_data[1:])
+        if count > 1:
+            full_message += f" (repeated {count} times)"
+
+        send_to_sentry = log_level == "error"
+        items_filtered = None
+        if len(log_data) > 2:
+            items = EspLogForwarder._log_items(log_data)
+            send_to_sentry = send_to_sentry or items.get("sentry", "false") == "true"
+            items_filtered = {k: v for k, v in items.items() if k != "sentry"}
+
+        if send_to_sentry and not self._allow_sentry(message):
+            # Still logged, but without reaching either sentry project
+            logger.warning(f"ESP {log_level} (sentry rate limited): {full_message}")
+            return
+
+        match log_level:
+            case "debug":
+                logger.debug(full_message)
+            case "info":
+                logger.info(full_message)
+            case "warning":
+                logger.warning(full_message)
+            case "error":
+                # Sends the error to the backend project in sentry
+                logger.error(f"ESP error: {full_message}")
+
+        if send_to_sentry:
+            with sentry_sdk.new_scope() as scope:
+                if items_filtered is not None:
+                    scope.set_context("esp-data", items_filtered)
+                if count > 1:
+                    scope.set_extra("repeated", count)
+                scope.set_client(self.sentry_client)
+                if log_level == "error":
+                    logger.error(full_message)
+                else:
+                    scope.capture_message(message=message, level=log_level)
@@ -0,0 +1,175 @@
+import os
+from dataclasses import dataclass
+
+from log import MeticulousLogger
+
+from .binary_protocol import FRAME_HEADER, FRAME_MAGIC, BinaryFrame, frame_length
+
+logger = MeticulousLogger.getLogger(__name__)
+
+
+@dataclass
+class FramerStats:
+    """Counters describing how the serial stream is chunked by the kernel"""
+
+    wakeups: int = 0
+    bytes_total: int = 0
+    lines_total: int = 0
+    last_bytes_per_wakeup: int = 0
+    last_lines_per_wakeup: int = 0
+    max_bytes_per_wakeup: int = 0
+    max_lines_per_wakeup: int = 0
+    max_occupancy: int = 0
+    overflows: int = 0
+    binary_frames: int = 0
+    crc_errors: int = 0
+
+    def to_dict(self):
+        return {
+            "wakeups": self.wakeups,
+            "bytes_total": self.bytes_total,
+            "lines_total": self.lines_total,
+            "last_bytes_per_wakeup": self.last_bytes_per_wakeup,
+            "last_lines_per_wakeup": self.last_lines_per_wakeup,
+            "max_bytes_per_wakeup": self.max_bytes_per_wakeup,
+            "max_lines_per_wakeup": self.max_lines_per_wakeup,
+            "max_occupancy": self.max_occupancy,
+            "overflows": self.overflows,
+            "binary_frames": self.binary_frames,
+            "crc_errors": self.crc_errors,
+        }
+
+
+class LineFramer:
+    """Splits a byte stream into lines using a fixed size buffer.
+
+    Bytes are read straight into a preallocated buffer. All complete lines of a read
+    are split out in a single pass and returned as one batch, afterwards only the
+    trailing partial line is moved back to the start of the buffer. A line that does
+    not fit into the buffer is discarded up to its line ending and counted as an
+    overflow.
+
+    Binary frames (see binary_protocol) interleaved with the lines are recognized by
+    their magic and handed out as `BinaryFrame` in the same batch. Bytes that look
+    like a frame but fail the checksum are treated as a regular line.
+    """
+
+    DEFAULT_CAPACITY = 16 * 1024
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._len = 0
+        self._discarding = False
+        self.stats = FramerStats()
+        # Called with a memoryview of every chunk read from the port, before framing
+        self.tap = None
+
+    @property
+    def occupancy(self):
+        return self._len
+
+    def read_from(self, fd) -> list[bytes]:
+        """Reads whatever is available on `fd` and returns all completed lines.
+
+        Raises EOFError if `fd` hung up.
+        """
+        if self._len >= self.capacity:
+            self._overflow()
+        n = os.readv(fd, [self._view[self._len :]])
+        if n == 0:
+            raise EOFError("End of file")
+        if self.tap is not None and n > 0:
+            self.tap(self._view[self._len : self._len + n])
+        return self._frame(n)
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Appends `data` to the buffer and returns all completed lines"""
+        lines = []
+        view = memoryview(data)
+        while len(view) > 0:
+            if self._len >= self.capacity:
+                self._overflow()
+            n = min(len(view), self.capacity - self._len)
+            self._buf[self._len : self._len + n] = view[:n]
+            view = view[n:]
+            lines.extend(self._frame(n))
+        return lines
+
+    def reset(self):
+        self._len = 0
+        self._discarding = False
+
+    def _overflow(self):
+        logger.warning(f"Serial line exceeded {self.capacity} bytes, discarding it")
+        self.stats.overflows += 1
+        self._len = 0
+        self._discarding = True
+
+    def _binary_frame(self, start: int, end: int, lines: list):
+        if end - start < len(FRAME_MAGIC):
+            return 0
+        if self._buf[start + 1] != FRAME_MAGIC[1]:
+            return -1
+        length = frame_length(self._buf, start, end)
+        if length > 0:
+            frame_type = self._buf[start + 2]
+            payload = bytes(self._view[start + FRAME_HEADER.size : start + length - 4])
+            lines.append(BinaryFrame(frame_type, payload))
+            self.stats.binary_frames += 1
+        elif length < 0:
+            self.stats.crc_errors += 1
+        return length
+
+    def _frame(self, n: int) -> list[bytes]:
+        if n <= 0:
+            return []
+
+        buf = self._buf
+        view = self._view
+        scan_start = self._len
+        end = self._len + n
+
+        lines = []
+        line_start = 0
+        if self._discarding:
+            i = buf.find(b"\n", scan_start, end)
+            if i < 0:
+                line_start = end
+            else:
+                # Drop the remainder of a line that overflowed the buffer
+                self._discarding = False
+                line_start = i + 1
+
+        magic = FRAME_MAGIC[0]
+        while line_start < end:
+            if buf[line_start] == magic:
+                length = self._binary_frame(line_start, end, lines)
+                if length == 0:
+                    break
+                if length > 0:
+                    line_start += length
+                    continue
+
+            i = buf.find(b"\n", line_start, end)
+            if i < 0:
+                break
+            lines.append(bytes(view[line_start : i + 1]))
+            line_start = i + 1
+
+        remaining = end - line_start
+        if line_start > 0 and remaining > 0:
+            buf[:remaining] = bytes(view[line_start:end])
+        self._len = remaining
+
+        stats = self.stats
+        stats.wakeups += 1
+        stats.bytes_total += n
+        stats.lines_total += len(lines)
+        stats.last_bytes_per_wakeup = n
+        stats.last_lines_per_wakeup = len(lines)
+        stats.max_bytes_per_wakeup = max(stats.max_bytes_per_wakeup, n)
+        stats.max_lines_per_wakeup = max(stats.max_lines_per_wakeup, len(lines))
+        stats.max_occupancy = max(stats.max_occupancy, end)
+        return lines
@@ -0,0 +1,157 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+
+class RollingCounter:
+    """Counts events in one second buckets over the last `window` seconds"""
+
+    def __init__(self, window: int = 60) -> None:
+        self.window = window
+        self.total = 0
+        self._buckets: deque[list] = deque()
+
+    def add(self, now: float, count: int = 1):
+        second = int(now)
+        if self._buckets and self._buckets[-1][0] == second:
+            self._buckets[-1][1] += count
+        else:
+            self._buckets.append([second, count])
+            while self._buckets[0][0] <= second - self.window:
+                self._buckets.popleft()
+        self.total += count
+
+    def count(self, now: float, seconds: int) -> int:
+        # The current second is still filling up, only full seconds are counted
+        newest = int(now) - 1
+        oldest = newest - seconds
+        return sum(c for second, c in self._buckets if oldest < second <= newest)
+
+
+class SerialLinkStats:
+    """Aggregated health of the serial link to the ESP.
+
+    Updated by the serial reader and read by the API, all access is serialized with a
+    lock so the API always gets a consistent snapshot.
+    """
+
+    WINDOWS = (1, 10, 60)
+    # Upper bounds of the gap histogram buckets in milliseconds, the last bucket is open
+    GAP_BUCKETS_MS = (25, 50, 100, 150, 200, 300, 500, 1000, 2000)
+    LATENCY_SAMPLES = 200
+
+    def __init__(self, clock=time.monotonic) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.started = clock()
+        self._lines = RollingCounter()
+        self._bytes = RollingCounter()
+        self._valid: dict[str, RollingCounter] = {}
+        self._invalid: dict[str, RollingCounter] = {}
+
+        self._last_telemetry = None
+        self._gap_histogram = [0] * (len(SerialLinkStats.GAP_BUCKETS_MS) + 1)
+        self.last_gap = 0.0
+        self.max_gap = 0.0
+
+        self._last_read_at = None
+        self._latencies: deque[float] = deque(maxlen=SerialLinkStats.LATENCY_SAMPLES)
+        self.max_latency = 0.0
+
+    def record_batch(self, lines: int, nbytes: int):
+        now = self._clock()
+        with self._lock:
+            self._lines.add(now, lines)
+            self._bytes.add(now, nbytes)
+
+    def record_valid(self, kind: str):
+        now = self._clock()
+        with self._lock:
+            self._valid.setdefault(kind, RollingCounter()).add(now)
+
+    def record_invalid(self, kind: str):
+        now = self._clock()
+        with self._lock:
+            self._invalid.setdefault(kind, RollingCounter()).add(now)
+
+    def record_telemetry(self, read_at: float):
+        """Called for every periodic telemetry message, `read_at` is when its bytes
+        were read from the serial port"""
+        with self._lock:
+            if self._last_telemetry is not None:
+                gap = read_at - self._last_telemetry
+                self.last_gap = gap
+                self.max_gap = max(self.max_gap, gap)
+                bucket = bisect.bisect_right(SerialLinkStats.GAP_BUCKETS_MS, gap * 1000)
+                self._gap_histogram[bucket] += 1
+            self._last_telemetry = read_at
+            self._last_read_at = read_at
+
+    def record_emit(self):
+        """Called after the latest telemetry was emitted over socket.io"""
+        now = self._clock()
+        with self._lock:
+            if self._last_read_at is None:
+                return
+            latency = now - self._last_read_at
+            # Only the first emit of a sample counts, repeats would skew the latency
+            self._last_read_at = None
+            self._latencies.append(latency)
+            self.max_latency = max(self.max_latency, latency)
+
+    @staticmethod
+    def _rates(counter: RollingCounter, now: float):
+        return {
+            f"{seconds}s": round(counter.count(now, seconds) / seconds, 2)
+            for seconds in SerialLinkStats.WINDOWS
+        }
+
+    @staticmethod
+    def _counts(counters: dict[str, RollingCounter], now: float):
+        return {
+            kind: {
+                "total": counter.total,
+                **{
+                    f"{seconds}s": counter.count(now, seconds)
+                    for seconds in SerialLinkStats.WINDOWS
+                },
+            }
+            for kind, counter in counters.items()
+        }
+
+    def _latency(self):
+        if not self._latencies:
+            return {"samples": 0}
+        ordered = sorted(self._latencies)
+        return {
+            "samples": len(ordered),
+            "last_ms": round(self._latencies[-1] * 1000, 2),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+            "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2),
+            "max_ms": round(self.max_latency * 1000, 2),
+        }
+
+    def _gaps(self):
+        labels = [f"<{bound}ms" for bound in SerialLinkStats.GAP_BUCKETS_MS]
+        labels.append(f">={SerialLinkStats.GAP_BUCKETS_MS[-1]}ms")
+        return {
+            "last_ms": round(self.last_gap * 1000, 2),
+            "max_ms": round(self.max_gap * 1000, 2),
+            "histogram": dict(zip(labels, self._gap_histogram)),
+        }
+
+    def to_dict(self):
+        now = self._clock()
+        with self._lock:
+            return {
+                "uptime": round(now - self.started, 1),
+                "lines_per_second": self._rates(self._lines, now),
+                "bytes_per_second": self._rates(self._bytes, now),
+                "lines_total": self._lines.total,
+                "bytes_total": self._bytes.total,
+                "valid_messages": self._counts(self._valid, now),
+                "invalid_messages": self._counts(self._invalid, now),
+                "telemetry_gaps": self._gaps(),
+                "read_to_emit_latency": self._latency(),
+            }
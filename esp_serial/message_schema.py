@@ -0,0 +1,288 @@
+import math
+from urllib.parse import unquote as urlDecode
+
+from log import MeticulousLogger
+
+from .data import (
+    MachineState,
+    MachineStatus,
+    MachineStatusToProfile,
+    SensorData,
+    ShotData,
+    safe_float_with_nan,
+    safeFloat,
+)
+
+logger = MeticulousLogger.getLogger(__name__)
+
+
+def _text(value: str):
+    # Only pay for URL decoding if there is something to decode
+    if "%" in value:
+        return urlDecode(value)
+    return value
+
+
+def _finite_floats(values):
+    # Same as safeFloat on every value. A single sum catches any nan or inf
+    floats = list(map(float, values))
+    if math.isfinite(sum(floats)):
+        return floats
+    return [value if math.isfinite(value) else 0 for value in floats]
+
+
+def _floats_with_nan(values):
+    # Same as safe_float_with_nan on every value
+    try:
+        floats = list(map(float, values))
+    except ValueError:
+        return [safe_float_with_nan(value) for value in values]
+    if math.isfinite(sum(floats)):
+        return floats
+    return ["NaN" if math.isnan(value) else value for value in floats]
+
+
+def _controller_kind(value: str):
+    if value == "none":
+        return None
+    return value
+
+
+def _is_true(value: str):
+    return value == "true"
+
+
+def _is_true_ignore_case(value: str):
+    return value.lower() == "true"
+
+
+def _is_stable(value: str):
+    return value == "S"
+
+
+# Converters that are applied to a whole run of neighbouring fields at once
+_BULK_CONVERTERS = {
+    safeFloat: _finite_floats,
+    safe_float_with_nan: _floats_with_nan,
+}
+
+# Converters that are cheap enough to be written into the compiled parser directly
+_INLINE_CONVERTERS = {
+    _controller_kind: '(None if {0} == "none" else {0})',
+    _is_true: '{0} == "true"',
+    _is_true_ignore_case: '{0}.lower() == "true"',
+    _is_stable: '{0} == "S"',
+}
+
+
+class MessageSchema:
+    """Precomputed field layout of a comma separated ESP message.
+
+    `fields` is a tuple of (attribute, converter) pairs in the order the ESP sends
+    them. `extended_fields` are only parsed if the message carries all of them, older
+    firmwares send shorter messages; `defaults` are passed to the record instead. Each
+    layout is compiled once into a function constructing the record in a single call.
+    If a message does not fit the layout or any converter fails the `fallback` parser
+    is used so corner cases keep the behaviour of the handwritten parsers.
+    """
+
+    __slots__ = (
+        "prefix",
+        "record_type",
+        "fields",
+        "extended_fields",
+        "defaults",
+        "finalize",
+        "fallback",
+        "_min_args",
+        "_all_args",
+        "_parse_short",
+        "_parse_all",
+    )
+
+    def __init__(
+        self,
+        prefix: str,
+        record_type: type,
+        fields: tuple,
+        extended_fields: tuple = (),
+        defaults: dict = None,
+        finalize=None,
+        fallback=None,
+    ) -> None:
+        self.prefix = prefix
+        self.record_type = record_type
+        self.fields = fields
+        self.extended_fields = extended_fields
+        self.defaults = defaults or {}
+        self.finalize = finalize
+        self.fallback = fallback
+        self._min_args = len(fields)
+        self._all_args = len(fields) + len(extended_fields)
+        self._parse_short = self._compile(fields, self.defaults)
+        self._parse_all = self._compile(fields + extended_fields, {})
+
+    def _compile(self, layout: tuple, defaults: dict):
+        namespace = {"_record": self.record_type, "_finalize": self.finalize}
+        body = []
+        arguments = []
+        index = 0
+        while index < len(layout):
+            name, convert = layout[index]
+            end = index + 1
+            while end < len(layout) and layout[end][1] is convert:
+                end += 1
+
+            if convert in _BULK_CONVERTERS and end - index > 1:
+                names = [field for field, _ in layout[index:end]]
+                namespace[f"_b{index}"] = _BULK_CONVERTERS[convert]
+                body.append(f"({', '.join(names)},) = _b{index}(args[{index}:{end}])")
+                arguments.extend(f"{field}={field}" for field in names)
+                index = end
+            elif convert in _INLINE_CONVERTERS:
+                value = _INLINE_CONVERTERS[convert].format(f"args[{index}]")
+                arguments.append(f"{name}={value}")
+                index += 1
+            else:
+                namespace[f"_c{index}"] = convert
+                arguments.append(f"{name}=_c{index}(args[{index}])")
+                index += 1
+
+        for name, value in defaults.items():
+            namespace[f"_d_{name}"] = value
+            arguments.append(f"{name}=_d_{name}")
+
+        body.append(f"record = _record({', '.join(arguments)})")
+        if self.finalize is not None:
+            body.append("_finalize(record)")
+        body.append("return record")
+        source = "def parse(args):\n" + "".join(f"    {line}\n" for line in body)
+        exec(compile(source, f"<{self.prefix} schema>", "exec"), namespace)
+        return namespace["parse"]
+
+    def parse(self, args: list[str]):
+        nargs = len(args)
+        if nargs < self._min_args:
+            return self._parse_fallback(args)
+
+        try:
+            if nargs >= self._all_args:
+                return self._parse_all(args)
+            return self._parse_short(args)
+        except Exception:
+            return self._parse_fallback(args)
+
+    def _parse_fallback(self, args: list[str]):
+        if self.fallback is None:
+            logger.warning(f"Failed to parse {self.prefix}: {args}")
+            return None
+        return self.fallback(args)
+
+
+class MessageRegistry:
+    """Maps the prefix of an ESP message to the schema used to parse it"""
+
+    _schemas: dict[str, MessageSchema] = {}
+
+    @staticmethod
+    def register(schema: MessageSchema):
+        MessageRegistry._schemas[schema.prefix] = schema
+
+    @staticmethod
+    def get(prefix: str) -> MessageSchema | None:
+        return MessageRegistry._schemas.get(prefix)
+
+    @staticmethod
+    def parse_line(line: str):
+        """Parses a line without line ending.
+
+        Returns a tuple of (prefix, record) if the prefix has a registered schema, the
+        record is None if the message could not be parsed. Returns None if the prefix
+        is unknown so the caller can handle the message itself.
+        """
+        prefix, _, rest = line.partition(",")
+        schema = MessageRegistry._schemas.get(prefix)
+        if schema is None:
+            return None
+        return (prefix, schema.parse(rest.split(",")))
+
+
+_IDLE_PROFILES = (
+    MachineStatus.IDLE,
+    MachineStatusToProfile[MachineStatus.PURGE],
+    MachineStatusToProfile[MachineStatus.HOME],
+)
+
+
+def _finalize_shot_data(data: ShotData):
+    if data.profile in _IDLE_PROFILES:
+        data.state = data.profile.lower()
+    else:
+        data.state = MachineState.BREWING
+
+
+def _parse_sensors_fallback(args: list[str]):
+    if len(args) == 1:
+        return SensorData.from_color_coded_args(args[0])
+    return SensorData.from_args(args)
+
+
+SHOT_DATA_SCHEMA = MessageSchema(
+    "Data",
+    ShotData,
+    fields=(
+        ("pressure", safe_float_with_nan),
+        ("flow", safe_float_with_nan),
+        ("weight", safe_float_with_nan),
+        ("stable_weight", _is_stable),
+        ("temperature", safe_float_with_nan),
+        ("status", _text),
+        ("profile", _text),
+    ),
+    extended_fields=(
+        ("main_controller_kind", _controller_kind),
+        ("main_setpoint", safeFloat),
+        ("aux_controller_kind", _controller_kind),
+        ("aux_setpoint", safeFloat),
+        ("is_aux_controller_active", _is_true),
+        ("gravimetric_flow", safe_float_with_nan),
+    ),
+    # Messages without controller information report their setpoints as 0
+    defaults={"main_setpoint": 0.0, "aux_setpoint": 0.0},
+    finalize=_finalize_shot_data,
+    fallback=ShotData.from_args,
+)
+
+SENSOR_DATA_SCHEMA = MessageSchema(
+    "Sensors",
+    SensorData,
+    fields=(
+        ("external_1", safeFloat),
+        ("external_2", safeFloat),
+        ("bar_up", safeFloat),
+        ("bar_mid_up", safeFloat),
+        ("bar_mid_down", safeFloat),
+        ("bar_down", safeFloat),
+        ("tube", safeFloat),
+        ("motor_temp", safeFloat),
+        ("lam_temp", safeFloat),
+        ("motor_position", safeFloat),
+        ("motor_speed", safeFloat),
+        ("motor_power", safeFloat),
+        ("motor_current", safeFloat),
+        ("bandheater_current", safeFloat),
+        ("bandheater_power", safeFloat),
+        ("pressure_sensor", safeFloat),
+        ("adc_0", safeFloat),
+        ("adc_1", safeFloat),
+        ("adc_2", safeFloat),
+        ("adc_3", safeFloat),
+        ("water_status", _is_true_ignore_case),
+        ("motor_thermistor", safe_float_with_nan),
+        ("weight_prediction", safe_float_with_nan),
+    ),
+    fallback=_parse_sensors_fallback,
+)
+
+MessageRegistry.register(SHOT_DATA_SCHEMA)
+MessageRegistry.register(SENSOR_DATA_SCHEMA)
@@ -0,0 +1,173 @@
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+from pathlib import Path
+
+from log import MeticulousLogger
+
+logger = MeticulousLogger.getLogger(__name__)
+
+# A capture file holds the raw bytes read from the UART exactly as the kernel handed
+# them out, so a replay reproduces the chunking as well as the content:
+#
+#   header   16 bytes   CAPTURE_MAGIC, wall clock time of the first record (double)
+#   records             CAPTURE_RECORD header followed by the chunk itself
+#
+# Record headers have a fixed size and the chunks are stored unmodified, which lets
+# the reader walk a memory mapped file without copying anything.
+CAPTURE_MAGIC = b"METRAW01"
+CAPTURE_HEADER = struct.Struct("<8sd")
+# seconds since the start of the file (monotonic clock), length of the chunk
+CAPTURE_RECORD = struct.Struct("<dI")
+CAPTURE_SUFFIX = ".bin"
+
+
+class RawCaptureWriter:
+    """Appends timestamped UART chunks to a set of rotating capture files.
+
+    A new file is started once the current one reaches `max_bytes`, only the newest
+    `max_files` are kept. Chunks can be passed as memoryviews into the read buffer,
+    they are written without an intermediate copy.
+    """
+
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        directory,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_files: int = 4,
+        clock=time.monotonic,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._clock = clock
+        self._file = None
+        self._size = 0
+        self._started = 0.0
+        self._last_flush = 0.0
+        self.chunks_written = 0
+        self.bytes_written = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def current_file(self):
+        return self._file.name if self._file is not None else None
+
+    def _open(self, now: float):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = self.directory.joinpath(f"raw-{stamp}{CAPTURE_SUFFIX}")
+        logger.info(f"Capturing raw serial data to {path}")
+        self._file = open(path, "wb")
+        self._file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, time.time()))
+        self._size = CAPTURE_HEADER.size
+        self._started = now
+        self._last_flush = now
+        self._remove_old_files()
+
+    def _remove_old_files(self):
+        files = capture_files(self.directory)
+        for path in files[: max(len(files) - self.max_files, 0)]:
+            try:
+                path.unlink()
+            except OSError as e:
+                logger.warning(f"Failed to remove old capture {path}: {e}")
+
+    def write(self, chunk):
+        now = self._clock()
+        length = len(chunk)
+        if (
+            self._file is not None
+            and self._size + CAPTURE_RECORD.size + length > self.max_bytes
+        ):
+            self.close()
+        if self._file is None:
+            self._open(now)
+
+        self._file.write(CAPTURE_RECORD.pack(now - self._started, length))
+        self._file.write(chunk)
+        self._size += CAPTURE_RECORD.size + length
+        self.chunks_written += 1
+        self.bytes_written += length
+
+        if now - self._last_flush >= RawCaptureWriter.FLUSH_INTERVAL:
+            self._file.flush()
+            self._last_flush = now
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RawCapture:
+    """Read access to a single capture file through mmap.
+
+    Use as a context manager, the memoryviews handed out by `records()` are only valid
+    until the capture is closed.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self.started_at = None
+        self._file = None
+        self._map = None
+
+    def __enter__(self):
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size < CAPTURE_HEADER.size:
+            self.close()
+            raise ValueError(f"{self.path} is not a raw serial capture")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.started_at = CAPTURE_HEADER.unpack_from(self._map)
+        if magic != CAPTURE_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a raw serial capture")
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A chunk is still referenced, the mapping goes away with it
+                pass
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def records(self):
+        """Yields (seconds since start, chunk) for every record in the file. A record
+        truncated by a crash while writing ends the iteration."""
+        view = memoryview(self._map)
+        offset = CAPTURE_HEADER.size
+        end = len(view)
+        try:
+            while offset + CAPTURE_RECORD.size <= end:
+                timestamp, length = CAPTURE_RECORD.unpack_from(view, offset)
+                offset += CAPTURE_RECORD.size
+                if offset + length > end:
+                    logger.warning(f"{self.path} ends with a truncated record")
+                    break
+                yield timestamp, view[offset : offset + length]
+                offset += length
+        finally:
+            view.release()
+
+
+def capture_files(path) -> list[Path]:
+    """All capture files in `path` oldest first, or `path` itself if it is a file"""
+    path = Path(path)
+    if path.is_file():
+        return [path]
+    if not path.is_dir():
+        return []
+    return sorted(path.glob(f"raw-*{CAPTURE_SUFFIX}"))
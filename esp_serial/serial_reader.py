@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import deque
+
+from log import MeticulousLogger
+
+from .line_framer import LineFramer
+
+logger = MeticulousLogger.getLogger(__name__)
+
+
+class SerialDisconnected(ConnectionError):
+    pass
+
+
+class SerialLineReader:
+    """Event driven line reader on top of the file descriptor of a serial port.
+
+    Instead of polling `in_waiting` the descriptor is registered with the running
+    event loop and only read once the kernel reports it readable. Every wakeup is
+    framed by a `LineFramer` and the resulting lines are handed out as one batch
+    through the `batches()` async iterator, which raises SerialDisconnected once the
+    port hung up.
+    """
+
+    PAUSE_INTERVAL = 0.1
+
+    def __init__(self, port, is_paused=None, framer: LineFramer = None) -> None:
+        self.port = port
+        self._is_paused = is_paused if is_paused is not None else (lambda: False)
+        self.framer = framer if framer is not None else LineFramer()
+        self._batches: deque[list[bytes]] = deque()
+        self._ready = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop = None
+        self._fd = None
+        self._disconnected = False
+        # time.monotonic() of the latest read that completed at least one line
+        self.last_read_at: float = None
+
+    def _attach(self):
+        if self._fd is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._fd = self.port.fileno()
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def _detach(self):
+        if self._fd is None:
+            return
+        self._loop.remove_reader(self._fd)
+        self._fd = None
+
+    def pause(self):
+        """Stop reading from the port, e.g. while the firmware is being flashed"""
+        self._detach()
+        self.framer.reset()
+        self._batches.clear()
+        # Whoever owns the port meanwhile may reopen it
+        self._disconnected = False
+
+    def _on_readable(self):
+        try:
+            batch = self.framer.read_from(self._fd)
+        except BlockingIOError:
+            return
+        except EOFError:
+            # A hung up descriptor stays readable, it would wake the loop forever
+            logger.error("Serial port hung up, no longer reading from it")
+            self._detach()
+            self._disconnected = True
+            self._ready.set()
+            return
+        except OSError as e:
+            logger.warning(f"Failed to read from serial port: {e}")
+            self._detach()
+            return
+
+        if batch:
+            self.last_read_at = time.monotonic()
+            self._batches.append(batch)
+            self._ready.set()
+
+    async def batches(self, timeout=None):
+        """Yields lists of complete lines as bytes including their line endings, binary
+        telemetry frames are included as `BinaryFrame`.
+
+        If no line arrived within `timeout` seconds or the reader is paused an empty
+        batch is yielded instead so the consumer can run its periodic checks.
+        """
+        while True:
+            if self._is_paused():
+                self.pause()
+                await asyncio.sleep(SerialLineReader.PAUSE_INTERVAL)
+                yield []
+                continue
+            if self._disconnected and not self._batches:
+                raise SerialDisconnected("The serial port hung up")
+
+            if not self._batches:
+                self._attach()
+                self._ready.clear()
+                try:
+                    await asyncio.wait_for(self._ready.wait(), timeout)
+                except asyncio.TimeoutError:
+                    yield []
+                    continue
+                if not self._batches:
+                    continue
+
+            if len(self._batches) == 1:
+                yield self._batches.popleft()
+            else:
+                # The consumer fell behind, hand out everything that queued up at once
+                batch = []
+                while self._batches:
+                    batch.extend(self._batches.popleft())
+                yield batch
+
+    def close(self):
+        self._detach()
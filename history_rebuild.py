@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Rebuilds the shot history database from the shot files below SHOT_PATH.
+
+Shot files are decompressed and summarized by a pool of worker processes, the
+shots are written in batches of one transaction each through the persistence
+thread, or directly when run from the command line. Shots already in the
+database are kept as they are, so a rebuild can be stopped and run again.
+
+    python history_rebuild.py [--workers N] [--batch-size N] [--delete]
+
+Stop the backend before running it from the command line, it is otherwise
+available at POST /api/v1/history/rebuild.
+"""
+
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+from config import SHOT_PATH
+from log import MeticulousLogger
+from named_thread import NamedThread
+from persistence import JobPriority, PersistenceQueueFull, PersistenceService
+from shot_database import ShotDataBase
+from shot_file import SHOT_JSON_SUFFIX
+from shot_format_v2 import SHOT_V2_SUFFIX
+from shot_summary import summarize_shot
+
+logger = MeticulousLogger.getLogger(__name__)
+
+
+def shot_files(shot_path=None) -> list[str]:
+    """The shot files below `shot_path` (SHOT_PATH), relative to it, oldest first"""
+    root = Path(shot_path or SHOT_PATH)
+    files = []
+    for suffix in (SHOT_JSON_SUFFIX, SHOT_V2_SUFFIX):
+        files += [str(path.relative_to(root)) for path in root.glob(f"*/*{suffix}")]
+    return sorted(files)
+
+
+def _read_shot(shot_path, file_entry: str):
+    """The history entry and summary of a shot file, or the reason it can't be read.
+
+    Runs in the worker processes, only the entry without its datapoints and the
+    summary are sent back.
+    """
+    try:
+        shot = ShotDataBase.read_shot_file(file_entry, shot_path)
+        entry = {
+            "file": file_entry,
+            "time": shot["time"],
+            "profile_name": shot["profile_name"],
+            "profile": shot["profile"],
+        }
+        if shot.get("id") is not None:
+            entry["id"] = shot["id"]
+        if entry["profile"] is None:
+            return file_entry, None, "no profile"
+        return entry, summarize_shot(shot.get("data") or []), None
+    except Exception as e:
+        return file_entry, None, f"{type(e).__name__}: {e}"
+
+
+class HistoryRebuild:
+    BATCH_SIZE = 100
+    WORKERS = min(4, os.cpu_count() or 1)
+
+    _lock = threading.Lock()
+    _status = {
+        "running": False,
+        "files": 0,
+        "done": 0,
+        "failed": 0,
+        "started": None,
+        "finished": None,
+        "error": None,
+    }
+
+    @staticmethod
+    def status() -> dict:
+        with HistoryRebuild._lock:
+            return dict(HistoryRebuild._status)
+
+    @staticmethod
+    def _claim() -> bool:
+        # Marks a rebuild as running, False if one is running already
+        with HistoryRebuild._lock:
+            if HistoryRebuild._status["running"]:
+                return False
+            HistoryRebuild._status.update(
+                running=True,
+                files=0,
+                done=0,
+                failed=0,
+                started=time.time(),
+                finished=None,
+                error=None,
+            )
+            return True
+
+    @staticmethod
+    def start() -> bool:
+        """Runs the rebuild in the background, False if one is running already.
+
+        A rebuild takes minutes, so it gets a thread of its own rather than holding
+        a worker of the shared Runtime executor.
+        """
+        if not HistoryRebuild._claim():
+            return False
+        NamedThread("HistoryRebuild", target=HistoryRebuild._rebuild, daemon=True).start()
+        return True
+
+    @staticmethod
+    def _update(**values):
+        with HistoryRebuild._lock:
+            HistoryRebuild._status.update(values)
+
+    @staticmethod
+    def _write(batch: list[tuple[dict, dict]]):
+        entries = [entry for entry, _summary in batch]
+        summaries = [summary for _entry, summary in batch]
+        while True:
+            future = PersistenceService.submit(
+                JobPriority.BACKFILL, ShotDataBase.insert_history_batch, entries, summaries
+            )
+            try:
+                return future.result()
+            except (CancelledError, PersistenceQueueFull):
+                # Pushed out by shots being saved, they go first
+                logger.info("History rebuild batch postponed, persistence queue is full")
+
+    @staticmethod
+    def run(shot_path=None, workers: int = None, batch_size: int = None) -> dict:
+        """Imports every shot file into the database and returns the final status.
+
+        With `workers=0` the files are read in this thread. Raises RuntimeError if a
+        rebuild is running already.
+        """
+        if not HistoryRebuild._claim():
+            raise RuntimeError("A history rebuild is already running")
+        return HistoryRebuild._rebuild(shot_path, workers, batch_size)
+
+    @staticmethod
+    def _rebuild(shot_path=None, workers: int = None, batch_size: int = None) -> dict:
+        workers = HistoryRebuild.WORKERS if workers is None else workers
+        batch_size = batch_size or HistoryRebuild.BATCH_SIZE
+        executor = None
+        try:
+            files = shot_files(shot_path)
+            HistoryRebuild._update(files=len(files))
+            logger.info(f"Rebuilding the history from {len(files)} shot files")
+
+            if workers > 0:
+                # The backend is threaded, forking it could copy locks held by threads
+                context = multiprocessing.get_context("forkserver")
+                executor = ProcessPoolExecutor(workers, mp_context=context)
+                shots = executor.map(_read_shot, repeat(shot_path), files, chunksize=16)
+            else:
+                shots = map(_read_shot, repeat(shot_path), files)
+
+            batch = []
+            done = failed = 0
+            for entry, summary, error in shots:
+                if error is not None:
+                    logger.warning(f"Skipping shot file {entry}: {error}")
+                    failed += 1
+                    HistoryRebuild._update(failed=failed)
+                    continue
+                batch.append((entry, summary))
+                if len(batch) >= batch_size:
+                    HistoryRebuild._write(batch)
+                    done += len(batch)
+                    HistoryRebuild._update(done=done)
+                    batch = []
+            if batch:
+                HistoryRebuild._write(batch)
+                done += len(batch)
+                HistoryRebuild._update(done=done)
+        except Exception as e:
+            logger.error("History rebuild failed", exc_info=e)
+            HistoryRebuild._update(error=str(e))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            HistoryRebuild._update(running=False, finished=time.time())
+
+        status = HistoryRebuild.status()
+        logger.info(
+            f"History rebuild imported {status['done']} of {status['files']} shot files"
+            f" in {status['finished'] - status['started']:.1f} s, {status['failed']} failed"
+        )
+        return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=HistoryRebuild.WORKERS)
+    parser.add_argument("--batch-size", type=int, default=HistoryRebuild.BATCH_SIZE)
+    parser.add_argument(
+        "--delete", action="store_true", help="delete the database first and start over"
+    )
+    args = parser.parse_args()
+
+    from db_migration_updater import update_db_migrations
+
+    ShotDataBase.init()
+    if args.delete:
+        ShotDataBase.delete_and_rebuild()
+    update_db_migrations()
+
+    status = HistoryRebuild.run(workers=args.workers, batch_size=args.batch_size)
+    print(
+        f"imported {status['done']} of {status['files']} shots,"
+        f" {status['failed']} failed in {status['finished'] - status['started']:.1f} s"
+    )
+    if status["error"] is not None:
+        print(f"error: {status['error']}")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
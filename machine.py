@@ -2,7 +2,6 @@ import asyncio
 import hashlib
 import json
 import os
-from named_thread import NamedThread
 import time
 from enum import Enum
 import sentry_sdk
@@ -19,6 +18,10 @@ from config import (
     SSH_ENABLED,
     CONFIG_MANUFACTURING,
     DISALLOW_FIRMWARE_FLASHING,
+    ESP_BINARY_TELEMETRY,
+    TELEMETRY_DECIMATION,
+    TELEMETRY_RATE,
+    TELEMETRY_SHOT_RATE,
     LOGGING_SENSOR_MESSAGES,
     MACHINE_COLOR,
     MACHINE_SERIAL_NUMBER,
@@ -27,10 +30,15 @@ from config import (
     MACHINE_HEAT_ON_BOOT,
     PROFILE_AUTO_PURGE,
     PROFILE_PARTIAL_RETRACTION,
+    RAW_SERIAL_CAPTURE,
+    RAW_SERIAL_CAPTURE_FILE_SIZE_MB,
+    RAW_SERIAL_CAPTURE_FILES,
+    RAW_SERIAL_CAPTURE_PATH,
     MeticulousConfig,
 )
 from esp_serial.connection.emulator_serial_connection import EmulatorSerialConnection
 from esp_serial.connection.fika_serial_connection import FikaSerialConnection
+from esp_serial.connection.replay_serial_connection import ReplaySerialConnection
 from esp_serial.connection.usb_serial_connection import USBSerialConnection
 from esp_serial.data import (
     ButtonEventData,
@@ -42,11 +50,40 @@ from esp_serial.data import (
     MachineNotify,
     HeaterTimeoutInfo,
 )
+from esp_serial.binary_protocol import (
+    DEFAULT_TELEMETRY_RATE,
+    TELEMETRY_RATE_CAPABILITY,
+    BinaryFrame,
+    TelemetryNegotiator,
+    decode_frame,
+    telemetry_rate_command,
+)
+from esp_serial.crash_detector import CrashDetector
+from esp_serial.esp_log import EspLogForwarder
+from esp_serial.decimation import Decimator, LatestAggregate, decimation_rate
+from esp_serial.link_stats import SerialLinkStats
 from esp_serial.esp_tool_wrapper import ESPToolWrapper
+from esp_serial.raw_capture import RawCaptureWriter
+from esp_serial.message_schema import (
+    MessageRegistry,
+    SENSOR_DATA_SCHEMA,
+    SHOT_DATA_SCHEMA,
+)
+from esp_serial.serial_reader import SerialLineReader
 from log import MeticulousLogger
+from runtime import Runtime
+from machine_bus import (
+    MachineBus,
+    MachineEvent,
+    MachineEventKind,
+    OverflowPolicy,
+    SensorTick,
+    Topic,
+)
 from notifications import Notification, NotificationManager, NotificationResponse
 from shot_debug_manager import ShotDebugManager
 from shot_manager import ShotManager
+from shot_state_machine import ShotEvent, ShotStateMachine
 from sounds import SoundPlayer, Sounds
 from api.alarms import AlarmManager, AlarmType
 from images.notificationImages.base64 import WARNING_TRIANGLE_IMAGE
@@ -87,7 +124,7 @@ def toggle_sentry(enabled):
 
 logger = MeticulousLogger.getLogger(__name__)
 
-# can be from [FIKA, USB, EMULATOR / EMULATION]
+# can be from [FIKA, USB, EMULATOR / EMULATION, REPLAY]
 BACKEND = os.getenv("BACKEND", "FIKA").upper()
 
 
@@ -116,7 +153,16 @@ class Machine:
     ]
 
     _connection = None
-    _thread = None
+    serial_reader: SerialLineReader = None
+    raw_capture: RawCaptureWriter = None
+    telemetry: TelemetryNegotiator = None
+    telemetry_rate_hz = DEFAULT_TELEMETRY_RATE
+    link_stats = SerialLinkStats()
+    esp_log = EspLogForwarder(ESPSentryClient)
+    crash_detector = CrashDetector()
+    # Telemetry since the last status broadcast, see backend.live()
+    broadcast_telemetry = LatestAggregate()
+    _shot_decimator = Decimator()
     _stopESPcomm = False
     _sio = None
     _espNotification = Notification("", [NotificationResponse.OK])
@@ -125,7 +171,6 @@ class Machine:
 
     infoReady = False
     profileReady = False
-    oldProfileReady = False
 
     data_sensors: ShotData = ShotData(
         state=MachineStatus.IDLE, status=MachineStatus.IDLE, profile=MachineStatus.IDLE
@@ -145,9 +190,8 @@ class Machine:
 
     is_first_normal_boot = False
 
-    stable_start_timestamp = None
-
     stable_time_threshold = 2.0
+    shot_state = ShotStateMachine(stable_time_threshold)
 
     aborted_by_motor_consumtion = False
 
@@ -261,6 +305,9 @@ class Machine:
             case "EMULATOR" | "EMULATION":
                 Machine._connection = EmulatorSerialConnection()
                 Machine.emulated = True
+            case "REPLAY":
+                Machine._connection = ReplaySerialConnection()
+                Machine.emulated = True
             # Everything else is proper fika Connection
             case "FIKA" | _:
                 Machine._connection = FikaSerialConnection("/dev/ttymxc0")
@@ -272,93 +319,83 @@ class Machine:
             som = Machine.get_somrev()
             logger.info(f"SOM revision: {som}")
 
-        def startLoop():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+        async def flashingEsp():
+            await asyncio.sleep(60)
+            await Runtime.run_blocking(Machine.check_machine_alive)
 
-            loop.run_until_complete(Machine._read_data())
-            loop.close()
-
-        def flashingEsp():
-            time.sleep(60)
-            Machine.check_machine_alive()
-
-        Machine._thread = NamedThread("MachineSerial", target=startLoop)
-        Machine._flashingThread = NamedThread("FlashingEsp", target=flashingEsp)
-        Machine._thread.start()
-        Machine._flashingThread.start()
+        # Serial ingest runs on the shared loop, blocking work goes to its executor
+        Machine._subscribe_to_bus()
+        Runtime.spawn(Machine._read_data(), "serial-ingest")
+        Runtime.spawn(flashingEsp(), "esp-alive-check")
 
         # if the we are on the first non-manufacturing boot
         if Machine.is_first_normal_boot:
             Machine.on_first_normal_boot()
 
-    class ReadLine:
-        def __init__(self, s):
-            self.buf = bytearray()
-            self.s = s
-
-        def readline(self, timeout=None):
-            i = self.buf.find(b"\n")
-            if i >= 0:
-                r = self.buf[: i + 1]
-                self.buf = self.buf[i + 1 :]
-                return r
-            start_time = time.monotonic()
-            while not Machine._stopESPcomm:
-                now = time.monotonic()
-                i = max(1, min(2048, self.s.in_waiting))
-                data = self.s.read(i)
-                i = data.find(b"\n")
-                if i >= 0:
-                    r = self.buf + data[: i + 1]
-                    self.buf[0:] = data[i + 1 :]
-                    return r
-                else:
-                    self.buf.extend(data)
-                if timeout is not None and now - start_time > timeout:
-                    logger.warning("timeout on readline")
-                    return None
-            return self.buf
-
     async def _read_data():  # noqa: C901
         Machine.shot_start_time = time.time()
         Machine._connection.port.reset_input_buffer()
         Machine._connection.port.write(b"32\n")
-        uart = Machine.ReadLine(Machine._connection.port)
+        uart = SerialLineReader(Machine._connection.port, lambda: Machine._stopESPcomm)
+        Machine.serial_reader = uart
+        if MeticulousConfig[CONFIG_USER][RAW_SERIAL_CAPTURE]:
+            Machine.raw_capture = RawCaptureWriter(
+                RAW_SERIAL_CAPTURE_PATH,
+                MeticulousConfig[CONFIG_USER][RAW_SERIAL_CAPTURE_FILE_SIZE_MB] * 1024 * 1024,
+                MeticulousConfig[CONFIG_USER][RAW_SERIAL_CAPTURE_FILES],
+            )
+            uart.framer.tap = Machine.raw_capture.write
+        Machine.telemetry = TelemetryNegotiator(
+            MeticulousConfig[CONFIG_USER][ESP_BINARY_TELEMETRY]
+        )
 
-        old_status = MachineStatus.IDLE
         old_ready = False
-        time_flag = False
         info_requested = False
-        time_passed = 0
-        profile_time = 0
         emulated_firmware = False
         previous_preheat_remaining = None
-        ESP_tracing_info = []
-        collect_tracing_info = False
         previous_valid_message_timestamp = time.monotonic()
 
         logger.info("Starting to listen for esp32 messages")
         Machine.startTime = time.time()
-        while True:
+        async for batch in uart.batches(timeout=0.5):
             if Machine._stopESPcomm:
-                await asyncio.sleep(0.1)
                 Machine.startTime = time.time()
                 continue
 
-            data_bytes = uart.readline(timeout=0.5)
-            if data_bytes is not None and len(data_bytes) > 0:
-                # data_bit = bytes(data)
-                try:
-                    data_str = data_bytes.decode("utf-8")
-                except Exception:
-                    logger.info(f"decoding fails, message: {data_bytes}")
-                    continue
-
-                if MeticulousConfig[CONFIG_LOGGING][LOGGING_SENSOR_MESSAGES]:
-                    logger.info(data_str.strip("\r\n"))
-
-                data_str_sensors = data_str.strip("\r\n").split(",")
+            # All lines framed in one wakeup are processed back to back
+            received_valid_message = False
+            if batch:
+                Machine.link_stats.record_batch(len(batch), sum(map(len, batch)))
+                read_at = uart.last_read_at
+            for data_bytes in batch:
+                if type(data_bytes) is BinaryFrame:
+                    parsed_message = decode_frame(data_bytes)
+                    if parsed_message is None:
+                        Machine.link_stats.record_invalid("binary")
+                        continue
+                    Machine.telemetry.on_binary_telemetry()
+                    data_str = line = ""
+                    if MeticulousConfig[CONFIG_LOGGING][LOGGING_SENSOR_MESSAGES]:
+                        logger.info(parsed_message[1])
+                else:
+                    try:
+                        data_str = data_bytes.decode("utf-8")
+                    except Exception:
+                        logger.info(f"decoding fails, message: {data_bytes}")
+                        Machine.link_stats.record_invalid("undecodable")
+                        continue
+
+                    line = data_str.strip("\r\n")
+                    if MeticulousConfig[CONFIG_LOGGING][LOGGING_SENSOR_MESSAGES]:
+                        logger.info(line)
+
+                    # Telemetry is parsed through the schema registry without splitting
+                    # the line for the match below
+                    parsed_message = MessageRegistry.parse_line(line)
+                    if parsed_message is not None:
+                        telemetry_command = Machine.telemetry.on_csv_telemetry()
+                        if telemetry_command is not None:
+                            Machine.writeStr(telemetry_command)
 
                 # potential message types
                 button_event = None
@@ -368,37 +405,46 @@ class Machine:
                 notify = None
                 is_valid_message = True
 
-                if data_str.startswith("rst:0x") and all(
-                    boot_check in data_str
-                    for boot_check in ["boot:0x", " (SPI_FAST_FLASH_BOOT)"]
-                ):
+                if parsed_message is not None:
+                    message_prefix, record = parsed_message
+                    if record is None:
+                        Machine.link_stats.record_invalid(message_prefix)
+                    else:
+                        Machine.link_stats.record_valid(message_prefix)
+                    if message_prefix == SHOT_DATA_SCHEMA.prefix:
+                        Machine.link_stats.record_telemetry(read_at)
+                        data = record
+                    elif message_prefix == SENSOR_DATA_SCHEMA.prefix:
+                        sensor = record
+                    data_str_sensors = None
+                    detected = None
+                else:
+                    data_str_sensors = line.split(",")
+                    # Telemetry is never part of a crash report or a boot banner
+                    detected = Machine.crash_detector.feed(line)
+
+                if detected == CrashDetector.CRASH:
+                    Machine._publish_event(
+                        MachineEventKind.ESP_CRASH, Machine.crash_detector.last_crash
+                    )
+                elif detected == CrashDetector.BOOT:
                     Machine.reset_count += 1
+                    Machine.telemetry.reset()
                     Machine.startTime = time.time()
                     Machine.esp_info = None
                     info_requested = False
                     Machine.infoReady = False
                     Machine.profileReady = False
                     is_valid_message = False
-                    collect_tracing_info = False
 
                 if Machine.reset_count >= 3:
                     logger.warning("The ESP seems to be resetting, sending update now")
-                    Machine.startUpdate()
+                    # Flashing takes a while, only the ingest waits for it
+                    Machine._stopESPcomm = True
+                    uart.pause()
+                    await Runtime.run_blocking(Machine.startUpdate)
                     Machine.reset_count = 0
 
-                if any(
-                    crash_check in data_str.lower()
-                    for crash_check in [
-                        "backtrace",
-                        "guru meditation error",
-                        "register dump",
-                    ]
-                ):
-                    collect_tracing_info = True
-
-                if collect_tracing_info:
-                    ESP_tracing_info.append(data_str)
-
                 if Machine.infoReady and not info_requested and Machine.esp_info is None:
                     logger.info(
                         "Machine has not provided us with a firmware version yet. Requesting now"
@@ -407,6 +453,8 @@ class Machine:
                     info_requested = True
 
                 match (data_str_sensors):
+                    case None:
+                        pass
                     # FIXME: This should be replace in the firmware with an "Event," prefix
                     # for cleanliness
                     case [
@@ -415,12 +463,6 @@ class Machine:
                         button_event = ButtonEventData.from_args(ev)
                     case ["Event", *eventData]:
                         button_event = ButtonEventData.from_args(eventData)
-                    case ["Data", *dataArgs]:
-                        data = ShotData.from_args(dataArgs)
-                    case ["Sensors", colorCodedString]:
-                        sensor = SensorData.from_color_coded_args(colorCodedString)
-                    case ["Sensors", *sensorArgs]:
-                        sensor = SensorData.from_args(sensorArgs)
                     case ["ESPInfo", *infoArgs]:
                         info = ESPInfo.from_args(infoArgs)
                     case ["Notify", *notifyArgs]:
@@ -448,162 +490,27 @@ class Machine:
                                 exc_info=True,
                             )
                     case ["Log", *log_data]:
-
-                        def get_log_items(log_data: list[str]):
-                            for data_str in log_data[2:]:
-                                # data in the form: <key>=<value>
-                                data = data_str.split("=")
-                                if len(data) < 2:
-                                    logger.warning(f"Error parsing ESP log item: {data_str}")
-                                    continue
-                                key = data[0]
-                                value = data[1]
-                                items.setdefault(key, value)
-
-                        # logger.info(data_str.strip("\r\n"))
-                        try:
-                            log_level = log_data[0].lower()
-                            message = log_data[1]
-                            full_message = ",".join(log_data[1:])
-                            items: dict[str, str] = {}
-                            send_to_sentry = False
-
-                            match log_level:
-
-                                case "debug":
-                                    logger.debug(full_message)
-                                case "info":
-                                    logger.info(full_message)
-                                case "warning":
-                                    logger.warning(full_message)
-                                case "error":
-                                    logger.error(
-                                        f"ESP error: {full_message}"
-                                    )  # Sends the error to the backend project in sentry
-                            items_filtered = None
-                            if len(log_data) > 2:
-                                get_log_items(log_data=log_data)
-                                send_to_sentry = items.get("sentry", "false") == "true"
-                                items_filtered = {
-                                    k: v for k, v in items.items() if k != "sentry"
-                                }
-
-                            send_to_sentry = send_to_sentry or log_level == "error"
-
-                            if send_to_sentry:
-                                with sentry_sdk.new_scope() as scope:
-                                    if items_filtered is not None:
-                                        scope.set_context("esp-data", items_filtered)
-                                    scope.set_client(ESPSentryClient)
-                                    if log_level == "error":
-                                        logger.error(full_message)
-                                    else:
-                                        scope.capture_message(
-                                            message=message,
-                                            level=log_level,
-                                        )
-                        except Exception as e:
-                            logger.error(
-                                f"Error '{e}' processing Log from ESP: 'Log,{','.join(log_data)}'",
-                                exc_info=True,
-                            )
+                        MachineBus.publish(Topic.ESP_LOG, log_data)
                     case [*_]:
-                        logger.info(data_str.strip("\r\n"))
+                        logger.info(line)
                         is_valid_message = False
+                        Machine.link_stats.record_invalid("unknown")
+
+                if data_str_sensors is not None and is_valid_message:
+                    Machine.link_stats.record_valid(data_str_sensors[0])
 
                 old_ready = Machine.infoReady
 
                 if data is not None:
-                    Machine.is_idle = data.status == MachineStatus.IDLE
-                    is_purge = data.status == MachineStatus.PURGE
-                    is_retracting = data.status == MachineStatus.RETRACTING
-                    is_preparing = data.status == MachineStatus.CLOSING_VALVE
-                    was_preparing = old_status == MachineStatus.CLOSING_VALVE
-                    is_heating = data.status == MachineStatus.HEATING
-                    is_starting = data.status == MachineStatus.STARTING
-
-                    # A shot started
-                    if was_preparing and data.status != old_status:
-                        time_flag = True
-                        shot_start_time = time.time()
-                        logger.info("shot start_time: {:.1f}".format(shot_start_time))
-                        ShotManager.start()
-                        SoundPlayer.play_event_sound(Sounds.BREWING_START)
-                    elif time_flag:
-                        # A shot could have ended
-                        if Machine.is_idle or is_purge:
-                            time_flag = False
-
-                        # After retracting the shot is always over. No matter what, during retracting we wait for a stable weight
-                        if old_status == MachineStatus.RETRACTING and not is_retracting:
-                            time_flag = False
-                            ShotManager.stop()
-
-                        if is_retracting:
-                            if Machine.stable_start_timestamp is not None:
-                                time_flag = (
-                                    time.time() - Machine.stable_start_timestamp
-                                ) < Machine.stable_time_threshold
-                                if not data.stable_weight:
-                                    Machine.stable_start_timestamp = None
-                            else:
-                                if data.stable_weight:
-                                    Machine.stable_start_timestamp = time.time()
-
-                        if time_flag is False:
-                            now_time = time.time()
-                            if Machine.stable_start_timestamp is not None:
-                                logger.info(
-                                    f"shot ended at {now_time} with a stable weight time of: {now_time - Machine.stable_start_timestamp}s"
-                                )
-                                Machine.stable_start_timestamp = None
-                            else:
-                                logger.info("shot ended with weight unstable")
-                            SoundPlayer.play_event_sound(Sounds.BREWING_END)
-                            ShotManager.stop()
-
-                    if Machine.is_idle and old_status != MachineStatus.IDLE:
+                    transitions = Machine.shot_state.feed(data, Machine.profileReady)
+                    Machine.is_idle = Machine.shot_state.is_idle
+                    if not Machine.shot_state.profile_ready:
                         Machine.profileReady = False
-
-                    if old_status == MachineStatus.IDLE and not Machine.is_idle:
-                        if is_heating or is_preparing or is_retracting or is_starting:
-                            time_passed = 0
-                            profile_time = 0
-
-                    if Machine.profileReady and not Machine.oldProfileReady:
-                        ShotDebugManager.start()
-                    if not Machine.profileReady and Machine.oldProfileReady:
-                        ShotDebugManager.stop()
-
-                    Machine.oldProfileReady = Machine.profileReady
-
-                    if Machine.is_idle and old_status != MachineStatus.IDLE:
-                        SoundPlayer.play_event_sound(Sounds.IDLE)
-
-                    if is_heating and old_status != MachineStatus.HEATING:
-                        time_passed = 0
-                        profile_time = 0
-                        SoundPlayer.play_event_sound(Sounds.HEATING_START)
-
-                    if old_status == MachineStatus.HEATING and not is_heating:
-                        SoundPlayer.play_event_sound(Sounds.HEATING_END)
-
-                    if time_flag:
-                        time_passed = int((time.time() - shot_start_time) * 1000.0)
-                        profile_time = time_passed
-                        if is_retracting:
-                            profile_time = ShotManager.handleExtractionEnd(time_passed)
-                        Machine.data_sensors = data.clone_with_time_and_state(
-                            time_passed, True, profile_time
-                        )
-
-                    else:
-                        Machine.data_sensors = data.clone_with_time_and_state(
-                            time_passed, False, profile_time
-                        )
-
-                    old_status = Machine.data_sensors.status
+                    Machine.data_sensors = data
+                    for transition in transitions:
+                        Machine._publish_transition(transition)
                     Machine.infoReady = True
+                    MachineBus.publish(Topic.SHOT_TICK, Machine.data_sensors)
 
                 if sensor is not None:
 
@@ -612,18 +519,24 @@ class Machine:
                     # ESP sends first "Data" data followed by "Sensors" data, so, by this time, the
                     # Machine.data_sensors must be up to date
 
+                    # The motor check is safety critical and never waits for the bus
                     Machine.stopMotorIfHot(Machine.data_sensors, Machine.sensor_sensors)
-                    ShotDebugManager.handleSensorData(Machine.sensor_sensors)
-                    ShotDebugManager.handleShotData(Machine.data_sensors)
-                    if time_flag:
-                        ShotManager.handleSensorData(Machine.sensor_sensors)
-                        ShotManager.handleShotData(Machine.data_sensors)
+                    MachineBus.publish(
+                        Topic.SENSOR_TICK,
+                        SensorTick(Machine.sensor_sensors, Machine.data_sensors),
+                    )
 
                 if info is not None:
                     Machine.esp_info = info
                     Machine.infoReady = True
                     info_requested = False
                     Machine.firmware_running = Machine._parseVersionString(info.firmwareV)
+                    MachineBus.publish(Topic.ESP_INFO, info)
+
+                    telemetry_command = Machine.telemetry.on_info(info)
+                    if telemetry_command is not None:
+                        Machine.writeStr(telemetry_command)
+                    Machine.setTelemetryRate(info)
 
                     backend_partial_retraction = float(
                         MeticulousConfig[CONFIG_USER][PROFILE_PARTIAL_RETRACTION]
@@ -683,7 +596,10 @@ class Machine:
                         info_string = f"Firmware {Machine.firmware_running.get('Release')}-{Machine.firmware_running['ExtraCommits']} is outdated, upgrading"
                         logger.info(info_string)
 
-                        Machine.startUpdate()
+                        # Flashing takes a while, only the ingest waits for it
+                        Machine._stopESPcomm = True
+                        uart.pause()
+                        await Runtime.run_blocking(Machine.startUpdate)
 
                 if button_event is not None:
                     if (
@@ -692,7 +608,7 @@ class Machine:
                     ):
                         logger.debug(f"Button Event recieved: {button_event}")
 
-                    await Machine._sio.emit("button", button_event.to_sio())
+                    MachineBus.publish(Topic.BUTTON, button_event)
 
                 # FIXME this should be a callback to the frontends in the future
                 if (
@@ -727,6 +643,9 @@ class Machine:
                     )
                     NotificationManager.add_notification(Machine._espNotification)
 
+                if is_valid_message:
+                    received_valid_message = True
+
             # healthcheck:
             # Notify Sentry if
             # ESP has not sent a valid message in the last 500ms
@@ -741,7 +660,7 @@ class Machine:
 
             now = time.monotonic()
 
-            if data_bytes is not None and is_valid_message:
+            if received_valid_message:
                 previous_valid_message_timestamp = now
                 if Machine.esp_restart_request:
                     logger.debug("clearing Machine.esp_restart_request flag")
@@ -754,14 +673,21 @@ class Machine:
                 if AlarmManager.is_alarm_set(AlarmType.ESP_RESTART) is None:
                     # notify sentry
                     with sentry_sdk.new_scope() as scope:
-                        if len(ESP_tracing_info) > 0:
-                            tracing_info = "\n".join(ESP_tracing_info)
-                            scope.set_extra("Tracing Info", tracing_info)
+                        crash = Machine.crash_detector.take_unreported()
+                        if crash is not None:
+                            scope.set_extra("Tracing Info", crash.text())
+                            scope.set_context(
+                                "esp-crash",
+                                {
+                                    "kind": crash.kind,
+                                    "backtrace": " ".join(crash.backtrace),
+                                    "reset_reason": crash.reset_reason,
+                                },
+                            )
                         sentry_sdk.capture_message("ESP has restarted unexpectedly", "critical")
                     AlarmManager.set_alarm(
                         AlarmType.ESP_RESTART, end_time=None, force=False, quiet=True
                     )
-                    ESP_tracing_info = []
 
             if now - previous_valid_message_timestamp > 0.5 and not Machine.esp_restart_request:
                 if AlarmManager.is_alarm_set(AlarmType.ESP_DISCONNECTED) is None:
@@ -774,6 +700,140 @@ class Machine:
                         quiet=True,
                     )
 
+    @staticmethod
+    def _publish_event(kind: str, value=None):
+        MachineBus.publish(Topic.MACHINE_EVENT, MachineEvent(kind, value))
+
+    @staticmethod
+    def _publish_transition(transition: MachineEvent):
+        match transition.kind:
+            case ShotEvent.SHOT_START:
+                Machine._publish_event(MachineEventKind.SHOT_START)
+                Machine._publish_event(MachineEventKind.SOUND, Sounds.BREWING_START)
+            case ShotEvent.SHOT_END:
+                Machine._publish_event(MachineEventKind.SOUND, Sounds.BREWING_END)
+                Machine._publish_event(MachineEventKind.SHOT_END)
+            case ShotEvent.EXTRACTION_END:
+                Machine._publish_event(MachineEventKind.EXTRACTION_END, transition.value)
+            case ShotEvent.DEBUG_START:
+                Machine._publish_event(MachineEventKind.DEBUG_START)
+            case ShotEvent.DEBUG_END:
+                Machine._publish_event(MachineEventKind.DEBUG_END)
+            case ShotEvent.IDLE:
+                Machine._publish_event(MachineEventKind.SOUND, Sounds.IDLE)
+            case ShotEvent.HEATING_START:
+                Machine._publish_event(MachineEventKind.SOUND, Sounds.HEATING_START)
+            case ShotEvent.HEATING_END:
+                Machine._publish_event(MachineEventKind.SOUND, Sounds.HEATING_END)
+
+    @staticmethod
+    def setTelemetryRate(info: ESPInfo):
+        if not info.supports(TELEMETRY_RATE_CAPABILITY):
+            Machine.telemetry_rate_hz = DEFAULT_TELEMETRY_RATE
+            return
+        rate = MeticulousConfig[CONFIG_USER][TELEMETRY_RATE]
+        logger.info(f"Requesting telemetry at {rate} Hz")
+        Machine.writeStr(telemetry_rate_command(rate))
+        Machine.telemetry_rate_hz = rate
+
+    @staticmethod
+    def _record_shot_samples(samples: list[tuple]):
+        for shot, sensors in samples:
+            ShotManager.handleSensorData(sensors)
+            ShotManager.handleShotData(shot)
+
+    @staticmethod
+    def _record_shot(topic: Topic, message):
+        if topic == Topic.SENSOR_TICK:
+            if message.shot.is_extracting:
+                Machine._record_shot_samples(
+                    Machine._shot_decimator.add(message.shot, message.sensors)
+                )
+            return
+
+        match message.kind:
+            case MachineEventKind.SHOT_START:
+                # Shot files are written at their own rate, the debug file gets everything
+                rate = decimation_rate(
+                    MeticulousConfig[CONFIG_USER][TELEMETRY_SHOT_RATE],
+                    Machine.telemetry_rate_hz,
+                )
+                Machine._shot_decimator = Decimator(
+                    rate, MeticulousConfig[CONFIG_USER][TELEMETRY_DECIMATION]
+                )
+                ShotManager.start()
+            case MachineEventKind.EXTRACTION_END:
+                ShotManager.handleExtractionEnd(message.value)
+            case MachineEventKind.SHOT_END:
+                Machine._record_shot_samples(Machine._shot_decimator.flush())
+                ShotManager.stop()
+
+    @staticmethod
+    def _record_debug_shot(topic: Topic, message):
+        if topic == Topic.SENSOR_TICK:
+            ShotDebugManager.handleSensorData(message.sensors)
+            ShotDebugManager.handleShotData(message.shot)
+            return
+
+        match message.kind:
+            case MachineEventKind.DEBUG_START:
+                ShotDebugManager.start()
+            case MachineEventKind.DEBUG_END:
+                ShotDebugManager.stop()
+            case MachineEventKind.ESP_CRASH:
+                ShotDebugManager.handleCrash(message.value)
+
+    @staticmethod
+    def _play_sounds(topic: Topic, message: MachineEvent):
+        if message.kind == MachineEventKind.SOUND:
+            # Switching themes reads the theme from disk
+            Runtime.submit(SoundPlayer.play_event_sound, message.value)
+
+    @staticmethod
+    async def _emit_button(topic: Topic, button_event: ButtonEventData):
+        await Machine._sio.emit("button", button_event.to_sio())
+
+    @staticmethod
+    def _subscribe_to_bus():
+        # Shots must not lose ticks and need them in order with their start / end
+        MachineBus.subscribe(
+            "shot",
+            [Topic.SENSOR_TICK, Topic.MACHINE_EVENT],
+            Machine._record_shot,
+            OverflowPolicy.BLOCK,
+            capacity=512,
+        )
+        MachineBus.subscribe(
+            "debug-shot",
+            [Topic.SENSOR_TICK, Topic.MACHINE_EVENT],
+            Machine._record_debug_shot,
+            OverflowPolicy.BLOCK,
+            capacity=512,
+        )
+        # Quick side effects run on the loop, their blocking parts go to the executor
+        MachineBus.subscribe(
+            "sounds", [Topic.MACHINE_EVENT], Machine._play_sounds, capacity=16, on_loop=True
+        )
+        MachineBus.subscribe(
+            "button", [Topic.BUTTON], Machine._emit_button, capacity=64, on_loop=True
+        )
+        MachineBus.subscribe(
+            "broadcast",
+            [Topic.SENSOR_TICK],
+            lambda topic, tick: Machine.broadcast_telemetry.add(tick.shot, tick.sensors),
+            capacity=256,
+            on_loop=True,
+        )
+        MachineBus.subscribe(
+            "esp-log",
+            [Topic.ESP_LOG],
+            lambda topic, log_data: Machine.esp_log.submit(log_data),
+            capacity=256,
+            on_loop=True,
+        )
+        Machine.esp_log.start()
+
+    @staticmethod
     def stopMotorIfHot(_shotData: ShotData, _sensorData: SensorData):
         from monitoring.motor_power_monitoring import MAX_ENERGY_ALLOWED
 
@@ -893,11 +953,7 @@ class Machine:
             time_str = f"{int(time_ms*1000)} ns"
         logger.info(f"Streaming profile to ESP32 took {time_str}")
         Machine.profileReady = True
-        while True:
-            if ShotDebugManager._current_data is not None:
-                break
-        with ShotDebugManager.clear_current_data_lock:
-            ShotDebugManager._current_data.nodeJSON = json_obj
+        ShotDebugManager.setNodeJSON(json_obj)
 
     def setSerial(color, serial, batch_number, build_date):
         write_request = "nvs_request,write,"
@@ -0,0 +1,327 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+
+from esp_serial.data import SensorData, ShotData
+from log import MeticulousLogger
+from named_thread import NamedThread
+from runtime import Runtime
+
+logger = MeticulousLogger.getLogger(__name__)
+
+
+class Topic(Enum):
+    # ShotData, published for every "Data" message after time and state are stamped
+    SHOT_TICK = "shot_tick"
+    # SensorTick, published for every "Sensors" message together with the latest ShotData
+    SENSOR_TICK = "sensor_tick"
+    # ButtonEventData
+    BUTTON = "button"
+    # list[str], the arguments of an ESP "Log" message
+    ESP_LOG = "esp_log"
+    # ESPInfo
+    ESP_INFO = "esp_info"
+    # MachineEvent, changes of the machine detected while parsing the ESP stream
+    MACHINE_EVENT = "machine_event"
+
+
+class OverflowPolicy(Enum):
+    # Discard the oldest queued message to make room for the new one
+    DROP_OLDEST = "drop_oldest"
+    # Only keep the latest message of every topic, the order between topics is lost
+    COALESCE_LATEST = "coalesce_latest"
+    # Never drop a message, the queue grows past its capacity when the subscriber falls
+    # behind. Publishing runs on the shared loop and never waits, the subscriber applies
+    # any backpressure on its own thread.
+    BLOCK = "block"
+
+
+class MachineEventKind:
+    SHOT_START = "shot_start"
+    SHOT_END = "shot_end"
+    EXTRACTION_END = "extraction_end"
+    DEBUG_START = "debug_start"
+    DEBUG_END = "debug_end"
+    SOUND = "sound"
+    # CrashRecord, the ESP started printing a crash report
+    ESP_CRASH = "esp_crash"
+
+
+@dataclass(slots=True)
+class SensorTick:
+    sensors: SensorData
+    shot: ShotData
+
+
+@dataclass(slots=True)
+class MachineEvent:
+    kind: str
+    value: object = None
+
+
+@dataclass(slots=True)
+class _Envelope:
+    topic: Topic
+    payload: object
+    published: float
+
+
+@dataclass
+class SubscriberStats:
+    published: int = 0
+    delivered: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+    errors: int = 0
+    max_depth: int = 0
+    # Messages queued while the queue was already at capacity
+    backlogged: int = 0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    total_lag: float = 0.0
+
+    def to_dict(self):
+        return {
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "max_depth": self.max_depth,
+            "backlogged": self.backlogged,
+            "last_lag": round(self.last_lag, 4),
+            "max_lag": round(self.max_lag, 4),
+            "average_lag": (
+                round(self.total_lag / self.delivered, 4) if self.delivered else 0.0
+            ),
+        }
+
+
+class Subscription:
+    """A subscriber of the bus with its own queue.
+
+    The queue relies on the atomic `append` and `popleft` of `deque` so publishing
+    never takes a lock. Subscribers doing blocking work get a dispatcher thread of
+    their own, the callback is run on it and coroutines returned by it are run on the
+    shared loop (see runtime.py) in the order they were returned, or on a loop private
+    to the thread if there is no shared loop.
+
+    Subscribers created `on_loop` must not block: they are called on the shared loop
+    once the publisher yields to it, right away if there is no shared loop.
+    """
+
+    DRAIN_POLL_INTERVAL = 0.005
+
+    def __init__(
+        self,
+        name: str,
+        topics,
+        callback,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        capacity: int = 64,
+        on_loop: bool = False,
+    ) -> None:
+        self.name = name
+        self.topics = frozenset(topics)
+        self.callback = callback
+        self.policy = policy
+        self.capacity = capacity
+        self.on_loop = on_loop
+        self.stats = SubscriberStats()
+
+        if policy == OverflowPolicy.DROP_OLDEST:
+            self._queue: deque[_Envelope] = deque(maxlen=capacity)
+        else:
+            self._queue: deque[_Envelope] = deque()
+        self._latest: dict[Topic, _Envelope] = {}
+        self._wakeup = threading.Event()
+        self._running = True
+        self._behind = False
+        self._loop: asyncio.AbstractEventLoop = None
+        self._scheduled = False
+        self._thread = None
+        if not on_loop:
+            self._thread = NamedThread(f"Bus-{name}"[:15], target=self._run, daemon=True)
+            self._thread.start()
+
+    @property
+    def depth(self):
+        return len(self._queue) + len(self._latest)
+
+    def offer(self, envelope: _Envelope):
+        stats = self.stats
+        stats.published += 1
+        match self.policy:
+            case OverflowPolicy.DROP_OLDEST:
+                if len(self._queue) >= self.capacity:
+                    stats.dropped += 1
+                self._queue.append(envelope)
+            case OverflowPolicy.COALESCE_LATEST:
+                if envelope.topic in self._latest:
+                    stats.coalesced += 1
+                self._latest[envelope.topic] = envelope
+            case OverflowPolicy.BLOCK:
+                if len(self._queue) >= self.capacity:
+                    stats.backlogged += 1
+                    if not self._behind:
+                        self._behind = True
+                        logger.warning(
+                            f"Subscriber {self.name} fell behind by {len(self._queue)} messages"
+                        )
+                self._queue.append(envelope)
+
+        stats.max_depth = max(stats.max_depth, self.depth)
+        if self.on_loop:
+            self._schedule()
+        else:
+            self._wakeup.set()
+
+    def _schedule(self):
+        if self._scheduled:
+            return
+        loop = Runtime.loop()
+        if loop is None or loop.is_closed():
+            self._deliver_queued()
+            return
+        self._scheduled = True
+        if Runtime.in_loop():
+            loop.call_soon(self._deliver_queued)
+        else:
+            loop.call_soon_threadsafe(self._deliver_queued)
+
+    def _deliver_queued(self):
+        # Cleared first, messages offered while delivering schedule another round
+        self._scheduled = False
+        envelope = self._next()
+        while envelope is not None:
+            self._deliver(envelope)
+            envelope = self._next()
+
+    def _next(self):
+        if self._queue:
+            return self._queue.popleft()
+        if self._behind:
+            self._behind = False
+            logger.info(f"Subscriber {self.name} caught up")
+        for topic in list(self._latest.keys()):
+            envelope = self._latest.pop(topic, None)
+            if envelope is not None:
+                return envelope
+        return None
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self._deliver_queued()
+
+    def _deliver(self, envelope: _Envelope):
+        stats = self.stats
+        lag = time.monotonic() - envelope.published
+        stats.last_lag = lag
+        stats.max_lag = max(stats.max_lag, lag)
+        stats.total_lag += lag
+        try:
+            result = self.callback(envelope.topic, envelope.payload)
+            if asyncio.iscoroutine(result) and Runtime.loop() is not None:
+                Runtime.spawn(result, f"bus-{self.name}")
+            elif asyncio.iscoroutine(result):
+                if self._loop is None:
+                    self._loop = asyncio.new_event_loop()
+                self._loop.run_until_complete(result)
+        except Exception as e:
+            stats.errors += 1
+            logger.error(
+                f"Subscriber {self.name} failed to handle {envelope.topic.value}: {e}",
+                exc_info=True,
+            )
+        finally:
+            stats.delivered += 1
+
+    def drain(self, timeout: float = 1.0):
+        """Waits until everything queued so far was handled"""
+        deadline = time.monotonic() + timeout
+        stats = self.stats
+        while stats.delivered < stats.published - stats.dropped - stats.coalesced:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(Subscription.DRAIN_POLL_INTERVAL)
+        return True
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+
+
+class MachineBus:
+    """In-process publish/subscribe between the serial ingest and everything
+    that reacts to the machine.
+
+    The serial ingest publishes every parsed message once and returns to parsing
+    right away. Quick side effects are delivered on the shared loop after it, and
+    subscribers doing blocking work handle their messages on their own thread, so a
+    slow consumer only ever delays itself. Safety critical reactions are not routed
+    through the bus but handled by the publisher before publishing.
+    """
+
+    _subscriptions: dict[str, Subscription] = {}
+    _by_topic: dict[Topic, tuple[Subscription, ...]] = {}
+
+    @staticmethod
+    def subscribe(
+        name: str,
+        topics,
+        callback,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        capacity: int = 64,
+        on_loop: bool = False,
+    ) -> Subscription:
+        if name in MachineBus._subscriptions:
+            raise ValueError(f"Subscriber {name} already exists")
+
+        subscription = Subscription(name, topics, callback, policy, capacity, on_loop)
+        MachineBus._subscriptions[name] = subscription
+        MachineBus._rebuild_topics()
+        return subscription
+
+    @staticmethod
+    def unsubscribe(name: str):
+        subscription = MachineBus._subscriptions.pop(name, None)
+        if subscription is None:
+            return
+        MachineBus._rebuild_topics()
+        subscription.stop()
+
+    @staticmethod
+    def _rebuild_topics():
+        # Replaced as a whole so publishers never see a half updated mapping
+        MachineBus._by_topic = {
+            topic: tuple(s for s in MachineBus._subscriptions.values() if topic in s.topics)
+            for topic in Topic
+        }
+
+    @staticmethod
+    def publish(topic: Topic, payload):
+        subscribers = MachineBus._by_topic.get(topic)
+        if not subscribers:
+            return
+        envelope = _Envelope(topic, payload, time.monotonic())
+        for subscription in subscribers:
+            subscription.offer(envelope)
+
+    @staticmethod
+    def stats():
+        return {
+            name: {
+                "topics": sorted(topic.value for topic in subscription.topics),
+                "policy": subscription.policy.value,
+                "capacity": subscription.capacity,
+                "on_loop": subscription.on_loop,
+                "depth": subscription.depth,
+                **subscription.stats.to_dict(),
+            }
+            for name, subscription in MachineBus._subscriptions.items()
+        }
@@ -4,12 +4,10 @@ import json
 import base64
 import pyqrcode
 import io
-import queue
-import asyncio
 from datetime import datetime
 
 from sounds import SoundPlayer, Sounds
-from named_thread import NamedThread
+from runtime import Runtime
 from config import MeticulousConfig, CONFIG_SYSTEM, NOTIFICATION_KEEPALIVE
 
 from log import MeticulousLogger
@@ -86,39 +84,26 @@ class Notification:
 class NotificationManager:
     _notifications = []
     _sio = None
-    _queue = queue.Queue()
-    _thread = None
+    # Notifications created before socket.io is available
+    _pending = []
 
     def init(sio):
         NotificationManager._sio = sio
-        NotificationManager._thread = NamedThread(
-            "NotifyLoop", target=NotificationManager._notification_loop
-        )
-        NotificationManager._thread.start()
-
-    def _notification_loop():
-        """
-        This function runs an asyncio event loop in a new process.
-        It continuously checks for new items in the queue and processes them.
-        """
-
-        async def process_queue():
-            while True:
-                try:
-                    # Try to get an item from the queue allowing blocking
-                    notification: Notification = NotificationManager._queue.get()
-                except queue.Empty:
-                    # If the queue is empty, wait for a short period before trying again
-                    await asyncio.sleep(0.1)
-                else:
-                    # Emit the notification over socketIO as json
-                    await NotificationManager._sio.emit("notification", notification.to_json())
-                    logger.info(f"send notification: {notification.to_json()}")
-
-        # Create and run the asyncio event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(process_queue())
+        pending = NotificationManager._pending
+        NotificationManager._pending = []
+        for notification in pending:
+            NotificationManager._send(notification)
+
+    def _send(notification: Notification):
+        if NotificationManager._sio is None:
+            NotificationManager._pending.append(notification)
+            return
+        Runtime.spawn(NotificationManager._emit(notification), "notification")
+
+    async def _emit(notification: Notification):
+        # Emit the notification over socketIO as json
+        await NotificationManager._sio.emit("notification", notification.to_json())
+        logger.info(f"send notification: {notification.to_json()}")
 
     def acknowledge_notification(notification_id, response):
         for notification in NotificationManager.get_unacknowledged_notifications():
@@ -139,7 +124,7 @@ class NotificationManager:
 
         notification.acknowledged = False
         NotificationManager._notifications.append(notification)
-        NotificationManager._queue.put(notification)
+        NotificationManager._send(notification)
 
         if not updating:
             logger.info("Notification created")
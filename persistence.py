@@ -0,0 +1,274 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from log import MeticulousLogger
+from named_thread import NamedThread
+
+logger = MeticulousLogger.getLogger(__name__)
+
+
+class JobPriority(IntEnum):
+    # Lower values run first
+    SHOT = 0
+    DEBUG_SHOT = 1
+    CLEANUP = 2
+    BACKFILL = 3
+
+
+class PersistenceQueueFull(Exception):
+    pass
+
+
+@dataclass(order=True)
+class _Job:
+    priority: JobPriority
+    sequence: int
+    name: str = field(compare=False)
+    key: str = field(compare=False)
+    func: callable = field(compare=False)
+    args: tuple = field(compare=False)
+    kwargs: dict = field(compare=False)
+    submitted: float = field(compare=False)
+    future: Future = field(compare=False, default_factory=Future)
+
+
+class _Latency:
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = None
+
+    def add(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.last_ms = ms
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": self.total_ms / self.count if self.count else None,
+            "max_ms": self.max_ms,
+            "last_ms": self.last_ms,
+        }
+
+
+class PersistenceService:
+    """The single thread writing shots and debug shots to disk and the database.
+
+    Jobs are queued by priority and run one at a time, so back to back shots never
+    compress or write to SQLite concurrently. A job submitted with the `key` of a
+    job still waiting replaces it. When the queue is full a job pushes out a waiting
+    one of lower priority, or blocks the caller until there is room.
+
+    Until `start()` (and after `shutdown()`) jobs run right away in the calling
+    thread, the same way `Runtime.spawn()` runs coroutines before the loop exists.
+    """
+
+    MAX_JOBS = 8
+    # Seconds a caller waits for room in a full queue
+    SUBMIT_TIMEOUT = 30.0
+
+    clock = time.monotonic
+
+    _condition = threading.Condition()
+    _queue: list[_Job] = []
+    _waiting: dict[str, _Job] = {}
+    _sequence = itertools.count()
+    _thread: NamedThread = None
+    _running = False
+    _busy: _Job = None
+
+    _counters = dict.fromkeys(
+        ("submitted", "completed", "failed", "coalesced", "dropped", "rejected"), 0
+    )
+    _max_depth = 0
+    _wait_latency = {priority: _Latency() for priority in JobPriority}
+    _run_latency = {priority: _Latency() for priority in JobPriority}
+
+    @staticmethod
+    def start():
+        with PersistenceService._condition:
+            if PersistenceService._running:
+                return
+            PersistenceService._running = True
+            PersistenceService._thread = NamedThread(
+                "Persist", target=PersistenceService._work, daemon=True
+            )
+            PersistenceService._thread.start()
+        logger.info("Persistence service started")
+
+    @staticmethod
+    def running() -> bool:
+        return PersistenceService._running
+
+    @staticmethod
+    def submit(
+        priority: JobPriority, func, *args, key: str = None, timeout: float = None, **kwargs
+    ) -> Future:
+        """Queues `func(*args, **kwargs)` and returns a future for its result.
+
+        A full queue that holds no job of lower priority blocks for up to `timeout`
+        seconds (SUBMIT_TIMEOUT by default), after which the returned future fails
+        with PersistenceQueueFull. Jobs pushed out of the queue are cancelled.
+        """
+        cls = PersistenceService
+        if timeout is None:
+            timeout = cls.SUBMIT_TIMEOUT
+        # The worker must never wait for itself
+        if threading.current_thread() is cls._thread:
+            timeout = 0
+        name = key or getattr(func, "__qualname__", "job")
+
+        with cls._condition:
+            deadline = cls.clock() + timeout
+            while cls._running:
+                waiting = cls._waiting.get(key) if key is not None else None
+                if waiting is not None:
+                    waiting.func, waiting.args, waiting.kwargs = func, args, kwargs
+                    cls._counters["coalesced"] += 1
+                    return waiting.future
+
+                if len(cls._queue) < cls.MAX_JOBS:
+                    break
+                lowest = max(cls._queue)
+                if lowest.priority > priority:
+                    cls._remove(lowest)
+                    lowest.future.cancel()
+                    cls._counters["dropped"] += 1
+                    logger.warning(f"Persistence queue full, dropped {lowest.name}")
+                    break
+
+                remaining = deadline - cls.clock()
+                if remaining <= 0:
+                    cls._counters["rejected"] += 1
+                    logger.error(f"Persistence queue full, rejected {name}")
+                    future = Future()
+                    future.set_exception(PersistenceQueueFull(f"Queue full, rejected {name}"))
+                    return future
+                cls._condition.wait(remaining)
+
+            if cls._running:
+                job = _Job(
+                    priority, next(cls._sequence), name, key, func, args, kwargs, cls.clock()
+                )
+                heapq.heappush(cls._queue, job)
+                if key is not None:
+                    cls._waiting[key] = job
+                cls._counters["submitted"] += 1
+                cls._max_depth = max(cls._max_depth, len(cls._queue))
+                cls._condition.notify_all()
+                return job.future
+
+        job = _Job(priority, next(cls._sequence), name, key, func, args, kwargs, cls.clock())
+        cls._execute(job)
+        return job.future
+
+    @staticmethod
+    def _remove(job: _Job):
+        PersistenceService._queue.remove(job)
+        heapq.heapify(PersistenceService._queue)
+        if PersistenceService._waiting.get(job.key) is job:
+            del PersistenceService._waiting[job.key]
+
+    @staticmethod
+    def _work():
+        cls = PersistenceService
+        while True:
+            with cls._condition:
+                while not cls._queue and cls._running:
+                    cls._condition.wait()
+                if not cls._queue:
+                    break
+                job = heapq.heappop(cls._queue)
+                if cls._waiting.get(job.key) is job:
+                    del cls._waiting[job.key]
+                cls._busy = job
+                # There is room for blocked submitters again
+                cls._condition.notify_all()
+
+            cls._execute(job)
+
+            with cls._condition:
+                cls._busy = None
+                cls._condition.notify_all()
+
+    @staticmethod
+    def _execute(job: _Job):
+        cls = PersistenceService
+        if not job.future.set_running_or_notify_cancel():
+            return
+        started = cls.clock()
+        try:
+            result = job.func(*job.args, **job.kwargs)
+        except Exception as e:
+            logger.error(f"Persistence job {job.name} failed", exc_info=e)
+            outcome = "failed"
+            job.future.set_exception(e)
+        else:
+            outcome = "completed"
+            job.future.set_result(result)
+        finished = cls.clock()
+
+        with cls._condition:
+            cls._counters[outcome] += 1
+            cls._wait_latency[job.priority].add((started - job.submitted) * 1000)
+            cls._run_latency[job.priority].add((finished - started) * 1000)
+
+    @staticmethod
+    def shutdown(timeout: float = 30.0) -> bool:
+        """Stops taking jobs and waits for the queued ones to be written.
+
+        Returns False if the queue did not drain within `timeout` seconds.
+        """
+        with PersistenceService._condition:
+            PersistenceService._running = False
+            PersistenceService._condition.notify_all()
+            thread = PersistenceService._thread
+            pending = len(PersistenceService._queue)
+        if thread is None:
+            return True
+
+        logger.info(f"Persistence service stopping, draining {pending} jobs")
+        thread.join(timeout)
+        if thread.is_alive():
+            logger.error("Persistence service did not drain in time")
+            return False
+        PersistenceService._thread = None
+        logger.info("Persistence service stopped")
+        return True
+
+    @staticmethod
+    def stats() -> dict:
+        cls = PersistenceService
+        with cls._condition:
+            now = cls.clock()
+            return {
+                "running": cls._running,
+                "depth": len(cls._queue),
+                "max_depth": cls._max_depth,
+                "capacity": cls.MAX_JOBS,
+                "busy": cls._busy.name if cls._busy is not None else None,
+                "pending": [
+                    {
+                        "name": job.name,
+                        "priority": job.priority.name.lower(),
+                        "age_ms": (now - job.submitted) * 1000,
+                    }
+                    for job in sorted(cls._queue)
+                ],
+                **cls._counters,
+                "latency": {
+                    priority.name.lower(): {
+                        "wait": cls._wait_latency[priority].to_dict(),
+                        "run": cls._run_latency[priority].to_dict(),
+                    }
+                    for priority in JobPriority
+                },
+            }
@@ -4,7 +4,6 @@ import os
 import shutil
 import urllib.parse
 from dataclasses import dataclass
-from named_thread import NamedThread
 import time
 import uuid
 from enum import Enum
@@ -21,10 +20,10 @@ from config import (
     PROFILE_LAST,
     PROFILE_ORDER,
 )
-import asyncio
 from log import MeticulousLogger
 from machine import Machine
 from profile_preprocessor import ProfilePreprocessor
+from runtime import Runtime
 from api.alarms import AlarmManager, AlarmType
 from images.notificationImages.base64 import WARNING_TRIANGLE_IMAGE
 import math
@@ -77,8 +76,6 @@ class ProfileManager:
     _profile_default_images = []
     _profile_default_images_accent_colors = {}
     _sio: socketio.AsyncServer = None
-    _loop: asyncio.AbstractEventLoop = None
-    _thread: NamedThread = None
     _last_profile_changes = []
     _schema = None
     _profile_hover: ProfileHover = ProfileHover()
@@ -86,15 +83,6 @@ class ProfileManager:
     def init(sio: socketio.AsyncServer):
         ProfileManager._sio = sio
 
-        ProfileManager._loop = asyncio.new_event_loop()
-
-        def start_event_loop() -> None:
-            asyncio.set_event_loop(ProfileManager._loop)
-            ProfileManager._loop.run_forever()
-
-        ProfileManager._thread = NamedThread("ProfileManager", target=start_event_loop)
-        ProfileManager._thread.start()
-
         if not os.path.exists(PROFILE_PATH):
             os.makedirs(PROFILE_PATH)
 
@@ -152,8 +140,8 @@ class ProfileManager:
         change_id: Optional[str] = None,
     ) -> None:
 
-        if not ProfileManager._loop:
-            logger.warning("No event loop is running")
+        if not ProfileManager._sio:
+            logger.warning("No socket.io server to emit profile events to")
             return
 
         payload = {"change": change.value}
@@ -165,7 +153,7 @@ class ProfileManager:
         async def emit() -> None:
             await ProfileManager._sio.emit("profile", payload)
 
-        asyncio.run_coroutine_threadsafe(emit(), ProfileManager._loop)
+        Runtime.spawn(emit(), "profile-event")
 
     def _set_last_profile(profile) -> None:
         last_profile = {"load_time": time.time(), "profile": profile}
@@ -309,10 +297,7 @@ class ProfileManager:
                 type="focus",
                 from_="dial",
             )
-            asyncio.run_coroutine_threadsafe(
-                ProfileManager._async_emit_profile_hover(),
-                ProfileManager._loop,
-            )
+            Runtime.spawn(ProfileManager._async_emit_profile_hover(), "profile-hover")
 
         return {"profile": data, "change_id": change_id}
 
@@ -412,10 +397,7 @@ class ProfileManager:
             type="focus",
             from_="dial",
         )
-        asyncio.run_coroutine_threadsafe(
-            ProfileManager._async_emit_profile_hover(),
-            ProfileManager._loop,
-        )
+        Runtime.spawn(ProfileManager._async_emit_profile_hover(), "profile-hover")
 
         return data
 
@@ -0,0 +1,220 @@
+import math
+from collections import deque
+
+from esp_serial.data import ShotData
+
+
+class RollingWindow:
+    """Mean, variance, slope, min and max of the latest `size` samples.
+
+    Adding a sample is O(1): running sums are updated with the sample entering and
+    the one leaving the window, min and max are kept in monotonic queues. The sums
+    are rebuilt from the samples every RESYNC additions so float error can't
+    accumulate. NaN samples are ignored.
+
+    The slope is the least squares slope over the times passed to `push()`, in
+    value per unit of time, or per sample if no times are given.
+    """
+
+    RESYNC = 1024
+
+    def __init__(self, size: int) -> None:
+        if size < 1:
+            raise ValueError("The window needs room for at least one sample")
+        self.size = size
+        self._values = deque()
+        self._times = deque()
+        # Sample times are stored relative to the first one to keep the sums small
+        self._origin = None
+        self._sum = 0.0
+        self._sum_squares = 0.0
+        self._sum_t = 0.0
+        self._sum_tt = 0.0
+        self._sum_ty = 0.0
+        # (sequence, value) with increasing / decreasing values
+        self._min = deque()
+        self._max = deque()
+        self._sequence = 0
+        self._pushes = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @property
+    def full(self) -> bool:
+        return len(self._values) == self.size
+
+    def push(self, value: float, t: float = None):
+        """Adds a sample, returns the one pushed out of the window if any"""
+        if value is None or math.isnan(value):
+            return None
+        if t is None:
+            t = self._sequence
+        if self._origin is None:
+            self._origin = t
+        t -= self._origin
+
+        evicted = None
+        if len(self._values) == self.size:
+            evicted = self._evict()
+
+        self._values.append(value)
+        self._times.append(t)
+        self._sum += value
+        self._sum_squares += value * value
+        self._sum_t += t
+        self._sum_tt += t * t
+        self._sum_ty += t * value
+
+        sequence = self._sequence
+        self._sequence += 1
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((sequence, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((sequence, value))
+
+        self._pushes += 1
+        if self._pushes % self.RESYNC == 0:
+            self._resync()
+        return evicted
+
+    def _evict(self) -> float:
+        value = self._values.popleft()
+        t = self._times.popleft()
+        self._sum -= value
+        self._sum_squares -= value * value
+        self._sum_t -= t
+        self._sum_tt -= t * t
+        self._sum_ty -= t * value
+
+        oldest = self._sequence - self.size
+        if self._min[0][0] == oldest:
+            self._min.popleft()
+        if self._max[0][0] == oldest:
+            self._max.popleft()
+        return value
+
+    def _resync(self):
+        # Moves the time origin to the oldest sample and recomputes the sums
+        shift = self._times[0]
+        self._origin += shift
+        self._times = deque(t - shift for t in self._times)
+        self._sum = math.fsum(self._values)
+        self._sum_squares = math.fsum(value * value for value in self._values)
+        self._sum_t = math.fsum(self._times)
+        self._sum_tt = math.fsum(t * t for t in self._times)
+        self._sum_ty = math.fsum(t * value for t, value in zip(self._times, self._values))
+
+    def clear(self):
+        self.__init__(self.size)
+
+    @property
+    def mean(self) -> float | None:
+        if not self._values:
+            return None
+        return self._sum / len(self._values)
+
+    @property
+    def variance(self) -> float | None:
+        if not self._values:
+            return None
+        mean = self._sum / len(self._values)
+        return max(self._sum_squares / len(self._values) - mean * mean, 0.0)
+
+    @property
+    def stddev(self) -> float | None:
+        variance = self.variance
+        return None if variance is None else math.sqrt(variance)
+
+    @property
+    def slope(self) -> float | None:
+        n = len(self._values)
+        if n < 2:
+            return None
+        denominator = n * self._sum_tt - self._sum_t * self._sum_t
+        if denominator <= 0:
+            return None
+        return (n * self._sum_ty - self._sum_t * self._sum) / denominator
+
+    @property
+    def min(self) -> float | None:
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self) -> float | None:
+        return self._max[0][1] if self._max else None
+
+    def to_dict(self) -> dict:
+        return {
+            "samples": len(self._values),
+            "mean": self.mean,
+            "stddev": self.stddev,
+            "slope": self.slope,
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+def _reading(value) -> float:
+    # The ESP reports unparsable readings as the string "NaN"
+    if isinstance(value, (int, float)):
+        return float(value)
+    return math.nan
+
+
+class ShotStatistics:
+    """Rolling statistics of the weight, flow and pressure of a shot.
+
+    Fed with every tick of the shot, `windows` gives the number of ticks each
+    channel is looked at over. Slopes are per second of shot time.
+
+    The weight is also followed in two back to back windows of `stability_ticks`,
+    the latest ticks and the ones before them, for `weight_stable()`.
+    """
+
+    CHANNELS = ("weight", "flow", "pressure")
+    DEFAULT_WINDOW = 10
+    STABILITY_TICKS = 3
+
+    def __init__(self, windows: dict[str, int] = None, stability_ticks: int = None) -> None:
+        windows = windows or {}
+        self.windows = {
+            name: RollingWindow(windows.get(name, self.DEFAULT_WINDOW))
+            for name in self.CHANNELS
+        }
+        stability_ticks = stability_ticks or self.STABILITY_TICKS
+        self.recent_weight = RollingWindow(stability_ticks)
+        self.previous_weight = RollingWindow(stability_ticks)
+
+    def feed(self, data: ShotData):
+        t = data.time / 1000 if data.time is not None else None
+        for name, window in self.windows.items():
+            window.push(_reading(getattr(data, name)), t)
+
+        evicted = self.recent_weight.push(_reading(data.weight), t)
+        if evicted is not None:
+            self.previous_weight.push(evicted)
+
+    def weight_stable(
+        self, current_weight: float, tolerance: float = 0.05, removal: float = 10.0
+    ) -> bool:
+        """True once the weight settled or jumped by more than `removal` grams.
+
+        The weight is settled if `current_weight` or the mean of the previous
+        ticks is within `tolerance` of the mean of the latest ticks. A jump is a cup
+        being taken off the scale.
+        """
+        if not (self.recent_weight.full and self.previous_weight.full):
+            return False
+        last_avg = self.recent_weight.mean
+        previous_avg = self.previous_weight.mean
+        return (
+            abs(current_weight - last_avg) < tolerance
+            or abs(last_avg - previous_avg) < tolerance
+            or abs(previous_avg - last_avg) > removal
+        )
+
+    def to_dict(self) -> dict:
+        return {name: window.to_dict() for name, window in self.windows.items()}
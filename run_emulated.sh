@@ -1,5 +1,5 @@
 #!/bin/bash
-export BACKEND=emulation
+export BACKEND=${BACKEND:-emulation}
 export CONFIG_PATH=./config
 export LOG_PATH=./logs
 export PROFILE_PATH=./profiles
@@ -0,0 +1,120 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from log import MeticulousLogger
+
+logger = MeticulousLogger.getLogger(__name__)
+
+# Threads available for blocking work (file IO, compression, database access)
+RUNTIME_WORKERS = int(os.getenv("RUNTIME_WORKERS", "4"))
+
+
+class Runtime:
+    """The single asyncio loop of the backend and the executor for blocking work.
+
+    The loop is the one tornado runs on. Long running services (serial ingest,
+    notifications, ...) are tasks on it, and code running on other threads hands
+    coroutines over with `spawn()` instead of creating loops of their own.
+    """
+
+    _loop: asyncio.AbstractEventLoop = None
+    _executor = ThreadPoolExecutor(max_workers=RUNTIME_WORKERS, thread_name_prefix="Worker")
+    _tasks: set[asyncio.Task] = set()
+
+    @staticmethod
+    def init(loop: asyncio.AbstractEventLoop = None):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        Runtime._loop = loop
+        loop.set_default_executor(Runtime._executor)
+
+    @staticmethod
+    def loop():
+        return Runtime._loop
+
+    @staticmethod
+    def executor():
+        return Runtime._executor
+
+    @staticmethod
+    def in_loop():
+        """True if called from the thread running the loop"""
+        try:
+            return asyncio.get_running_loop() is Runtime._loop
+        except RuntimeError:
+            return False
+
+    @staticmethod
+    def _track(task: asyncio.Task, name: str):
+        # The loop only keeps weak references to tasks
+        Runtime._tasks.add(task)
+
+        def done(task: asyncio.Task):
+            Runtime._tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"Task {name} failed", exc_info=task.exception())
+
+        task.add_done_callback(done)
+
+    @staticmethod
+    def spawn(coro, name: str = None) -> Future:
+        """Runs `coro` as a task on the loop, from any thread.
+
+        Returns a concurrent future for its result. Before the loop exists (early
+        startup, tests, command line tools) the coroutine is run to completion right
+        away in the calling thread.
+        """
+        name = name or getattr(coro, "__qualname__", "task")
+        loop = Runtime._loop
+        if loop is None or loop.is_closed():
+            future = Future()
+            try:
+                future.set_result(asyncio.run(coro))
+            except Exception as e:
+                logger.error(f"Task {name} failed", exc_info=e)
+                future.set_exception(e)
+            return future
+
+        future = Future()
+
+        def copy_result(task: asyncio.Task):
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        def start():
+            task = loop.create_task(coro, name=name)
+            Runtime._track(task, name)
+            task.add_done_callback(copy_result)
+
+        if Runtime.in_loop():
+            start()
+        else:
+            loop.call_soon_threadsafe(start)
+        return future
+
+    @staticmethod
+    def run_blocking(func, *args, **kwargs):
+        """Awaitable running `func` on the shared executor"""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(Runtime._executor, functools.partial(func, *args, **kwargs))
+
+    @staticmethod
+    def submit(func, *args, **kwargs) -> Future:
+        """Runs `func` on the shared executor, fire and forget from any thread"""
+        return Runtime._executor.submit(func, *args, **kwargs)
+
+    @staticmethod
+    def stats():
+        return {
+            "loop_running": Runtime._loop is not None and Runtime._loop.is_running(),
+            "tasks": sorted(task.get_name() for task in list(Runtime._tasks)),
+            "workers": Runtime._executor._max_workers,
+            "threads": sorted(thread.name for thread in threading.enumerate()),
+        }
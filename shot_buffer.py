@@ -0,0 +1,220 @@
+import math
+from array import array
+from dataclasses import fields
+
+from esp_serial.data import SensorData, ShotData
+
+# Fields of a datapoint, in the order they appear in the shot json
+SHOT_FIELDS = ("pressure", "flow", "weight", "gravimetric_flow")
+SENSOR_FIELDS = tuple(field.name for field in fields(SensorData))
+_SENSOR_FLAGS = frozenset(field.name for field in fields(SensorData) if field.type is bool)
+
+
+def _to_float(value) -> float:
+    # The ESP reports unparsable readings as the string "NaN"
+    if value is None or isinstance(value, str):
+        return math.nan
+    return float(value)
+
+
+def _from_float(value: float):
+    return "NaN" if math.isnan(value) else value
+
+
+class _Interned:
+    """Stores strings as indices into a table of the distinct values seen"""
+
+    def __init__(self) -> None:
+        self.values: list = []
+        self._index: dict = {}
+        self.column = array("H")
+
+    def index(self, value) -> int:
+        index = self._index.get(value)
+        if index is None:
+            index = len(self.values)
+            self.values.append(value)
+            self._index[value] = index
+        return index
+
+    def append(self, value):
+        self.column.append(self.index(value))
+
+    def __getitem__(self, row: int):
+        return self.values[self.column[row]]
+
+
+class ShotBuffer:
+    """The datapoints of a shot, stored column by column.
+
+    Every channel lives in its own `array`, the status and the controller kinds are
+    interned, and sensors are stored in columns of their own, referenced from the
+    datapoint they were attached to. The list of dicts the shot files and the API
+    use is only built by `to_list()`.
+
+    Times are whole milliseconds. With `profile_ms` a column holding the
+    milliseconds since the start of the recording is kept as well, for debug shots.
+    """
+
+    def __init__(self, profile_ms: bool = False) -> None:
+        self._shot = {name: array("d") for name in SHOT_FIELDS}
+        self._time = array("q")
+        self._profile_time = array("q")
+        self._status = _Interned()
+        self._profile_ms = array("q") if profile_ms else None
+
+        # Setpoints are rebuilt from the controllers the same way ShotData.to_sio does
+        self._main_kind = _Interned()
+        self._main_setpoint = array("d")
+        self._aux_kind = _Interned()
+        self._aux_setpoint = array("d")
+        self._aux_active = array("b")
+
+        # Index into the sensor columns per datapoint, -1 if none was attached
+        self._sensor_row = array("l")
+        self._sensors = {name: array("d") for name in SENSOR_FIELDS}
+
+    def __len__(self) -> int:
+        # The sensor row is appended last, readers on other threads never see a row
+        # that is only partly written
+        return len(self._sensor_row)
+
+    def columns(self) -> dict[str, array]:
+        """All columns by channel name, interned ones hold indices into `tables()`.
+
+        `sensor_row` maps every datapoint into the `sensors.*` columns, which only
+        have an entry per datapoint sensors were attached to.
+        """
+        columns = dict(self._shot)
+        columns["time"] = self._time
+        columns["profile_time"] = self._profile_time
+        columns["status"] = self._status.column
+        if self._profile_ms is not None:
+            columns["profile_ms"] = self._profile_ms
+        columns["main_kind"] = self._main_kind.column
+        columns["main_setpoint"] = self._main_setpoint
+        columns["aux_kind"] = self._aux_kind.column
+        columns["aux_setpoint"] = self._aux_setpoint
+        columns["aux_active"] = self._aux_active
+        columns["sensor_row"] = self._sensor_row
+        for name, column in self._sensors.items():
+            columns[f"sensors.{name}"] = column
+        return columns
+
+    def tables(self) -> dict[str, list]:
+        """The distinct values of the interned columns"""
+        return {
+            "status": list(self._status.values),
+            "main_kind": list(self._main_kind.values),
+            "aux_kind": list(self._aux_kind.values),
+        }
+
+    @classmethod
+    def from_columns(cls, columns: dict[str, array], tables: dict[str, list]):
+        """Rebuilds a buffer from `columns()` and `tables()`, the columns are not copied"""
+        buffer = cls(profile_ms="profile_ms" in columns)
+        for name in SHOT_FIELDS:
+            buffer._shot[name] = columns[name]
+        buffer._time = columns["time"]
+        buffer._profile_time = columns["profile_time"]
+        if buffer._profile_ms is not None:
+            buffer._profile_ms = columns["profile_ms"]
+        for attribute in ("status", "main_kind", "aux_kind"):
+            interned = getattr(buffer, f"_{attribute}")
+            for value in tables[attribute]:
+                interned.index(value)
+            interned.column = columns[attribute]
+        buffer._main_setpoint = columns["main_setpoint"]
+        buffer._aux_setpoint = columns["aux_setpoint"]
+        buffer._aux_active = columns["aux_active"]
+        buffer._sensor_row = columns["sensor_row"]
+        for name in SENSOR_FIELDS:
+            buffer._sensors[name] = columns[f"sensors.{name}"]
+        return buffer
+
+    def append(self, data: ShotData, profile_ms: int = None):
+        shot = self._shot
+        shot["pressure"].append(max(_to_float(data.pressure), 0))
+        shot["flow"].append(max(_to_float(data.flow), 0))
+        shot["weight"].append(_to_float(data.weight))
+        shot["gravimetric_flow"].append(_to_float(data.gravimetric_flow))
+        self._time.append(int(data.time))
+        self._profile_time.append(
+            int(data.profile_time if data.profile_time is not None else data.time)
+        )
+        self._status.append(data.status)
+        if self._profile_ms is not None:
+            self._profile_ms.append(profile_ms if profile_ms is not None else 0)
+
+        self._main_kind.append(data.main_controller_kind)
+        self._main_setpoint.append(_to_float(data.main_setpoint))
+        self._aux_kind.append(data.aux_controller_kind)
+        self._aux_setpoint.append(_to_float(data.aux_setpoint))
+        self._aux_active.append(1 if data.is_aux_controller_active else 0)
+        # Completes the row, see __len__
+        self._sensor_row.append(-1)
+
+    def attach_sensors(self, data: SensorData):
+        """Attaches the sensors to the latest datapoint, replacing earlier ones"""
+        if len(self) == 0:
+            return
+        row = self._sensor_row[-1]
+        if row < 0:
+            sensor_row = len(self._sensors["tube"])
+            for name, column in self._sensors.items():
+                column.append(_to_float(getattr(data, name)))
+            # Only referenced once every sensor column has its value
+            self._sensor_row[-1] = sensor_row
+        else:
+            for name, column in self._sensors.items():
+                column[row] = _to_float(getattr(data, name))
+
+    def last(self, field: str, n: int = 1) -> list:
+        """The latest `n` values of a shot field"""
+        if n <= 0:
+            return []
+        return [_from_float(value) for value in self._shot[field][-n:]]
+
+    def _setpoints(self, row: int) -> dict:
+        setpoints = {"active": None}
+        main_kind = self._main_kind[row]
+        if main_kind is not None:
+            setpoints[main_kind.lower()] = _from_float(self._main_setpoint[row])
+            setpoints["active"] = main_kind.lower()
+        aux_kind = self._aux_kind[row]
+        if aux_kind is not None:
+            setpoints[aux_kind.lower()] = _from_float(self._aux_setpoint[row])
+            if self._aux_active[row]:
+                setpoints["active"] = aux_kind.lower()
+        return setpoints
+
+    def _sensor_dict(self, row: int) -> dict:
+        sensors = {}
+        for name, column in self._sensors.items():
+            value = column[row]
+            sensors[name] = bool(value) if name in _SENSOR_FLAGS else _from_float(value)
+        return sensors
+
+    def row(self, index: int) -> dict:
+        shot = self._shot
+        point = {
+            "shot": {
+                "pressure": _from_float(shot["pressure"][index]),
+                "flow": _from_float(shot["flow"][index]),
+                "weight": _from_float(shot["weight"][index]),
+                "gravimetric_flow": _from_float(shot["gravimetric_flow"][index]),
+                "setpoints": self._setpoints(index),
+            },
+            "time": self._time[index],
+            "profile_time": self._profile_time[index],
+            "status": self._status[index],
+        }
+        if self._profile_ms is not None:
+            point["profile_ms"] = self._profile_ms[index]
+        sensor_row = self._sensor_row[index]
+        if sensor_row >= 0:
+            point["sensors"] = self._sensor_dict(sensor_row)
+        return point
+
+    def to_list(self) -> list[dict]:
+        return [self.row(index) for index in range(len(self))]
@@ -1,5 +1,8 @@
+import base64
+import hashlib
 import json
 import os
+import re
 import sqlite3
 import uuid
 from datetime import datetime
@@ -8,7 +11,6 @@ from pathlib import Path
 from typing import List, Optional
 
 import pytz
-import zstandard as zstd
 from pydantic import BaseModel, Field
 from sqlalchemy import (
     asc,
@@ -18,16 +20,22 @@ from sqlalchemy import (
     distinct,
     func,
     insert,
+    literal_column,
     or_,
     select,
     text,
+    tuple_,
     Table,
+    union,
 )
 from sqlalchemy import event as sqlEvent
+from sqlalchemy import inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import update
 from database_models import metadata, profile as profile_table, history as history_table
-from database_models import shot_annotation, shot_rating
+from database_models import shot_annotation, shot_rating, shot_summary
 
 from config import (
     HISTORY_PATH,
@@ -37,9 +45,49 @@ from config import (
 )
 
 from log import MeticulousLogger
+from shot_file import read_zst
+from shot_format_v2 import ShotFileV2, is_shot_v2
+from shot_summary import summarize_shot
 
 logger = MeticulousLogger.getLogger(__name__)
 
+# The profile fields two profiles have to share to be stored once, with the value
+# used when a profile doesn't have them
+PROFILE_HASH_FIELDS = {
+    "id": None,
+    "author": None,
+    "author_id": None,
+    "display": {},
+    "final_weight": None,
+    "last_changed": 0,
+    "name": None,
+    "temperature": None,
+    "stages": [],
+    "variables": [],
+    "previous_authors": [],
+}
+
+
+def _canonical(value):
+    # SQLite compares 36 and 36.0 as equal, so they have to hash the same
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def profile_content_hash(profile_data: dict) -> str:
+    """The sha256 of the profile fields as JSON with sorted keys and no whitespace"""
+    fields = {
+        name: _canonical(profile_data.get(name, default))
+        for name, default in PROFILE_HASH_FIELDS.items()
+    }
+    canonical = json.dumps(fields, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
 
 class SearchOrder(str, Enum):
     ascending = "asc"
@@ -59,7 +107,16 @@ class SearchParams(BaseModel):
     order_by: List[SearchOrderBy] = [SearchOrderBy.date]
     sort: SearchOrder = SearchOrder.descending
     max_results: int = 20
-    dump_data: bool = True
+    # Only list the shots, their datapoints are read from the shot files on request
+    dump_data: bool = False
+    # Include the precomputed summary of every shot
+    summary: bool = False
+    # The `next_cursor` of the previous page
+    cursor: Optional[str] = None
+
+
+class InvalidCursor(ValueError):
+    pass
 
 
 class ShotDataBase:
@@ -68,6 +125,11 @@ class ShotDataBase:
     session = None
     stage_fts_table = None
     profile_fts_table = None
+    # Substring search indices, None if SQLite has no trigram tokenizer
+    profile_trigram_table = None
+    stage_trigram_table = None
+    # Set when a broken database was deleted, its history has to be re-imported
+    recreated = False
 
     @staticmethod
     def init():
@@ -116,11 +178,50 @@ class ShotDataBase:
                     ShotDataBase.metadata,
                     autoload_with=ShotDataBase.engine,
                 )
+            ShotDataBase._init_trigram_tables()
 
         except sqlite3.DatabaseError as e:
             logger.error("Database error: %s", e)
             ShotDataBase.handle_error(e)
 
+    @staticmethod
+    def _init_trigram_tables():
+        # Names and stage names tokenized into trigrams, so LIKE '%q%' is answered from
+        # an index. Filled from the word indices when created on an existing database.
+        tables = {
+            "profile_trigram_fts": (
+                "profile_key UNINDEXED, name",
+                "SELECT profile_key, name FROM profile_fts",
+            ),
+            "stage_trigram_fts": (
+                "profile_key UNINDEXED, profile_name UNINDEXED, stage_name",
+                "SELECT profile_key, profile_name, stage_name FROM stage_fts",
+            ),
+        }
+        try:
+            with ShotDataBase.engine.begin() as connection:
+                existing = inspect(connection).get_table_names()
+                for name, (columns, content) in tables.items():
+                    if name in existing:
+                        continue
+                    connection.execute(
+                        text(
+                            f"CREATE VIRTUAL TABLE {name} USING fts5({columns}, tokenize='trigram')"
+                        )
+                    )
+                    connection.execute(text(f"INSERT INTO {name} {content}"))
+                    logger.info(f"Created the substring search index {name}")
+        except OperationalError as e:
+            logger.warning(f"No substring search index, falling back to LIKE scans: {e}")
+            return
+
+        ShotDataBase.profile_trigram_table = Table(
+            "profile_trigram_fts", ShotDataBase.metadata, autoload_with=ShotDataBase.engine
+        )
+        ShotDataBase.stage_trigram_table = Table(
+            "stage_trigram_fts", ShotDataBase.metadata, autoload_with=ShotDataBase.engine
+        )
+
     @staticmethod
     def handle_error(e):
         if "database disk image is malformed" in str(e):
@@ -147,6 +248,7 @@ class ShotDataBase:
 
             # Recreate the entire database
             ShotDataBase.init()
+            ShotDataBase.recreated = True
         except sqlite3.DatabaseError as e:
             logger.error("Failed to completely rebuild the database: %s", e)
         except OSError as e:
@@ -154,38 +256,9 @@ class ShotDataBase:
 
     @staticmethod
     def profile_exists(profile_data):
-        stages_json = json.dumps(profile_data.get("stages", []))
-        variables_json = json.dumps(profile_data.get("variables", []))
-        previous_authors_json = json.dumps(profile_data.get("previous_authors", []))
-        display_json = json.dumps(profile_data.get("display", {}))
-
-        query = (
-            select(profile_table.c.key)
-            .where(profile_table.c.id == profile_data["id"])
-            .where(profile_table.c.author == profile_data["author"])
-            .where(profile_table.c.author_id == profile_data["author_id"])
-            .where(
-                func.json_extract(profile_table.c.display, "$")
-                == func.json_extract(display_json, "$")
-            )
-            .where(profile_table.c.final_weight == profile_data["final_weight"])
-            .where(profile_table.c.last_changed == profile_data.get("last_changed", 0))
-            .where(profile_table.c.name == profile_data["name"])
-            .where(profile_table.c.temperature == profile_data["temperature"])
-            .where(
-                func.json_extract(profile_table.c.stages, "$")
-                == func.json_extract(stages_json, "$")
-            )
-            .where(
-                func.json_extract(profile_table.c.variables, "$")
-                == func.json_extract(variables_json, "$")
-            )
-            .where(
-                func.json_extract(profile_table.c.previous_authors, "$")
-                == func.json_extract(previous_authors_json, "$")
-            )
+        query = select(profile_table.c.key).where(
+            profile_table.c.content_hash == profile_content_hash(profile_data)
         )
-
         with ShotDataBase.engine.connect() as connection:
             existing_profile = connection.execute(query).fetchone()
             return existing_profile
@@ -195,50 +268,110 @@ class ShotDataBase:
         if profile_data is None:
             return -1
 
-        existing_profile = ShotDataBase.profile_exists(profile_data)
-
-        if existing_profile:
-            logger.debug(
-                f"Profile with id {profile_data['id']}, name {profile_data['name']}, and author_id {profile_data['author_id']} already exists."
-            )
-            return existing_profile[0]
         with ShotDataBase.engine.connect() as connection:
             with connection.begin():
-                ins_stmt = insert(profile_table).values(
-                    id=profile_data["id"],
-                    author=profile_data["author"],
-                    author_id=profile_data["author_id"],
-                    display=profile_data["display"],
-                    final_weight=profile_data["final_weight"],
-                    last_changed=profile_data.get("last_changed", 0),
-                    name=profile_data["name"],
-                    temperature=profile_data["temperature"],
-                    stages=profile_data.get("stages", []),
-                    variables=profile_data.get("variables", []),
-                    previous_authors=profile_data.get("previous_authors", []),
-                )
-                result = connection.execute(ins_stmt)
-                profile_key = result.inserted_primary_key[0]
-
-                # Insert into profile FTS table
-                fts_ins_stmt = insert(ShotDataBase.profile_fts_table).values(
-                    profile_key=profile_key,
-                    profile_id=profile_data["id"],
-                    name=profile_data["name"],
+                return ShotDataBase._profile_keys(connection, [profile_data])[0]
+
+    @staticmethod
+    def _profile_row(profile_data: dict, content_hash: str) -> dict:
+        return {
+            "id": profile_data["id"],
+            "author": profile_data["author"],
+            "author_id": profile_data["author_id"],
+            "display": profile_data["display"],
+            "final_weight": profile_data["final_weight"],
+            "last_changed": profile_data.get("last_changed", 0),
+            "name": profile_data["name"],
+            "temperature": profile_data["temperature"],
+            "stages": profile_data.get("stages", []),
+            "variables": profile_data.get("variables", []),
+            "previous_authors": profile_data.get("previous_authors", []),
+            "content_hash": content_hash,
+        }
+
+    @staticmethod
+    def _profile_keys(connection, profiles: list[dict]) -> list[int]:
+        """The keys of `profiles`, the ones not stored yet are added with their names
+        to the search indices. Runs in the transaction of `connection`.
+        """
+        hashes = [profile_content_hash(profile_data) for profile_data in profiles]
+        stored = select(profile_table.c.content_hash, profile_table.c.key)
+        keys = dict(
+            connection.execute(
+                stored.where(profile_table.c.content_hash.in_(set(hashes)))
+            ).all()
+        )
+
+        new_profiles = {}
+        for profile_data, content_hash in zip(profiles, hashes):
+            if content_hash not in keys:
+                new_profiles.setdefault(content_hash, profile_data)
+        if not new_profiles:
+            return [keys[content_hash] for content_hash in hashes]
+
+        ins_stmt = (
+            sqlite_insert(profile_table)
+            .on_conflict_do_nothing(index_elements=["content_hash"])
+            .returning(profile_table.c.content_hash, profile_table.c.key)
+        )
+        rows = [
+            ShotDataBase._profile_row(profile_data, content_hash)
+            for content_hash, profile_data in new_profiles.items()
+        ]
+        inserted = dict(connection.execute(ins_stmt, rows).all())
+        keys.update(inserted)
+        # Stored by someone else since the lookup
+        if len(inserted) < len(new_profiles):
+            missing = set(new_profiles) - set(inserted)
+            keys.update(
+                connection.execute(
+                    stored.where(profile_table.c.content_hash.in_(missing))
+                ).all()
+            )
+
+        ShotDataBase._insert_search_rows(
+            connection,
+            [(keys[content_hash], new_profiles[content_hash]) for content_hash in inserted],
+        )
+        return [keys[content_hash] for content_hash in hashes]
+
+    @staticmethod
+    def _insert_search_rows(connection, profiles: list[tuple[int, dict]]):
+        profile_rows = []
+        stage_rows = []
+        for profile_key, profile_data in profiles:
+            profile_rows.append(
+                {
+                    "profile_key": profile_key,
+                    "profile_id": profile_data["id"],
+                    "name": profile_data["name"],
+                }
+            )
+            for stage in profile_data["stages"]:
+                stage_rows.append(
+                    {
+                        "profile_key": profile_key,
+                        "profile_id": profile_data["id"],
+                        "profile_name": profile_data["name"],
+                        "stage_key": stage["key"],
+                        "stage_name": stage["name"],
+                    }
                 )
-                connection.execute(fts_ins_stmt)
-
-                # Insert stages into stage_fts
-                for stage in profile_data["stages"]:
-                    stage_fts_ins_stmt = insert(ShotDataBase.stage_fts_table).values(
-                        profile_key=profile_key,
-                        profile_id=profile_data["id"],
-                        profile_name=profile_data["name"],
-                        stage_key=stage["key"],
-                        stage_name=stage["name"],
-                    )
-                    connection.execute(stage_fts_ins_stmt)
-                return profile_key
+
+        # One executemany per index, the trigram ones take a subset of the columns
+        tables = [
+            (ShotDataBase.profile_fts_table, profile_rows),
+            (ShotDataBase.stage_fts_table, stage_rows),
+            (ShotDataBase.profile_trigram_table, profile_rows),
+            (ShotDataBase.stage_trigram_table, stage_rows),
+        ]
+        for table, rows in tables:
+            if table is None or not rows:
+                continue
+            columns = table.c.keys()
+            connection.execute(
+                insert(table), [{name: row[name] for name in columns} for row in rows]
+            )
 
     @staticmethod
     def history_exists(entry):
@@ -249,34 +382,80 @@ class ShotDataBase:
             return existing_history
 
     @staticmethod
-    def insert_history(entry):
-        if "id" not in entry:
-            entry["id"] = str(uuid.uuid4())
-        existing_history = ShotDataBase.history_exists(entry)
+    def insert_history(entry, summary: dict = None):
+        """Adds a shot, its summary is computed from its "data" unless given"""
+        return ShotDataBase.insert_history_batch([entry], [summary])[0]
 
-        if existing_history:
-            logger.debug(f"History entry with file {entry['file']} already exists.")
-            return existing_history[0]
-
-        profile_data = entry.get("profile")
-        profile_key = ShotDataBase.insert_profile(profile_data)
+    @staticmethod
+    def insert_history_batch(entries: list[dict], summaries: list[dict] = None) -> list[int]:
+        """Adds shots in a single transaction, returns their history ids in order.
+
+        Shots already stored under the same file keep their id. The summary of a shot
+        is computed from its "data" unless given in `summaries`.
+        """
+        if summaries is None:
+            summaries = [None] * len(entries)
+        for entry in entries:
+            if "id" not in entry:
+                entry["id"] = str(uuid.uuid4())
+            if entry.get("profile") is None:
+                raise ValueError(f"Shot {entry.get('file')} has no profile")
+
+        files = {entry.get("file") for entry in entries}
         with ShotDataBase.engine.connect() as connection:
             with connection.begin():
+                ids = dict(
+                    connection.execute(
+                        select(history_table.c.file, history_table.c.id).where(
+                            history_table.c.file.in_(files)
+                        )
+                    ).all()
+                )
+                new_entries = {}
+                for entry, summary in zip(entries, summaries):
+                    if entry.get("file") in ids:
+                        logger.debug(f"History entry with file {entry['file']} already exists.")
+                    else:
+                        new_entries.setdefault(entry.get("file"), (entry, summary))
+                if not new_entries:
+                    return [ids[entry.get("file")] for entry in entries]
+
+                pending = list(new_entries.values())
+                profile_keys = ShotDataBase._profile_keys(
+                    connection, [entry["profile"] for entry, _summary in pending]
+                )
 
-                # Convert to UTC
-                time_obj = datetime.fromtimestamp(entry["time"])
-                time_obj = pytz.timezone("UTC").localize(time_obj)
-
-                ins_stmt = insert(history_table).values(
-                    uuid=entry["id"],
-                    file=entry.get("file"),
-                    time=time_obj,
-                    profile_name=entry["profile_name"],
-                    profile_id=profile_data["id"],
-                    profile_key=profile_key,
+                rows = []
+                for (entry, _summary), profile_key in zip(pending, profile_keys):
+                    # Convert to UTC
+                    time_obj = datetime.fromtimestamp(entry["time"])
+                    time_obj = pytz.timezone("UTC").localize(time_obj)
+                    rows.append(
+                        {
+                            "uuid": entry["id"],
+                            "file": entry.get("file"),
+                            "time": time_obj,
+                            "profile_name": entry["profile_name"],
+                            "profile_id": entry["profile"]["id"],
+                            "profile_key": profile_key,
+                        }
+                    )
+                ins_stmt = insert(history_table).returning(
+                    history_table.c.id, sort_by_parameter_order=True
                 )
-                result = connection.execute(ins_stmt)
-                return result.inserted_primary_key[0]
+                history_ids = connection.execute(ins_stmt, rows).scalars().all()
+
+                summary_rows = []
+                for (entry, summary), history_id in zip(pending, history_ids):
+                    ids[entry.get("file")] = history_id
+                    if summary is None and entry.get("data") is not None:
+                        summary = summarize_shot(entry["data"])
+                    if summary is not None:
+                        summary_rows.append({"history_id": history_id, **summary})
+                if summary_rows:
+                    connection.execute(insert(shot_summary), summary_rows)
+
+                return [ids[entry.get("file")] for entry in entries]
 
     @staticmethod
     def link_debug_file(history_shot_id, debug_filename):
@@ -310,6 +489,10 @@ class ShotDataBase:
     def delete_shot(shot_id):
         with ShotDataBase.engine.connect() as connection:
             with connection.begin():
+                connection.execute(
+                    delete(shot_summary).where(shot_summary.c.history_id == shot_id)
+                )
+
                 # Delete from history
                 del_stmt = delete(history_table).where(history_table.c.id == shot_id)
                 connection.execute(del_stmt)
@@ -337,35 +520,125 @@ class ShotDataBase:
                     )
                     connection.execute(del_stage_fts_stmt)
 
+                    for trigram_table in (
+                        ShotDataBase.profile_trigram_table,
+                        ShotDataBase.stage_trigram_table,
+                    ):
+                        if trigram_table is not None:
+                            connection.execute(
+                                delete(trigram_table).where(
+                                    trigram_table.c.profile_key == orphan[0]
+                                )
+                            )
+
     @staticmethod
-    def search_history(params: SearchParams):
-        stmt = (
-            select(
-                *[c.label(f"history_{c.name}") for c in history_table.c],
-                *[c.label(f"profile_{c.name}") for c in profile_table.c],
-            )
-            .distinct()
-            .select_from(
-                history_table.join(
-                    profile_table,
-                    history_table.c.profile_key == profile_table.c.key,
-                )
-            )
-            .outerjoin(
-                ShotDataBase.profile_fts_table,
-                profile_table.c.key == ShotDataBase.profile_fts_table.c.profile_key,
-            )
-            .outerjoin(
-                ShotDataBase.stage_fts_table,
-                profile_table.c.key == ShotDataBase.stage_fts_table.c.profile_key,
+    def _order_columns(params: SearchParams) -> list:
+        order_by = []
+        for ordering in params.order_by:
+            if ordering == SearchOrderBy.date:
+                order_by.append(history_table.c.time)
+            elif ordering == SearchOrderBy.profile:
+                order_by.append(history_table.c.profile_name)
+        order_by.append(history_table.c.id)
+        return order_by
+
+    @staticmethod
+    def _encode_cursor(params: SearchParams, row) -> str:
+        keys = []
+        for column in ShotDataBase._order_columns(params):
+            value = row[f"history_{column.name}"]
+            keys.append(value.isoformat() if isinstance(value, datetime) else value)
+        cursor = {"order": [o.value for o in params.order_by], "sort": params.sort.value}
+        cursor["keys"] = keys
+        return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(params: SearchParams) -> list:
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(params.cursor.encode()))
+            keys = cursor["keys"]
+            order = cursor["order"]
+            sort = cursor["sort"]
+        except (ValueError, TypeError, KeyError) as e:
+            raise InvalidCursor(f"Invalid cursor: {e}")
+        if order != [o.value for o in params.order_by] or sort != params.sort.value:
+            raise InvalidCursor("The cursor belongs to a search with a different order")
+
+        columns = ShotDataBase._order_columns(params)
+        if not isinstance(keys, list) or len(keys) != len(columns):
+            raise InvalidCursor("Invalid cursor: wrong number of keys")
+        try:
+            return [
+                datetime.fromisoformat(key) if column is history_table.c.time else key
+                for column, key in zip(columns, keys)
+            ]
+        except (ValueError, TypeError) as e:
+            raise InvalidCursor(f"Invalid cursor: {e}")
+
+    @staticmethod
+    def _fts_query(query: str) -> str | None:
+        """An FTS5 query matching names with every word of `query` as a prefix"""
+        words = re.findall(r"\w+", query)
+        if not words:
+            return None
+        return " ".join(f'"{word}"*' for word in words)
+
+    @staticmethod
+    def _substring_tables():
+        # The word indices answer LIKE with a scan, the trigram ones from the index
+        if ShotDataBase.profile_trigram_table is not None:
+            return ShotDataBase.profile_trigram_table, ShotDataBase.stage_trigram_table
+        return ShotDataBase.profile_fts_table, ShotDataBase.stage_fts_table
+
+    @staticmethod
+    def _matching_profile_keys(query: str):
+        """The keys of the profiles whose name or a stage name matches `query`.
+
+        Either every word of the query starts a word of the name, or the query is a
+        part of the name, as searches always matched.
+        """
+        profile_fts = ShotDataBase.profile_fts_table
+        stage_fts = ShotDataBase.stage_fts_table
+        profile_substring, stage_substring = ShotDataBase._substring_tables()
+
+        selects = [
+            select(profile_substring.c.profile_key).where(
+                profile_substring.c.name.like(f"%{query}%")
+            ),
+            select(stage_substring.c.profile_key).where(
+                stage_substring.c.stage_name.like(f"%{query}%")
+            ),
+        ]
+        expression = ShotDataBase._fts_query(query)
+        if expression is not None:
+            selects += [
+                select(profile_fts.c.profile_key).where(profile_fts.c.name.match(expression)),
+                select(stage_fts.c.profile_key).where(stage_fts.c.stage_name.match(expression)),
+            ]
+        return union(*selects)
+
+    @staticmethod
+    def _search_statement(params: SearchParams):
+        stmt = select(
+            *[c.label(f"history_{c.name}") for c in history_table.c],
+            *[c.label(f"profile_{c.name}") for c in profile_table.c],
+        ).select_from(
+            history_table.join(
+                profile_table,
+                history_table.c.profile_key == profile_table.c.key,
             )
         )
+        if params.summary:
+            stmt = stmt.add_columns(
+                *[c.label(f"summary_{c.name}") for c in ShotDataBase._summary_columns()]
+            ).outerjoin(shot_summary, shot_summary.c.history_id == history_table.c.id)
 
         if params.query:
+            # A subquery instead of joins, a profile matching several stages would
+            # otherwise list its shots several times
             stmt = stmt.where(
-                or_(
-                    ShotDataBase.profile_fts_table.c.name.like(f"%{params.query}%"),
-                    ShotDataBase.stage_fts_table.c.stage_name.like(f"%{params.query}%"),
+                history_table.c.profile_key.in_(
+                    ShotDataBase._matching_profile_keys(params.query)
                 )
             )
 
@@ -388,46 +661,116 @@ class ShotDataBase:
             end_datetime = pytz.timezone("UTC").localize(end_datetime)
             stmt = stmt.where(history_table.c.time <= end_datetime)
 
-        order_by = []
-        for ordering in params.order_by:
-            if ordering == SearchOrderBy.date:
-                order_by.append(history_table.c.time)
-            elif ordering == SearchOrderBy.profile:
-                order_by.append(history_table.c.profile_name)
-
-        order_by.append(history_table.c.id)
+        # Keyset pagination: continue after the last row of the previous page, the
+        # (time, id) index makes this as cheap as the first page
+        order_by = ShotDataBase._order_columns(params)
+        if params.cursor:
+            keys = ShotDataBase._decode_cursor(params)
+            if params.sort == SearchOrder.ascending:
+                stmt = stmt.where(tuple_(*order_by) > tuple_(*keys))
+            else:
+                stmt = stmt.where(tuple_(*order_by) < tuple_(*keys))
 
         if params.sort == SearchOrder.ascending:
             stmt = stmt.order_by(*[asc(order_column) for order_column in order_by])
         else:
             stmt = stmt.order_by(*[desc(order_column) for order_column in order_by])
 
+        # One more row than asked for tells if there is a next page
         if params.max_results > 0:
-            stmt = stmt.limit(params.max_results)
+            stmt = stmt.limit(params.max_results + 1)
+        return stmt
 
+    @staticmethod
+    def read_shot_file(file_entry: str, shot_path=None) -> dict:
+        """A stored shot as a dict, from its file below `shot_path` (SHOT_PATH)"""
+        data_file = Path(shot_path or SHOT_PATH).joinpath(file_entry)
+        if is_shot_v2(file_entry):
+            return ShotFileV2.open(data_file).to_legacy_json()
+        raw = read_zst(data_file)
+        if b": Infinity" in raw or b": NaN" in raw:
+            logger.warning(f"Patching non-finite JSON token in shot file: {file_entry}")
+            raw = raw.replace(b": Infinity", b": 0.0")
+            raw = raw.replace(b": NaN", b": 0.0")
+        return json.loads(raw)
+
+    @staticmethod
+    def read_shot_data(file_entry: str) -> list:
+        """The datapoints of a stored shot, from its file below SHOT_PATH"""
+        return ShotDataBase.read_shot_file(file_entry).get("data")
+
+    @staticmethod
+    def _summary_columns():
+        return [c for c in shot_summary.c if c.name not in ("id", "history_id")]
+
+    @staticmethod
+    def _row_summary(row_dict: dict) -> dict | None:
+        summary = {
+            c.name: row_dict.pop(f"summary_{c.name}") for c in ShotDataBase._summary_columns()
+        }
+        # Shots without a summary yet, the backfill didn't get to them
+        if summary["points"] is None:
+            return None
+        return summary
+
+    @staticmethod
+    def backfill_summaries(limit: int = 50) -> int:
+        """Computes the summaries of up to `limit` shots that have none.
+
+        Shots whose file can't be read get an empty summary, so they aren't tried
+        again. Returns the number of shots handled.
+        """
+        stmt = (
+            select(history_table.c.id, history_table.c.file)
+            .outerjoin(shot_summary, shot_summary.c.history_id == history_table.c.id)
+            .where(shot_summary.c.id.is_(None))
+            .order_by(desc(history_table.c.time))
+            .limit(limit)
+        )
+        with ShotDataBase.engine.connect() as connection:
+            missing = connection.execute(stmt).fetchall()
+
+        summaries = []
+        for history_id, file_entry in missing:
+            try:
+                data = ShotDataBase.read_shot_data(file_entry) or []
+            except Exception as e:
+                logger.warning(f"Failed to read shot file {file_entry} for its summary: {e}")
+                data = []
+            summaries.append({"history_id": history_id, **summarize_shot(data)})
+
+        if summaries:
+            with ShotDataBase.engine.begin() as connection:
+                connection.execute(insert(shot_summary), summaries)
+        return len(summaries)
+
+    @staticmethod
+    def search_history(params: SearchParams):
+        return ShotDataBase.search_history_page(params)["history"]
+
+    @staticmethod
+    def search_history_page(params: SearchParams):
+        """A page of the history and the cursor of the next page, None on the last.
+
+        Raises InvalidCursor if the cursor can't be used for this search.
+        """
+        stmt = ShotDataBase._search_statement(params)
         with ShotDataBase.engine.connect() as connection:
-            results = connection.execute(stmt)
+            rows = connection.execute(stmt).fetchall()
+            next_cursor = None
+            if params.max_results > 0 and len(rows) > params.max_results:
+                rows = rows[: params.max_results]
+                next_cursor = ShotDataBase._encode_cursor(params, rows[-1]._mapping)
+
             parsed_results = []
-            for row in results:
+            for row in rows:
                 row_dict = dict(row._mapping)
                 data = None
                 file_entry = row_dict.pop("history_file")
 
                 if params.dump_data:
-                    data_file = Path(SHOT_PATH).joinpath(file_entry)
                     try:
-                        with open(data_file, "rb") as compressed_file:
-                            decompressor = zstd.ZstdDecompressor()
-                            decompressed_content = decompressor.stream_reader(compressed_file)
-                            raw = decompressed_content.read()
-                            if b": Infinity" in raw or b": NaN" in raw:
-                                logger.warning(
-                                    f"Patching non-finite JSON token in shot file: {file_entry}"
-                                )
-                                raw = raw.replace(b": Infinity", b": 0.0")
-                                raw = raw.replace(b": NaN", b": 0.0")
-                            file_contents = json.loads(raw)
-                            data = file_contents.get("data")
+                        data = ShotDataBase.read_shot_data(file_entry)
                     except Exception as e:
                         logger.error(f"Failed to read shot file {file_entry}: {e}")
                         continue
@@ -456,11 +799,13 @@ class ShotDataBase:
                     "data": data,
                     "profile": profile,
                 }
+                if params.summary:
+                    history["summary"] = ShotDataBase._row_summary(row_dict)
 
                 parsed_results.append(history)
 
             logger.info(f"shot database query returned {len(parsed_results)} results")
-            return parsed_results
+            return {"history": parsed_results, "next_cursor": next_cursor}
 
     @staticmethod
     def autocomplete_profile_name(prefix):
@@ -475,32 +820,48 @@ class ShotDataBase:
                 results = session.execute(stmt).fetchall()
                 return [{"profile": result[0], "type": "profile"} for result in results]
 
-            # Update queries to use LIKE instead of MATCH for partial matching
-            stmt_profile = (
-                select(ShotDataBase.profile_fts_table.c.name.label("name"))
-                .distinct()
-                .where(ShotDataBase.profile_fts_table.c.name.like(f"%{prefix}%"))
-            )
-
-            stmt_stage = (
-                select(
-                    ShotDataBase.stage_fts_table.c.profile_name,
-                    ShotDataBase.stage_fts_table.c.stage_name,
-                )
-                .distinct()
-                .where(ShotDataBase.stage_fts_table.c.stage_name.like(f"%{prefix}%"))
-            )
-
-            profile_results = session.execute(stmt_profile).fetchall()
-            stage_results = session.execute(stmt_stage).fetchall()
-
-            results = [{"profile": res.name, "type": "profile"} for res in profile_results]
-            for result in stage_results:
+            profile_fts = ShotDataBase.profile_fts_table
+            stage_fts = ShotDataBase.stage_fts_table
+            profile_substring, stage_substring = ShotDataBase._substring_tables()
+
+            # Word prefix matches first, best bm25 rank first, then the names that
+            # only contain the prefix somewhere
+            profile_names = []
+            stage_names = []
+            expression = ShotDataBase._fts_query(prefix)
+            if expression is not None:
+                profile_names += session.execute(
+                    select(profile_fts.c.name)
+                    .where(profile_fts.c.name.match(expression))
+                    .order_by(literal_column("rank"))
+                ).fetchall()
+                stage_names += session.execute(
+                    select(stage_fts.c.profile_name, stage_fts.c.stage_name)
+                    .where(stage_fts.c.stage_name.match(expression))
+                    .order_by(literal_column("rank"))
+                ).fetchall()
+
+            profile_names += session.execute(
+                select(profile_substring.c.name)
+                .where(profile_substring.c.name.like(f"%{prefix}%"))
+                .order_by(profile_substring.c.name)
+            ).fetchall()
+            stage_names += session.execute(
+                select(stage_substring.c.profile_name, stage_substring.c.stage_name)
+                .where(stage_substring.c.stage_name.like(f"%{prefix}%"))
+                .order_by(stage_substring.c.profile_name, stage_substring.c.stage_name)
+            ).fetchall()
+
+            results = [
+                {"profile": name, "type": "profile"}
+                for (name,) in dict.fromkeys(tuple(row) for row in profile_names)
+            ]
+            for profile_name, stage_name in dict.fromkeys(tuple(row) for row in stage_names):
                 results.append(
                     {
-                        "profile": result.profile_name,
+                        "profile": profile_name,
                         "type": "stage",
-                        "name": result.stage_name,
+                        "name": stage_name,
                     }
                 )
 
@@ -1,15 +1,11 @@
-import json
 import os
-from named_thread import NamedThread
 import time
-import asyncio
 from datetime import datetime, timedelta
 import shutil
 import zipfile
 import logging
 import threading
 from shot_database import ShotDataBase
-import subprocess
 from pathlib import Path
 
 from config import (
@@ -29,7 +25,12 @@ from esp_serial.data import (
     MachineStatusToProfile,
     ESPInfo,
 )
+from esp_serial.crash_detector import CrashRecord
 from log import MeticulousLogger
+from persistence import JobPriority, PersistenceService
+from runtime import Runtime
+from shot_buffer import ShotBuffer
+from shot_file import write_json_zst
 from shot_manager import Shot, ShotManager
 import copy
 
@@ -53,6 +54,7 @@ class DebugShot(Shot):
 
         super().__init__()
         self.logs = []
+        self.crashes = []
         self.config = copy.deepcopy(MeticulousConfig[CONFIG_USER])
         self.config[CONFIG_WIFI] = {}
         self.machine = {}
@@ -105,15 +107,18 @@ class DebugShot(Shot):
             "profile": self.profile,
             "nodeJSON": self.nodeJSON,
             "config": self.config,
-            "data": self.shotData,
+            "data": self.shotData.to_list(),
             "logs": self.logs,
+            "crashes": [crash.to_dict() for crash in self.crashes],
         }
         return data
 
-    def append_shot_data(self, formated_data):
+    def _new_buffer(self) -> ShotBuffer:
+        return ShotBuffer(profile_ms=True)
+
+    def append_shot_data(self, shotData: ShotData):
         time_passed = int((time.time() - self.startTime) * 1000.0)
-        formated_data["profile_ms"] = time_passed
-        self.shotData.append(formated_data)
+        self.shotData.append(shotData, profile_ms=time_passed)
 
     def set_shot_type(self, type: str):
         self.shottype = type
@@ -121,6 +126,8 @@ class DebugShot(Shot):
 
 class ShotDebugManager:
     _current_data: DebugShot = None
+    # The profile streamed to the ESP, kept until the debug shot it belongs to starts
+    _pending_node_json: dict = None
     clear_current_data_lock = threading.Lock()
     logging_handler = None
 
@@ -135,7 +142,7 @@ class ShotDebugManager:
         return current_data_copy
 
     @staticmethod
-    def _prepare_debug_shot_data(current_data_copy: DebugShot, start: datetime) -> str:
+    def _prepare_debug_shot_data(current_data_copy: DebugShot, start: datetime) -> dict:
         if current_data_copy.profile is None:
             current_data_copy.profile = {}
 
@@ -162,7 +169,7 @@ class ShotDebugManager:
                     if last_profile_name is not None and last_profile_name != "":
                         debug_shot_data["profile_name"] = last_profile_name
 
-        return json.dumps(debug_shot_data, ensure_ascii=False)
+        return debug_shot_data
 
     @staticmethod
     def _debug_file_path(root_path, current_data_copy: DebugShot, incomplete: bool = False):
@@ -176,26 +183,9 @@ class ShotDebugManager:
         return start, Path(root_path).joinpath(folder_name, file_name)
 
     @staticmethod
-    def _compress_debug_json_to_path(data_json: str, file_path: Path):
-        file_path.parent.mkdir(parents=True, exist_ok=True)
+    def _compress_debug_json_to_path(debug_shot_data: dict, file_path: Path):
         logger.info(f"Writing debug json to {file_path}")
-        json_data = data_json.encode("utf-8")
-        result = subprocess.run(
-            [
-                "zstd",
-                "-10",
-                "-f",
-                "-q",
-                "-o",
-                str(file_path),
-            ],
-            input=json_data,
-            capture_output=True,
-            text=False,
-            check=True,
-        )
-        if result.stderr:
-            logger.error(f"zstd stderr: {result.stderr}")
+        write_json_zst(debug_shot_data, file_path)
 
     @staticmethod
     def write_current_incomplete_debug_shot(target_debug_root) -> str | None:
@@ -206,9 +196,9 @@ class ShotDebugManager:
         start, file_path = ShotDebugManager._debug_file_path(
             target_debug_root, current_data_copy, incomplete=True
         )
-        data_json = ShotDebugManager._prepare_debug_shot_data(current_data_copy, start)
+        debug_shot_data = ShotDebugManager._prepare_debug_shot_data(current_data_copy, start)
         logger.info("Writing incomplete debug shot snapshot")
-        ShotDebugManager._compress_debug_json_to_path(data_json, file_path)
+        ShotDebugManager._compress_debug_json_to_path(debug_shot_data, file_path)
         return str(file_path.relative_to(Path(target_debug_root)))
 
     @staticmethod
@@ -218,6 +208,10 @@ class ShotDebugManager:
             with ShotDebugManager.clear_current_data_lock:
                 if ShotDebugManager._current_data is None:
                     ShotDebugManager._current_data = DebugShot()
+                node_json = ShotDebugManager._pending_node_json
+                if node_json is not None:
+                    ShotDebugManager._current_data.nodeJSON = node_json
+                    ShotDebugManager._pending_node_json = None
             if ShotDebugManager.logging_handler is None:
                 ShotDebugManager.logging_handler = ShotLogHandler()
 
@@ -231,6 +225,15 @@ class ShotDebugManager:
             MeticulousLogger.remove_logging_handler(ShotDebugManager.logging_handler)
             return
 
+    @staticmethod
+    def setNodeJSON(json_obj: dict):
+        """Attaches the profile sent to the ESP to the running debug shot, or to the next one"""
+        with ShotDebugManager.clear_current_data_lock:
+            if ShotDebugManager._current_data is not None:
+                ShotDebugManager._current_data.nodeJSON = json_obj
+            else:
+                ShotDebugManager._pending_node_json = json_obj
+
     @staticmethod
     def handleSensorData(sensoData: SensorData):
         with ShotDebugManager.clear_current_data_lock:
@@ -250,6 +253,12 @@ class ShotDebugManager:
                 ):
                     ShotDebugManager._current_data.set_shot_type(status)
 
+    @staticmethod
+    def handleCrash(crash: CrashRecord):
+        with ShotDebugManager.clear_current_data_lock:
+            if ShotDebugManager._current_data is not None:
+                ShotDebugManager._current_data.crashes.append(crash)
+
     @staticmethod
     def deleteOldDebugShotData():
         retention_days = MeticulousConfig[CONFIG_USER][DEBUG_SHOT_DATA_RETENTION]
@@ -325,63 +334,61 @@ class ShotDebugManager:
         start, file_path = ShotDebugManager._debug_file_path(
             DEBUG_HISTORY_PATH, current_data_copy
         )
-        data_json = ShotDebugManager._prepare_debug_shot_data(current_data_copy, start)
-
-        async def compress_current_data(data_json):
-            from machine import Machine
-
-            # Compress and write the shot to disk
-            logger.info("Writing and compressing debug file")
-            start = time.time()
-
-            ShotDebugManager._compress_debug_json_to_path(data_json, file_path)
+        debug_shot_data = ShotDebugManager._prepare_debug_shot_data(current_data_copy, start)
+
+        # Queued behind the user shot it belongs to, whose history id it is linked to
+        PersistenceService.submit(
+            JobPriority.DEBUG_SHOT,
+            ShotDebugManager._write_debug_shot,
+            debug_shot_data,
+            file_path,
+            key=f"debug-shot:{file_path}",
+        )
 
-            time_ms = (time.time() - start) * 1000
-            logger.info(f"Writing debug json to disc took {time_ms} ms")
+    @staticmethod
+    def _write_debug_shot(debug_shot_data: dict, file_path: Path):
+        from machine import Machine
 
-            # link the Debug file to the shot in the db
-            if ShotManager.db_history_id is not None:
-                debug_dir_filename = os.path.join(*file_path.parts[-2:])
-                ShotDataBase.link_debug_file(ShotManager.db_history_id, debug_dir_filename)
+        # Compress and write the shot to disk
+        logger.info("Writing and compressing debug file")
+        start = time.time()
 
-            ShotManager.db_history_id = None
+        ShotDebugManager._compress_debug_json_to_path(debug_shot_data, file_path)
 
-            if MeticulousConfig[CONFIG_USER][MACHINE_DEBUG_SENDING] is True:
-                if Machine.emulated:
-                    logger.info("Not sending emulated debug shots")
-                else:
-                    try:
-                        from telemetry_service import TelemetryService
+        time_ms = (time.time() - start) * 1000
+        logger.info(f"Writing debug json to disc took {time_ms} ms")
 
-                        compressed_data = None
-                        with open(file_path, "rb") as f:
-                            compressed_data = f.read()
-                        await TelemetryService.upload_debug_shot(
-                            compressed_data, str(file_path)
-                        )
-                        logger.info("Debug shot data compressed and saved")
+        # link the Debug file to the shot in the db
+        if ShotManager.db_history_id is not None:
+            debug_dir_filename = os.path.join(*file_path.parts[-2:])
+            ShotDataBase.link_debug_file(ShotManager.db_history_id, debug_dir_filename)
 
-                    except Exception as e:
-                        logger.error(f"Failed to send debug shot to server: {e}")
+        ShotManager.db_history_id = None
 
-            data_json = None
-            logger.info("Debug shot data compressed and saved")
+        if MeticulousConfig[CONFIG_USER][MACHINE_DEBUG_SENDING] is True:
+            if Machine.emulated:
+                logger.info("Not sending emulated debug shots")
+            else:
+                Runtime.spawn(
+                    ShotDebugManager._upload_debug_shot(file_path.read_bytes(), str(file_path)),
+                    "debug-shot-upload",
+                )
 
-            ShotDebugManager.deleteOldDebugShotData()
+        logger.info("Debug shot data compressed and saved")
 
-        def compression_loop(data_json):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+        PersistenceService.submit(
+            JobPriority.CLEANUP, ShotDebugManager.deleteOldDebugShotData, key="debug-retention"
+        )
 
-            try:
-                loop.run_until_complete(compress_current_data(data_json))
-            finally:
-                loop.close()
+    @staticmethod
+    async def _upload_debug_shot(compressed_data: bytes, name: str):
+        try:
+            from telemetry_service import TelemetryService
 
-        compresson_thread = NamedThread(
-            "DebugShotCompr", target=compression_loop, args=(data_json,)
-        )
-        compresson_thread.start()
+            await TelemetryService.upload_debug_shot(compressed_data, name)
+            logger.info("Debug shot sent to server")
+        except Exception as e:
+            logger.error(f"Failed to send debug shot to server: {e}")
 
     @staticmethod
     def handleLog(log_record: logging.LogRecord, formatter):
@@ -0,0 +1,259 @@
+import json
+import os
+import random
+import threading
+from pathlib import Path
+
+import zstandard as zstd
+
+from config import ZSTD_DICTIONARY_PATH
+from log import MeticulousLogger
+
+logger = MeticulousLogger.getLogger(__name__)
+
+SHOT_JSON_SUFFIX = ".shot.json.zst"
+
+# Same ratio as the `zstd -10` the files used to be written with, but with a 1 MiB
+# window and match tables no larger than the window. The CLI uses 4 MiB and tables of
+# up to 16 MiB at this level, which buys next to nothing for a few MB of JSON.
+ZSTD_LEVEL = 10
+ZSTD_WINDOW_LOG = 20
+# Encoded JSON is handed to the compressor in pieces of about this many characters
+WRITE_CHUNK_SIZE = 64 * 1024
+# Enough to read the header of any zstd frame
+FRAME_HEADER_SIZE_MAX = 18
+
+_encoder = json.JSONEncoder(ensure_ascii=False)
+
+
+def compression_parameters(level: int = ZSTD_LEVEL, window_log: int = ZSTD_WINDOW_LOG):
+    params = zstd.ZstdCompressionParameters.from_level(level)
+    return zstd.ZstdCompressionParameters.from_level(
+        level,
+        window_log=window_log,
+        hash_log=min(params.hash_log, window_log),
+        chain_log=min(params.chain_log, window_log),
+        write_checksum=1,
+        write_dict_id=1,
+    )
+
+
+def iter_json(data):
+    """Yields `data` as JSON in pieces, identical to `json.dumps(data, ensure_ascii=False)`.
+
+    The top level lists of a dict, like the datapoints of a shot, are encoded one item
+    at a time so the document never exists as a whole string.
+    """
+    encode = _encoder.encode
+    if not isinstance(data, dict) or not all(isinstance(key, str) for key in data):
+        yield encode(data)
+        return
+
+    separator = "{"
+    for key, value in data.items():
+        yield f"{separator}{encode(key)}: "
+        separator = ", "
+        if isinstance(value, list):
+            item_separator = "["
+            for item in value:
+                yield item_separator + encode(item)
+                item_separator = ", "
+            yield "[]" if item_separator == "[" else "]"
+        else:
+            yield encode(value)
+    yield "{}" if separator == "{" else "}"
+
+
+def write_json_zst(
+    data,
+    path,
+    level: int = ZSTD_LEVEL,
+    window_log: int = ZSTD_WINDOW_LOG,
+    dictionary: zstd.ZstdCompressionDict = None,
+):
+    """Writes `data` as zstd compressed JSON, encoding and compressing it as a stream.
+
+    The file is written next to `path` and moved in place once complete. With a
+    `dictionary` the frame references it by its ID, see `ShotDictionaries`. Returns
+    the size of the uncompressed JSON in bytes.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = path.with_name(f"{path.name}.partial")
+    compressor = zstd.ZstdCompressor(
+        dict_data=dictionary, compression_params=compression_parameters(level, window_log)
+    )
+
+    size = 0
+    try:
+        with open(partial_path, "wb") as file:
+            with compressor.stream_writer(file, closefd=False) as writer:
+                pending = []
+                pending_size = 0
+                for piece in iter_json(data):
+                    pending.append(piece)
+                    pending_size += len(piece)
+                    if pending_size >= WRITE_CHUNK_SIZE:
+                        size += writer.write("".join(pending).encode("utf-8"))
+                        pending.clear()
+                        pending_size = 0
+                if pending:
+                    size += writer.write("".join(pending).encode("utf-8"))
+        os.replace(partial_path, path)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    return size
+
+
+def frame_dictionary_id(file) -> int:
+    """The dictionary the zstd frame at the current position of `file` needs, 0 if none"""
+    position = file.tell()
+    header = file.read(FRAME_HEADER_SIZE_MAX)
+    file.seek(position)
+    try:
+        return zstd.get_frame_parameters(header).dict_id
+    except zstd.ZstdError:
+        return 0
+
+
+def decompressor_for(file) -> zstd.ZstdDecompressor:
+    """A decompressor for the frame at the current position of `file`.
+
+    Frames compressed with a trained dictionary get it resolved by its ID.
+    """
+    dict_id = frame_dictionary_id(file)
+    if dict_id == 0:
+        return zstd.ZstdDecompressor()
+    dictionary = ShotDictionaries.get(dict_id)
+    if dictionary is None:
+        raise FileNotFoundError(f"zstd dictionary {dict_id} is missing")
+    return zstd.ZstdDecompressor(dict_data=dictionary)
+
+
+def read_zst(path) -> bytes:
+    with open(path, "rb") as file:
+        return decompressor_for(file).stream_reader(file).read()
+
+
+def read_json_zst(path):
+    return json.loads(read_zst(path))
+
+
+def recompress_without_dictionary(path) -> bytes:
+    """The file as a zstd frame that decompresses without the dictionary of the device"""
+    compressor = zstd.ZstdCompressor(compression_params=compression_parameters())
+    return compressor.compress(read_zst(path))
+
+
+class ShotDictionaries:
+    """Trained zstd dictionaries for shot files, stored in ZSTD_DICTIONARY_PATH.
+
+    Dictionaries are never changed or removed once written, files compressed with one
+    reference it by its ID. Each training adds a new version which is used for the
+    files written from then on.
+    """
+
+    SUFFIX = ".zdict"
+    # zstd recommends dictionaries of ~100 KiB trained on ~100 times as many samples
+    SIZE = 112 * 1024
+    SAMPLE_SIZE = 16 * 1024
+    MAX_SAMPLE_BYTES = 100 * SIZE
+    MIN_FILES = 8
+
+    _lock = threading.Lock()
+    _cache: dict[int, zstd.ZstdCompressionDict] = {}
+    _current: zstd.ZstdCompressionDict = None
+
+    @staticmethod
+    def _files():
+        directory = Path(ZSTD_DICTIONARY_PATH)
+        if not directory.is_dir():
+            return []
+        return sorted(directory.glob(f"*{ShotDictionaries.SUFFIX}"))
+
+    @staticmethod
+    def _load(path: Path):
+        dictionary = zstd.ZstdCompressionDict(path.read_bytes())
+        ShotDictionaries._cache[dictionary.dict_id()] = dictionary
+        return dictionary
+
+    @staticmethod
+    def get(dict_id: int):
+        with ShotDictionaries._lock:
+            dictionary = ShotDictionaries._cache.get(dict_id)
+            if dictionary is not None:
+                return dictionary
+            for path in ShotDictionaries._files():
+                if path.stem.endswith(f"-{dict_id}"):
+                    return ShotDictionaries._load(path)
+        return None
+
+    @staticmethod
+    def current():
+        """The newest dictionary, None if none was trained yet"""
+        with ShotDictionaries._lock:
+            if ShotDictionaries._current is None:
+                files = ShotDictionaries._files()
+                if files:
+                    ShotDictionaries._current = ShotDictionaries._load(files[-1])
+            return ShotDictionaries._current
+
+    @staticmethod
+    def available():
+        return [
+            {"name": path.name, "size": path.stat().st_size}
+            for path in ShotDictionaries._files()
+        ]
+
+    @staticmethod
+    def samples(paths) -> list[bytes]:
+        """Pieces of the given files to train on, up to MAX_SAMPLE_BYTES in total"""
+        paths = list(paths)
+        random.shuffle(paths)
+        samples = []
+        total = 0
+        for path in paths:
+            try:
+                data = read_zst(path)
+            except Exception as e:
+                logger.warning(f"Not training on {path}: {e}")
+                continue
+            for offset in range(0, len(data), ShotDictionaries.SAMPLE_SIZE):
+                samples.append(data[offset : offset + ShotDictionaries.SAMPLE_SIZE])
+                total += len(samples[-1])
+            if total >= ShotDictionaries.MAX_SAMPLE_BYTES:
+                break
+        return samples
+
+    @staticmethod
+    def train(paths):
+        """Trains a new dictionary version on the given files and makes it current.
+
+        Returns None if there are not enough files to train on.
+        """
+        paths = list(paths)
+        if len(paths) < ShotDictionaries.MIN_FILES:
+            logger.info(f"Not training a zstd dictionary on only {len(paths)} files")
+            return None
+
+        samples = ShotDictionaries.samples(paths)
+        dictionary = zstd.train_dictionary(ShotDictionaries.SIZE, samples, level=ZSTD_LEVEL)
+
+        with ShotDictionaries._lock:
+            version = len(ShotDictionaries._files()) + 1
+            directory = Path(ZSTD_DICTIONARY_PATH)
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory.joinpath(
+                f"{version:04d}-{dictionary.dict_id()}{ShotDictionaries.SUFFIX}"
+            )
+            partial_path = path.with_name(f"{path.name}.partial")
+            partial_path.write_bytes(dictionary.as_bytes())
+            os.replace(partial_path, path)
+            ShotDictionaries._cache[dictionary.dict_id()] = dictionary
+            ShotDictionaries._current = dictionary
+
+        logger.info(
+            f"Trained zstd dictionary {path.name} on {len(samples)} samples of {len(paths)} files"
+        )
+        return dictionary
@@ -0,0 +1,248 @@
+import json
+import math
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+import zstandard as zstd
+
+from shot_buffer import ShotBuffer
+from shot_file import ZSTD_LEVEL
+
+# A v2 shot file stores every channel of a shot as a little endian array, compressed
+# block by block, so single channels can be read without touching the others:
+#
+#   header          SHOT_V2_HEADER
+#   channel table   SHOT_V2_CHANNEL per channel
+#   meta block      zstd compressed JSON: the shot without its datapoints and the
+#                   values of the interned channels
+#   channel blocks  zstd compressed arrays, at the offsets given in the table, with
+#                   the bytes of the values shuffled (see `_shuffle`)
+#
+# The channels are the columns of a ShotBuffer, `to_legacy_json()` rebuilds the
+# document a .shot.json.zst file holds.
+SHOT_V2_MAGIC = b"METSHOT2"
+SHOT_V2_SCHEMA_VERSION = 1
+# magic, schema version, channels, datapoints, meta block offset, meta block length
+SHOT_V2_HEADER = struct.Struct("<8sHHIII")
+# name, array typecode, values, block offset, block length
+SHOT_V2_CHANNEL = struct.Struct("<32scxxxIII")
+SHOT_V2_SUFFIX = ".shot.v2"
+
+# Typecodes of fixed size on every platform, 'l' columns are stored as 'q'
+_FILE_TYPECODES = frozenset("bHqd")
+_INTERNED = ("status", "main_kind", "aux_kind")
+
+
+class ShotFormatError(ValueError):
+    pass
+
+
+def _shuffle(raw: bytes, itemsize: int) -> bytes:
+    # Byte k of every value is stored together, which compresses far better for
+    # slowly changing doubles and small integers
+    if itemsize == 1:
+        return raw
+    return b"".join(raw[k::itemsize] for k in range(itemsize))
+
+
+def _unshuffle(raw: bytes, itemsize: int) -> bytes:
+    if itemsize == 1:
+        return raw
+    count = len(raw) // itemsize
+    result = bytearray(len(raw))
+    for k in range(itemsize):
+        result[k::itemsize] = raw[k * count : (k + 1) * count]
+    return bytes(result)
+
+
+def _to_file_array(column: array) -> array:
+    if column.typecode not in _FILE_TYPECODES:
+        column = array("q", column)
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+
+def write_shot_v2(path, shot: dict, buffer: ShotBuffer, level: int = ZSTD_LEVEL) -> int:
+    """Writes the datapoints of `buffer` and the rest of the `shot` document.
+
+    The "data" of `shot` is not written, only where it was in the document. The file
+    is written next to `path` and moved in place once complete, the size of the file
+    is returned.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    compressor = zstd.ZstdCompressor(level=level)
+
+    meta = {
+        "shot": {key: (None if key == "data" else value) for key, value in shot.items()},
+        "tables": buffer.tables(),
+    }
+    meta_block = compressor.compress(json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+
+    columns = buffer.columns()
+    offset = SHOT_V2_HEADER.size + SHOT_V2_CHANNEL.size * len(columns)
+    header = SHOT_V2_HEADER.pack(
+        SHOT_V2_MAGIC,
+        SHOT_V2_SCHEMA_VERSION,
+        len(columns),
+        len(buffer),
+        offset,
+        len(meta_block),
+    )
+    offset += len(meta_block)
+
+    table = []
+    blocks = []
+    for name, column in columns.items():
+        column = _to_file_array(column)
+        block = compressor.compress(_shuffle(column.tobytes(), column.itemsize))
+        table.append(
+            SHOT_V2_CHANNEL.pack(
+                name.encode(), column.typecode.encode(), len(column), offset, len(block)
+            )
+        )
+        blocks.append(block)
+        offset += len(block)
+
+    partial_path = path.with_name(f"{path.name}.partial")
+    try:
+        with open(partial_path, "wb") as file:
+            file.write(header)
+            file.writelines(table)
+            file.write(meta_block)
+            file.writelines(blocks)
+        os.replace(partial_path, path)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    return offset
+
+
+def is_shot_v2(path) -> bool:
+    return str(path).endswith(SHOT_V2_SUFFIX)
+
+
+class ShotFileV2:
+    """Reads a v2 shot file, decompressing only the channels asked for"""
+
+    def __init__(self, data: bytes) -> None:
+        if len(data) < SHOT_V2_HEADER.size:
+            raise ShotFormatError("Shot file is truncated")
+        magic, version, channel_count, rows, meta_offset, meta_length = (
+            SHOT_V2_HEADER.unpack_from(data)
+        )
+        if magic != SHOT_V2_MAGIC:
+            raise ShotFormatError("Not a v2 shot file")
+        if version > SHOT_V2_SCHEMA_VERSION:
+            raise ShotFormatError(f"Unsupported shot file schema version {version}")
+
+        self._data = memoryview(data)
+        self._decompressor = zstd.ZstdDecompressor()
+        self.rows = rows
+        self._table = {}
+        for index in range(channel_count):
+            name, typecode, count, offset, length = SHOT_V2_CHANNEL.unpack_from(
+                data, SHOT_V2_HEADER.size + index * SHOT_V2_CHANNEL.size
+            )
+            self._table[name.rstrip(b"\0").decode()] = (
+                typecode.decode(),
+                count,
+                offset,
+                length,
+            )
+
+        meta = self._decompress(meta_offset, meta_length)
+        meta = json.loads(meta)
+        self.shot: dict = meta["shot"]
+        self.tables: dict = meta["tables"]
+        self._cache: dict[str, array] = {}
+
+    @staticmethod
+    def open(path):
+        return ShotFileV2(Path(path).read_bytes())
+
+    @property
+    def channels(self) -> list[str]:
+        return list(self._table)
+
+    def _decompress(self, offset: int, length: int) -> bytes:
+        if offset + length > len(self._data):
+            raise ShotFormatError("Shot file is truncated")
+        return self._decompressor.decompress(self._data[offset : offset + length])
+
+    def channel(self, name: str) -> array:
+        """The full column of a channel, interned channels hold table indices"""
+        column = self._cache.get(name)
+        if column is not None:
+            return column
+        if name not in self._table:
+            raise KeyError(f"Unknown channel {name}")
+        typecode, count, offset, length = self._table[name]
+        column = array(typecode)
+        raw = self._decompress(offset, length)
+        if len(raw) % column.itemsize:
+            raise ShotFormatError(f"Channel {name} is not a whole number of values")
+        column.frombytes(_unshuffle(raw, column.itemsize))
+        if sys.byteorder == "big":
+            column.byteswap()
+        if len(column) != count:
+            raise ShotFormatError(f"Channel {name} holds {len(column)} of {count} values")
+        self._cache[name] = column
+        return column
+
+    def row_range(self, start_ms: int = None, end_ms: int = None) -> range:
+        """The datapoints with a time within [start_ms, end_ms]"""
+        time = self.channel("time")
+        start = bisect_left(time, start_ms) if start_ms is not None else 0
+        end = bisect_right(time, end_ms) if end_ms is not None else self.rows
+        return range(start, max(start, end))
+
+    def read(self, channels: list[str] = None, start_ms: int = None, end_ms: int = None):
+        """The values of the given channels (all by default) within a time range.
+
+        Interned channels are resolved to their values, sensor channels are given per
+        datapoint with None where no sensors were recorded, as is NaN.
+        """
+        if channels is None:
+            channels = [name for name in self._table if name != "sensor_row"]
+        rows = self.row_range(start_ms, end_ms)
+        result = {}
+        for name in channels:
+            if name in _INTERNED:
+                values = self.tables[name]
+                column = self.channel(name)
+                result[name] = [values[column[row]] for row in rows]
+            elif name.startswith("sensors."):
+                sensor_row = self.channel("sensor_row")
+                column = self.channel(name)
+                result[name] = [
+                    _json_float(column[sensor_row[row]]) if sensor_row[row] >= 0 else None
+                    for row in rows
+                ]
+            else:
+                column = self.channel(name)
+                if column.typecode == "d":
+                    result[name] = [_json_float(column[row]) for row in rows]
+                else:
+                    result[name] = column[rows.start : rows.stop].tolist()
+        return result
+
+    def to_buffer(self) -> ShotBuffer:
+        columns = {name: self.channel(name) for name in self._table}
+        return ShotBuffer.from_columns(columns, self.tables)
+
+    def to_legacy_json(self) -> dict:
+        """The shot in the layout of a .shot.json.zst file"""
+        shot = dict(self.shot)
+        shot["data"] = self.to_buffer().to_list()
+        return shot
+
+
+def _json_float(value: float):
+    return None if math.isnan(value) else value
@@ -0,0 +1,156 @@
+import json
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+
+from log import MeticulousLogger
+
+logger = MeticulousLogger.getLogger(__name__)
+
+# A journal holds the shot in flight so it survives a crash or power cut:
+#
+#   header    8 bytes   JOURNAL_MAGIC
+#   records             JOURNAL_RECORD header followed by a JSON object
+#
+# Records are only ever appended. A record cut short by a crash fails its length or
+# checksum and ends the journal, everything before it is recovered.
+JOURNAL_MAGIC = b"METJRN01"
+# length of the JSON payload, crc32 of the payload
+JOURNAL_RECORD = struct.Struct("<II")
+JOURNAL_SUFFIX = ".journal"
+# Journals which could not be recovered are kept under this suffix for inspection
+FAILED_SUFFIX = ".failed"
+
+
+def journal_files(directory):
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return sorted(directory.glob(f"*{JOURNAL_SUFFIX}"))
+
+
+class ShotJournal:
+    """Append-only journal of the shot in flight.
+
+    Every `CHUNK_TICKS` datapoints the ones not yet journaled are appended as one
+    record. The file is flushed after every record but only synced to the storage
+    every `FSYNC_INTERVAL` seconds, and once more when the shot ends. The latest
+    datapoint is held back, its sensors are attached with the next tick.
+    """
+
+    CHUNK_TICKS = 20
+    FSYNC_INTERVAL = 5.0
+
+    def __init__(self, directory, shot, clock=time.monotonic) -> None:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory.joinpath(f"{shot.id}{JOURNAL_SUFFIX}")
+        self._clock = clock
+        self._file = open(self.path, "wb")
+        self._file.write(JOURNAL_MAGIC)
+        self._rows = 0
+        self._meta = None
+        self._last_sync = clock()
+        self.records_written = 0
+        self.bytes_written = len(JOURNAL_MAGIC)
+        self._append({"type": "start", "id": shot.id, "time": shot.startTime})
+        self._sync()
+
+    def _append(self, record: dict):
+        payload = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        self._file.write(JOURNAL_RECORD.pack(len(payload), zlib.crc32(payload)))
+        self._file.write(payload)
+        self.records_written += 1
+        self.bytes_written += JOURNAL_RECORD.size + len(payload)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = self._clock()
+
+    def _write(self, shot, end: int):
+        meta = {
+            "profile_name": shot.profile_name,
+            "profile": shot.profile,
+            "extraction_time": shot.extractionTime,
+        }
+        if meta != self._meta:
+            self._append({"type": "meta", **meta})
+            self._meta = meta
+        if end > self._rows:
+            rows = [shot.shotData.row(index) for index in range(self._rows, end)]
+            self._append({"type": "data", "rows": rows})
+            self._rows = end
+
+    def update(self, shot):
+        """Journals the complete datapoints of `shot` once a chunk is together"""
+        if self._file is None:
+            return
+        complete = len(shot.shotData) - 1
+        if complete - self._rows < ShotJournal.CHUNK_TICKS:
+            return
+        self._write(shot, complete)
+        if self._clock() - self._last_sync >= ShotJournal.FSYNC_INTERVAL:
+            self._sync()
+        else:
+            self._file.flush()
+
+    def close(self, shot=None):
+        """Journals everything left of `shot` and closes the journal"""
+        if self._file is None:
+            return
+        try:
+            if shot is not None:
+                self._write(shot, len(shot.shotData))
+            self._sync()
+        finally:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Removes the journal once its shot is safely stored"""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def read_journal(path):
+    """Rebuilds the shot of a journal in the layout of `Shot.to_json()`, together with
+    its "extraction_time" if the extraction ended before the journal was written.
+
+    Returns None if the journal does not even hold the start of a shot.
+    """
+    data = Path(path).read_bytes()
+    if not data.startswith(JOURNAL_MAGIC):
+        return None
+
+    shot = None
+    offset = len(JOURNAL_MAGIC)
+    while offset + JOURNAL_RECORD.size <= len(data):
+        length, crc = JOURNAL_RECORD.unpack_from(data, offset)
+        offset += JOURNAL_RECORD.size
+        payload = data[offset : offset + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logger.warning(f"Journal {path} ends in a torn record, recovering what is before")
+            break
+        offset += length
+
+        record = json.loads(payload)
+        match record.get("type"):
+            case "start":
+                shot = {
+                    "time": record["time"],
+                    "profile_name": None,
+                    "data": [],
+                    "id": record["id"],
+                }
+            case "meta" if shot is not None:
+                shot["profile_name"] = record.get("profile_name")
+                if record.get("profile"):
+                    shot["profile"] = record["profile"]
+                if record.get("extraction_time") is not None:
+                    shot["extraction_time"] = record["extraction_time"]
+            case "data" if shot is not None:
+                shot["data"].extend(record["rows"])
+    return shot
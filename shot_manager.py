@@ -1,35 +1,55 @@
 import json
-import os
-from named_thread import NamedThread
+import threading
 import time
 import traceback
 import uuid
 from datetime import datetime
 from pathlib import Path
-import subprocess
 
 from esp_serial.connection.emulation_data import EmulationData
 from esp_serial.data import SensorData, ShotData
 from log import MeticulousLogger
+from persistence import JobPriority, PersistenceService
+from rolling_stats import ShotStatistics
+from shot_summary import summarize_shot
+from shot_buffer import ShotBuffer
 from shot_database import ShotDataBase, SearchParams, SearchOrder
-from config import SHOT_PATH
+from shot_file import SHOT_JSON_SUFFIX, ShotDictionaries, write_json_zst
+from shot_format_v2 import SHOT_V2_SUFFIX, write_shot_v2
+from shot_journal import FAILED_SUFFIX, ShotJournal, journal_files, read_journal
+from config import (
+    CONFIG_USER,
+    SHOT_JOURNAL,
+    SHOT_JOURNAL_PATH,
+    SHOT_FILE_FORMAT,
+    SHOT_FILE_FORMAT_V2,
+    SHOT_PATH,
+    SHOT_ZSTD_DICTIONARY,
+    MeticulousConfig,
+)
+from runtime import Runtime
 
 logger = MeticulousLogger.getLogger(__name__)
 
 
 class Shot:
     def __init__(self) -> None:
-        self.shotData = []
+        self.shotData = self._new_buffer()
+        # statistics is fed on the bus thread of the shot and read on the loop
+        self.statistics = ShotStatistics()
+        self.statistics_lock = threading.Lock()
         self.profile = None
         self.profile_name = None
         self.startTime = time.time()
         self.extractionTime = None
         self.id = str(uuid.uuid4())
 
+    def _new_buffer(self) -> ShotBuffer:
+        return ShotBuffer()
+
     def addSensorData(self, sensorData: SensorData):
-        if len(self.shotData) > 0:
-            # Append onto the last shotData
-            self.shotData[-1]["sensors"] = dict(sensorData.__dict__)
+        # Attached to the last shotData
+        self.shotData.attach_sensors(sensorData)
 
     def addShotData(self, shotData: ShotData):
         from profiles import ProfileManager
@@ -63,31 +83,22 @@ class Shot:
                 ):
                     self.profile = last_profile["profile"]
 
-        # Shotdata is not json serialziable and we dont need the profile entry multiple times
-        formated_data = {
-            "shot": {
-                "pressure": max(shotData.pressure, 0),
-                "flow": max(shotData.flow, 0),
-                "weight": shotData.weight,
-                "gravimetric_flow": shotData.gravimetric_flow,
-                "setpoints": shotData.to_sio().get("setpoints", {}),
-            },
-            "time": shotData.time,
-            "profile_time": (
-                shotData.profile_time if shotData.profile_time is not None else shotData.time
-            ),
-            "status": shotData.status,
-        }
-        self.append_shot_data(formated_data)
+        self.append_shot_data(shotData)
+
+    def append_shot_data(self, shotData: ShotData):
+        self.shotData.append(shotData)
+        with self.statistics_lock:
+            self.statistics.feed(shotData)
 
-    def append_shot_data(self, formated_data):
-        self.shotData.append(formated_data)
+    def statistics_dict(self) -> dict:
+        with self.statistics_lock:
+            return self.statistics.to_dict()
 
-    def to_json(self):
+    def to_json(self, with_data: bool = True):
         shot_dict = {
             "time": self.startTime,
             "profile_name": self.profile_name,
-            "data": self.shotData,
+            "data": self.shotData.to_list() if with_data else None,
             "id": self.id,
         }
         # empty dictionary evaluate to false
@@ -96,24 +107,119 @@ class Shot:
         return shot_dict
 
     def get_last_datapoints(self, field, n=1):
-        return [d.get("shot", {}).get(field) for d in self.shotData[-n:]]
+        return self.shotData.last(field, n)
 
 
 class ShotManager:
     _last_shot: Shot = None
     _current_shot: Shot = None
+    _journal: ShotJournal = None
     db_history_id = None
 
-    # The ShotDatabase is required to work once we use the ShotManager.
-    # We therefore initialize it here
     @staticmethod
-    def init():
-        ShotDataBase.init()
+    def init(database_ready: bool = True):
+        """Starts saving shots, ShotDataBase must be initialized and migrated first.
+
+        Without `database_ready` the shot journals are kept for the next start rather
+        than failing to recover them into a database without the current schema.
+        """
+        PersistenceService.start()
+        if database_ready:
+            ShotManager.recoverJournals()
+            PersistenceService.submit(
+                JobPriority.BACKFILL, ShotManager.backfillSummaries, key="summary-backfill"
+            )
+        else:
+            logger.warning("The history database is not ready, keeping the shot journals")
+        if (
+            MeticulousConfig[CONFIG_USER][SHOT_ZSTD_DICTIONARY]
+            and not ShotDictionaries.current()
+        ):
+            Runtime.submit(ShotManager.trainDictionary)
         logger.info("ShotManager initialized successfully")
 
+    # Shots summarized per backfill job, so new shots don't wait behind all of them
+    SUMMARY_BACKFILL_BATCH = 50
+
+    @staticmethod
+    def backfillSummaries():
+        try:
+            done = ShotDataBase.backfill_summaries(ShotManager.SUMMARY_BACKFILL_BATCH)
+        except Exception as e:
+            logger.error(f"Failed to backfill shot summaries: {e}")
+            return
+        if done:
+            logger.info(f"Backfilled the summaries of {done} shots")
+        # The rest waits for the next start once the service is shutting down
+        if done == ShotManager.SUMMARY_BACKFILL_BATCH and PersistenceService.running():
+            PersistenceService.submit(
+                JobPriority.BACKFILL, ShotManager.backfillSummaries, key="summary-backfill"
+            )
+
+    # Files the zstd dictionary is trained on, the most recent ones
+    DICTIONARY_TRAINING_FILES = 200
+
+    @staticmethod
+    def trainDictionary():
+        files = sorted(SHOT_PATH.glob(f"*/*{SHOT_JSON_SUFFIX}"))
+        try:
+            return ShotDictionaries.train(files[-ShotManager.DICTIONARY_TRAINING_FILES :])
+        except Exception as e:
+            logger.error(f"Failed to train the shot zstd dictionary: {e}")
+            return None
+
+    @staticmethod
+    def _dictionary():
+        if not MeticulousConfig[CONFIG_USER][SHOT_ZSTD_DICTIONARY]:
+            return None
+        return ShotDictionaries.current()
+
+    @staticmethod
+    def recoverJournals():
+        """Adds the shots left behind by a crash or power cut to the history"""
+        for path in journal_files(SHOT_JOURNAL_PATH):
+            try:
+                shot_data = read_journal(path)
+                if shot_data is None or len(shot_data["data"]) == 0:
+                    logger.info(f"Removing empty shot journal {path}")
+                    path.unlink()
+                    continue
+
+                # The shot might have been stored in either format before the crash
+                stored = False
+                for suffix in (SHOT_JSON_SUFFIX, SHOT_V2_SUFFIX):
+                    _folder_name, file_path = ShotManager._timestampToFilePaths(
+                        shot_data["time"], suffix
+                    )
+                    stored = stored or ShotDataBase.history_exists({"file": str(file_path)})
+                _folder_name, file_path = ShotManager._timestampToFilePaths(shot_data["time"])
+                shot_data["file"] = str(file_path)
+                if not stored:
+                    if not SHOT_PATH.joinpath(file_path).exists():
+                        write_json_zst(
+                            shot_data,
+                            SHOT_PATH.joinpath(file_path),
+                            dictionary=ShotManager._dictionary(),
+                        )
+                    ShotDataBase.insert_history(shot_data)
+                logger.info(
+                    f"Recovered shot {shot_data['id']} with {len(shot_data['data'])} datapoints"
+                )
+                path.unlink()
+            except Exception as e:
+                logger.error(f"Failed to recover shot journal {path}: {e}")
+                logger.error(traceback.format_exc())
+                path.rename(path.with_suffix(FAILED_SUFFIX))
+
     @staticmethod
     def start():
         ShotManager._current_shot = Shot()
+        ShotManager._journal = None
+        if MeticulousConfig[CONFIG_USER][SHOT_JOURNAL]:
+            try:
+                ShotManager._journal = ShotJournal(SHOT_JOURNAL_PATH, ShotManager._current_shot)
+            except OSError as e:
+                logger.error(f"Failed to start the shot journal: {e}")
 
     @staticmethod
     def handleSensorData(sensoData: SensorData):
@@ -124,6 +230,13 @@ class ShotManager:
     def handleShotData(shotData: ShotData):
         if shotData is not None and ShotManager._current_shot is not None:
             ShotManager._current_shot.addShotData(shotData)
+            if ShotManager._journal is not None:
+                try:
+                    ShotManager._journal.update(ShotManager._current_shot)
+                except OSError as e:
+                    logger.error(f"Failed to write the shot journal, stopping it: {e}")
+                    ShotManager._journal.close()
+                    ShotManager._journal = None
 
     @staticmethod
     def handleExtractionEnd(time):
@@ -138,12 +251,18 @@ class ShotManager:
         return ShotManager._current_shot.extractionTime
 
     @staticmethod
-    def _timestampToFilePaths(timestamp: float):
+    def _shotFileSuffix():
+        if MeticulousConfig[CONFIG_USER][SHOT_FILE_FORMAT] == SHOT_FILE_FORMAT_V2:
+            return SHOT_V2_SUFFIX
+        return SHOT_JSON_SUFFIX
+
+    @staticmethod
+    def _timestampToFilePaths(timestamp: float, suffix: str = SHOT_JSON_SUFFIX):
         start = datetime.fromtimestamp(timestamp)
         folder_name = Path(start.strftime("%Y-%m-%d"))
 
         formatted_time = start.strftime("%H:%M:%S")
-        file_name = f"{formatted_time}.shot.json.zst"
+        file_name = f"{formatted_time}{suffix}"
 
         file_path = folder_name.joinpath(file_name)
         return (folder_name, file_path)
@@ -161,7 +280,7 @@ class ShotManager:
             formated_profile = {**formated_profile, **profile}
 
         _folder_name, file_path = ShotManager._timestampToFilePaths(
-            ShotManager._current_shot.startTime
+            ShotManager._current_shot.startTime, ShotManager._shotFileSuffix()
         )
 
         current_formated_shot = {
@@ -169,6 +288,7 @@ class ShotManager:
             "file": str(file_path),
             **ShotManager._current_shot.to_json(),
             "profile": formated_profile,
+            "statistics": ShotManager._current_shot.statistics_dict(),
         }
 
         return current_formated_shot
@@ -177,7 +297,7 @@ class ShotManager:
     def getLastShot():
         if not ShotManager._last_shot:
             results = ShotDataBase.search_history(
-                SearchParams(sort=SearchOrder.descending, max_results=1)
+                SearchParams(sort=SearchOrder.descending, max_results=1, dump_data=True)
             )
             if len(results) > 0:
                 ShotManager._last_shot = results[0]
@@ -186,8 +306,19 @@ class ShotManager:
     @staticmethod
     def stop():
         if ShotManager._current_shot is not None:
-
-            shot_data = ShotManager._current_shot.to_json()
+            journal = ShotManager._journal
+            ShotManager._journal = None
+            if journal is not None:
+                try:
+                    journal.close(ShotManager._current_shot)
+                except OSError as e:
+                    logger.error(f"Failed to finish the shot journal: {e}")
+
+            # v2 files are written straight from the columns of the shot
+            buffer = None
+            if ShotManager._shotFileSuffix() == SHOT_V2_SUFFIX:
+                buffer = ShotManager._current_shot.shotData
+            shot_data = ShotManager._current_shot.to_json(with_data=buffer is None)
             if shot_data.get("profile") is None:
                 from profiles import ProfileManager
 
@@ -195,38 +326,26 @@ class ShotManager:
                 if last_profile is not None:
                     shot_data["profile"] = last_profile.get("profile")
 
-            def write_current_shot(shot_data):
+            def write_current_shot(shot_data, buffer):
                 # Determine the paths based on the shot start
-                folder_name, file_path = ShotManager._timestampToFilePaths(shot_data["time"])
+                suffix = SHOT_V2_SUFFIX if buffer is not None else SHOT_JSON_SUFFIX
+                _folder_name, file_path = ShotManager._timestampToFilePaths(
+                    shot_data["time"], suffix
+                )
 
                 # Compress and write the shot to disk
                 logger.info("Writing and compressing shot file")
                 start = time.time()
 
                 try:
-                    # Create the folder if it does not exist
-                    os.makedirs(SHOT_PATH.joinpath(folder_name), exist_ok=True)
-                    data_json = json.dumps(shot_data, ensure_ascii=False)
-                    json_data = data_json.encode("utf-8")
-                    # Compress the file using zstd as all python implementations are too memory intensive
-                    result = subprocess.run(
-                        [
-                            "zstd",
-                            "-10",
-                            "-f",
-                            "-q",
-                            "-o",
-                            str(SHOT_PATH.joinpath(file_path)),
-                        ],
-                        input=json_data,
-                        capture_output=True,
-                        text=False,
-                        check=True,
-                    )
-                    if result.stderr:
-                        logger.error(f"zstd stderr: {result.stderr}")
-                    data_json = None
-
+                    if buffer is not None:
+                        write_shot_v2(SHOT_PATH.joinpath(file_path), shot_data, buffer)
+                    else:
+                        write_json_zst(
+                            shot_data,
+                            SHOT_PATH.joinpath(file_path),
+                            dictionary=ShotManager._dictionary(),
+                        )
                 except Exception as e:
                     logger.error(f"Failed to write shotfile to disk: {e}")
                     logger.error(traceback.format_exc())
@@ -243,9 +362,16 @@ class ShotManager:
                 try:
                     dbEntry = shot_data
                     dbEntry["file"] = str(file_path)
-                    history_id = ShotDataBase.insert_history(shot_data)
+                    # v2 shots come without their datapoints
+                    summary = None
+                    if buffer is not None:
+                        summary = summarize_shot(buffer.to_list())
+                    history_id = ShotDataBase.insert_history(shot_data, summary)
                     ShotManager._last_shot = None
                     ShotManager.getLastShot()
+                    # The shot is stored, otherwise the journal is recovered on next start
+                    if journal is not None:
+                        journal.discard()
 
                     # notify the SDM that the current shot is in the db
                 except Exception as e:
@@ -258,12 +384,13 @@ class ShotManager:
                     logger.info(f"Shot ingested with history id: {ShotManager.db_history_id}")
                 shot_data = None
 
-            compresson_thread = NamedThread(
-                "ShotCompr",
-                target=write_current_shot,
-                args=(shot_data,),
+            PersistenceService.submit(
+                JobPriority.SHOT,
+                write_current_shot,
+                shot_data,
+                buffer,
+                key=f"shot:{ShotManager._current_shot.id}",
             )
-            compresson_thread.start()
 
             # Shift and clear shot handles after saving
             ShotManager._current_shot.profile = None
@@ -271,48 +398,24 @@ class ShotManager:
 
     @staticmethod
     def isWeightStable(current_weight):
-        nr_samples_per_group = 3
         logger.debug("Checking if weight is stable")
-        if ShotManager._current_shot is None:
+        shot = ShotManager._current_shot
+        if shot is None:
             logger.warning("No current shot")
             return False
 
-        last_weights = ShotManager._current_shot.get_last_datapoints(
-            "weight", nr_samples_per_group * 2
+        with shot.statistics_lock:
+            stable = shot.statistics.weight_stable(current_weight)
+            last_avg = shot.statistics.recent_weight.mean
+            previous_avg = shot.statistics.previous_weight.mean
+        logger.debug(
+            f"Weight stable: {stable}, Last avg: {last_avg} Previous avg: {previous_avg}"
         )
-        if len(last_weights) < nr_samples_per_group * 2:
-            logger.warning("Not enough datapoints")
-            return False
-
-        # make sure its all numbers
-        last_weights = [
-            (float(weight.strip(' "')) if isinstance(weight, str) else float(weight))
-            for weight in last_weights
-        ]
-
-        try:
-            last_avg = sum(last_weights[-nr_samples_per_group:]) / nr_samples_per_group
-            previous_avg = (
-                sum(last_weights[-(nr_samples_per_group * 2) : -nr_samples_per_group])
-                / nr_samples_per_group
-            )
-
-            current_weight_stable = abs(current_weight - last_avg) < 0.05
-            avg_stable = abs(last_avg - previous_avg) < 0.05
-            # Check for massive weight change due to cup removal
-            massive_weight_change = abs(previous_avg - last_avg) > 10
-
-            logger.debug(
-                f"Current weight stable: {current_weight_stable}, Last three avg stable: {avg_stable}, Massive weight chang: {massive_weight_change}, Last three avg: {last_avg} Previous three avg: {previous_avg}, "
-            )
-            return current_weight_stable or avg_stable or massive_weight_change
-        except Exception as e:
-            logger.warning(f"Failed to check weight stability: {e}")
-            logger.warning(traceback.format_exc())
-            return False
+        return stable
 
 
 def test():
+    ShotDataBase.init()
     ShotManager.init()
     ShotManager.start()
     from profiles import ProfileManager
@@ -0,0 +1,155 @@
+import time
+
+from esp_serial.data import MachineStatus, ShotData
+from log import MeticulousLogger
+from machine_bus import MachineEvent
+
+logger = MeticulousLogger.getLogger(__name__)
+
+
+class ShotEvent:
+    # The machine left CLOSING_VALVE, a shot is running
+    SHOT_START = "shot_start"
+    SHOT_END = "shot_end"
+    # The shot entered RETRACTING, value is the shot time in ms
+    EXTRACTION_END = "extraction_end"
+    # A profile was loaded / the loaded profile was used up
+    DEBUG_START = "debug_start"
+    DEBUG_END = "debug_end"
+    IDLE = "idle"
+    HEATING_START = "heating_start"
+    HEATING_END = "heating_end"
+
+
+class ShotStateMachine:
+    """Follows the shots of the machine through the "Data" ticks of the ESP.
+
+    Every tick is stamped with the time of the running shot and the transitions it
+    caused are returned as a list of `MachineEvent` with a `ShotEvent` kind. Nothing
+    outside the state machine is touched, and time is taken from `clock`, so
+    recorded ticks can be fed through it at any speed.
+
+    A shot starts when the machine leaves CLOSING_VALVE. It ends when the machine
+    goes idle or purges, or once the weight stayed stable for
+    `stable_time_threshold` seconds while retracting, at the latest when retracting
+    is over.
+    """
+
+    def __init__(self, stable_time_threshold: float = 2.0, clock=time.time) -> None:
+        self.stable_time_threshold = stable_time_threshold
+        self._clock = clock
+        self.status = MachineStatus.IDLE
+        self.is_idle = True
+        self.brewing = False
+        self.shot_start_time = 0.0
+        self.stable_start_timestamp = None
+        self.extraction_end_time = None
+        self.time_passed = 0
+        self.profile_time = 0
+        # Cleared once the machine returns to idle
+        self.profile_ready = False
+        self._old_profile_ready = False
+
+    def _end_shot(self, now: float, events: list):
+        if self.stable_start_timestamp is not None:
+            logger.info(
+                f"shot ended at {now} with a stable weight time of: {now - self.stable_start_timestamp}s"
+            )
+            self.stable_start_timestamp = None
+        else:
+            logger.info("shot ended with weight unstable")
+        events.append(MachineEvent(ShotEvent.SHOT_END))
+
+    def _follow_shot(self, data: ShotData, now: float, events: list):
+        old_status = self.status
+        is_retracting = data.status == MachineStatus.RETRACTING
+
+        if old_status == MachineStatus.CLOSING_VALVE and data.status != old_status:
+            self.brewing = True
+            self.shot_start_time = now
+            self.extraction_end_time = None
+            logger.info("shot start_time: {:.1f}".format(now))
+            events.append(MachineEvent(ShotEvent.SHOT_START))
+            return
+
+        if not self.brewing:
+            return
+
+        # A shot could have ended
+        if self.is_idle or data.status == MachineStatus.PURGE:
+            self.brewing = False
+
+        # After retracting the shot is always over. No matter what, during retracting
+        # we wait for a stable weight
+        if old_status == MachineStatus.RETRACTING and not is_retracting:
+            self.brewing = False
+
+        if is_retracting:
+            if self.stable_start_timestamp is not None:
+                self.brewing = now - self.stable_start_timestamp < self.stable_time_threshold
+                if not data.stable_weight:
+                    self.stable_start_timestamp = None
+            elif data.stable_weight:
+                self.stable_start_timestamp = now
+
+        if not self.brewing:
+            self._end_shot(now, events)
+
+    def feed(self, data: ShotData, profile_ready: bool) -> list[MachineEvent]:
+        """Consumes a tick, stamps it in place and returns the transitions it caused.
+
+        `profile_ready` is whether a profile is currently loaded on the machine.
+        """
+        now = self._clock()
+        events: list[MachineEvent] = []
+        old_status = self.status
+        self.is_idle = data.status == MachineStatus.IDLE
+        is_heating = data.status == MachineStatus.HEATING
+
+        self._follow_shot(data, now, events)
+
+        if self.is_idle and old_status != MachineStatus.IDLE:
+            profile_ready = False
+
+        if old_status == MachineStatus.IDLE and not self.is_idle:
+            if data.status in (
+                MachineStatus.HEATING,
+                MachineStatus.CLOSING_VALVE,
+                MachineStatus.RETRACTING,
+                MachineStatus.STARTING,
+            ):
+                self.time_passed = 0
+                self.profile_time = 0
+
+        if profile_ready and not self._old_profile_ready:
+            events.append(MachineEvent(ShotEvent.DEBUG_START))
+        if not profile_ready and self._old_profile_ready:
+            events.append(MachineEvent(ShotEvent.DEBUG_END))
+        self._old_profile_ready = profile_ready
+        self.profile_ready = profile_ready
+
+        if self.is_idle and old_status != MachineStatus.IDLE:
+            events.append(MachineEvent(ShotEvent.IDLE))
+
+        if is_heating and old_status != MachineStatus.HEATING:
+            self.time_passed = 0
+            self.profile_time = 0
+            events.append(MachineEvent(ShotEvent.HEATING_START))
+
+        if old_status == MachineStatus.HEATING and not is_heating:
+            events.append(MachineEvent(ShotEvent.HEATING_END))
+
+        if self.brewing:
+            self.time_passed = int((now - self.shot_start_time) * 1000.0)
+            self.profile_time = self.time_passed
+            if data.status == MachineStatus.RETRACTING:
+                if self.extraction_end_time is None:
+                    self.extraction_end_time = self.time_passed
+                    events.append(
+                        MachineEvent(ShotEvent.EXTRACTION_END, self.extraction_end_time)
+                    )
+                self.profile_time = self.extraction_end_time
+
+        data.stamp_time_and_state(self.time_passed, self.brewing, self.profile_time)
+        self.status = data.status
+        return events
@@ -0,0 +1,96 @@
+import math
+
+from esp_serial.data import MachineStatus
+
+# Points of the preview curve stored with the summary
+PREVIEW_POINTS = 50
+# The summary temperature is taken from this sensor
+TEMPERATURE_SENSOR = "external_1"
+PREVIEW_CHANNELS = ("pressure", "flow", "weight")
+
+
+def _number(value) -> float | None:
+    # Readings the ESP couldn't parse are stored as the string "NaN"
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if not math.isfinite(value):
+        return None
+    return float(value)
+
+
+def _mean(values: list[float]) -> float | None:
+    return sum(values) / len(values) if values else None
+
+
+def _rounded(value: float | None, digits: int = 2) -> float | None:
+    return None if value is None else round(value, digits)
+
+
+def _preview(times: list[float], channels: dict[str, list], points: int) -> dict:
+    """Averages the channels over `points` buckets of consecutive datapoints"""
+    count = len(times)
+    preview = {"time": [], **{name: [] for name in channels}}
+    buckets = min(points, count)
+    for bucket in range(buckets):
+        start = bucket * count // buckets
+        end = (bucket + 1) * count // buckets
+        preview["time"].append(times[start])
+        for name, values in channels.items():
+            finite = [v for v in values[start:end] if v is not None]
+            preview[name].append(_rounded(_mean(finite)))
+    return preview
+
+
+def summarize_shot(data: list[dict], preview_points: int = PREVIEW_POINTS) -> dict:
+    """The summary of the datapoints of a shot, in the layout of its shot file.
+
+    Times are in seconds. Peaks and averages cover the extraction, the datapoints
+    before the machine started retracting, the final weight is the last weight
+    measured.
+    """
+    times = []
+    channels = {name: [] for name in PREVIEW_CHANNELS}
+    temperatures = []
+    extraction_points = None
+    end_status = None
+
+    for index, point in enumerate(data):
+        shot = point.get("shot") or {}
+        status = point.get("status")
+        if status == MachineStatus.RETRACTING and extraction_points is None:
+            extraction_points = index
+        times.append(_number(point.get("time")) or 0.0)
+        for name, values in channels.items():
+            values.append(_number(shot.get(name)))
+        sensors = point.get("sensors")
+        if sensors is not None:
+            temperature = _number(sensors.get(TEMPERATURE_SENSOR))
+            if temperature is not None:
+                temperatures.append(temperature)
+        end_status = status
+
+    if extraction_points is None:
+        extraction_points = len(times)
+
+    def extraction(name):
+        return [v for v in channels[name][:extraction_points] if v is not None]
+
+    pressure = extraction("pressure")
+    flow = extraction("flow")
+    weights = [v for v in channels["weight"] if v is not None]
+
+    return {
+        "points": len(times),
+        "total_time": times[-1] / 1000 if times else None,
+        "extraction_time": times[extraction_points - 1] / 1000 if extraction_points else None,
+        "final_weight": _rounded(weights[-1]) if weights else None,
+        "peak_pressure": _rounded(max(pressure, default=None)),
+        "avg_pressure": _rounded(_mean(pressure)),
+        "peak_flow": _rounded(max(flow, default=None)),
+        "avg_flow": _rounded(_mean(flow)),
+        "min_temperature": _rounded(min(temperatures, default=None)),
+        "max_temperature": _rounded(max(temperatures, default=None)),
+        "avg_temperature": _rounded(_mean(temperatures)),
+        "end_status": end_status,
+        "preview": _preview(times, channels, preview_points),
+    }
@@ -0,0 +1,161 @@
+import struct
+
+from esp_serial.binary_protocol import (
+    FRAME_SENSOR_DATA,
+    FRAME_SHOT_DATA,
+    TELEMETRY_BINARY_COMMAND,
+    TELEMETRY_CSV_COMMAND,
+    BinaryFrame,
+    TelemetryNegotiator,
+    decode_frame,
+    encode_frame,
+    encode_sensor_data,
+    encode_shot_data,
+)
+from esp_serial.data import ESPInfo, MachineState, SensorData, ShotData
+from esp_serial.line_framer import LineFramer
+
+
+def make_shot_data():
+    return ShotData(
+        pressure=9.1,
+        flow=2.5,
+        weight=36.2,
+        stable_weight=True,
+        temperature=92.5,
+        status="Extraction",
+        profile="Espresso ☕",
+        main_controller_kind="Pressure",
+        main_setpoint=9.0,
+        aux_controller_kind="Flow",
+        aux_setpoint=3.0,
+        is_aux_controller_active=False,
+        gravimetric_flow=1.75,
+    )
+
+
+def make_sensor_data():
+    return SensorData(
+        external_1=90.1,
+        tube=85.25,
+        motor_position=10.5,
+        pressure_sensor=301.0,
+        adc_3=50.0,
+        water_status=True,
+        motor_thermistor=35.0,
+        weight_prediction=float("nan"),
+    )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestBinaryFrames:
+    def test_shot_data_roundtrip(self):
+        frame = encode_frame(FRAME_SHOT_DATA, encode_shot_data(make_shot_data()))
+        [decoded] = LineFramer().feed(frame)
+        prefix, data = decode_frame(decoded)
+
+        assert prefix == "Data"
+        assert data.pressure == 9.1
+        assert data.weight == 36.2
+        assert data.stable_weight is True
+        assert data.profile == "Espresso ☕"
+        assert data.main_controller_kind == "Pressure"
+        assert data.aux_controller_kind == "Flow"
+        assert data.state == MachineState.BREWING
+        assert data.to_sio() == make_shot_data().to_sio() | {"state": MachineState.BREWING}
+
+    def test_sensor_data_roundtrip(self):
+        frame = encode_frame(FRAME_SENSOR_DATA, encode_sensor_data(make_sensor_data()))
+        [decoded] = LineFramer().feed(frame)
+        prefix, sensors = decode_frame(decoded)
+
+        assert prefix == "Sensors"
+        assert sensors.external_1 == 90.1
+        assert sensors.tube == 85.25
+        assert sensors.water_status is True
+        assert sensors.weight_prediction == "NaN"
+
+    def test_frames_are_interleaved_with_lines(self):
+        # Payloads can contain newlines, they must not split the frame
+        sensors = make_sensor_data()
+        sensors.motor_position = struct.unpack("<f", b"\n\n\x20\x41")[0]
+        frame = encode_frame(FRAME_SENSOR_DATA, encode_sensor_data(sensors))
+        assert b"\n" in frame
+        stream = b"Log,info,hello\r\n" + frame + b"ESPInfo,1.0.0\r\n" + frame
+
+        framer = LineFramer()
+        batch = []
+        for i in range(0, len(stream), 7):
+            batch.extend(framer.feed(stream[i : i + 7]))
+
+        assert batch[0] == b"Log,info,hello\r\n"
+        assert type(batch[1]) is BinaryFrame
+        assert batch[2] == b"ESPInfo,1.0.0\r\n"
+        assert type(batch[3]) is BinaryFrame
+        assert framer.stats.binary_frames == 2
+
+    def test_corrupted_frame_is_not_decoded(self):
+        frame = bytearray(encode_frame(FRAME_SHOT_DATA, encode_shot_data(make_shot_data())))
+        frame[10] ^= 0xFF
+        framer = LineFramer()
+        batch = framer.feed(bytes(frame) + b"\nData,1\r\n")
+
+        assert all(type(item) is bytes for item in batch)
+        assert batch[-1] == b"Data,1\r\n"
+        assert framer.stats.crc_errors == 1
+
+    def test_unknown_frame_type_is_ignored(self):
+        assert decode_frame(BinaryFrame(0x7F, b"")) is None
+
+
+class TestTelemetryNegotiation:
+    def test_esp_info_announces_capabilities(self):
+        args = ESPInfo(capabilities="bin1|foo").to_args()
+        info = ESPInfo.from_args(args)
+        assert info.supports("bin1")
+        assert not info.supports("bar")
+        assert not ESPInfo.from_args(ESPInfo().to_args()).supports("bin1")
+
+    def test_stays_with_csv_without_capability(self):
+        negotiator = TelemetryNegotiator()
+        assert negotiator.on_info(ESPInfo()) is None
+        assert negotiator.mode == TelemetryNegotiator.CSV
+
+    def test_respects_config(self):
+        negotiator = TelemetryNegotiator(enabled=False)
+        assert negotiator.on_info(ESPInfo(capabilities="bin1")) is None
+
+    def test_switches_to_binary(self):
+        negotiator = TelemetryNegotiator()
+        assert negotiator.on_info(ESPInfo(capabilities="bin1")) == TELEMETRY_BINARY_COMMAND
+        # Only asked once
+        assert negotiator.on_info(ESPInfo(capabilities="bin1")) is None
+        negotiator.on_binary_telemetry()
+        assert negotiator.mode == TelemetryNegotiator.BINARY
+
+    def test_falls_back_to_csv_if_the_esp_does_not_switch(self):
+        clock = FakeClock()
+        negotiator = TelemetryNegotiator(clock=clock)
+        negotiator.on_info(ESPInfo(capabilities="bin1"))
+
+        clock.now = 1.0
+        assert negotiator.on_csv_telemetry() is None
+        clock.now = TelemetryNegotiator.SWITCH_TIMEOUT + 0.1
+        assert negotiator.on_csv_telemetry() == TELEMETRY_CSV_COMMAND
+        assert negotiator.failed
+        assert negotiator.on_info(ESPInfo(capabilities="bin1")) is None
+
+    def test_csv_after_binary_resets(self):
+        negotiator = TelemetryNegotiator()
+        negotiator.on_info(ESPInfo(capabilities="bin1"))
+        negotiator.on_binary_telemetry()
+        assert negotiator.on_csv_telemetry() is None
+        assert negotiator.mode == TelemetryNegotiator.CSV
+        assert negotiator.on_info(ESPInfo(capabilities="bin1")) == TELEMETRY_BINARY_COMMAND
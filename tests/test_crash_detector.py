@@ -0,0 +1,61 @@
+from esp_serial.crash_detector import CrashDetector
+
+BOOT_BANNER = "rst:0xc (SW_CPU_RESET),boot:0x13 (SPI_FAST_FLASH_BOOT)"
+
+CRASH_REPORT = [
+    "Guru Meditation Error: Core  1 panic'ed (LoadProhibited). Exception was unhandled.",
+    "",
+    "Core  1 register dump:",
+    "PC      : 0x400d2f5e  PS      : 0x00060830  A0      : 0x800d3a1c",
+    "",
+    "Backtrace: 0x400d2f5b:0x3ffb1f40 0x400d3a19:0x3ffb1f60 0x4008a0e2:0x3ffb1f90",
+    "ELF file SHA256: 0000000000000000",
+]
+
+
+class TestCrashDetector:
+    def test_ignores_regular_lines(self):
+        detector = CrashDetector()
+        assert detector.feed("Log,info,heater on") is None
+        assert detector.feed("rst:0x1 without the rest") is None
+        assert not detector.collecting
+        assert detector.last_crash is None
+
+    def test_detects_boot_banner(self):
+        assert CrashDetector().feed(BOOT_BANNER) == CrashDetector.BOOT
+
+    def test_collects_crash_report_until_boot(self):
+        detector = CrashDetector()
+        events = [detector.feed(line) for line in CRASH_REPORT]
+        assert events == [CrashDetector.CRASH] + [None] * (len(CRASH_REPORT) - 1)
+        assert detector.collecting
+
+        assert detector.feed(BOOT_BANNER) == CrashDetector.BOOT
+        assert not detector.collecting
+        detector.feed("Log,info,after boot")
+
+        crash = detector.last_crash
+        assert crash.kind == "guru meditation error"
+        assert crash.signature == CRASH_REPORT[0]
+        assert crash.lines == CRASH_REPORT
+        assert crash.backtrace == ["0x400d2f5b", "0x400d3a19", "0x4008a0e2"]
+        assert crash.reset_reason == BOOT_BANNER
+
+    def test_crash_report_is_bounded(self):
+        detector = CrashDetector(max_lines=4, history=2)
+        for crash in range(3):
+            detector.feed("Backtrace: 0x400d2f5b:0x3ffb1f40")
+            for i in range(10):
+                detector.feed(f"line {i}")
+            detector.feed(BOOT_BANNER)
+
+        assert len(detector.crashes) == 2
+        assert len(detector.last_crash.lines) == 4
+        assert detector.last_crash.truncated == 7
+
+    def test_crash_is_reported_once(self):
+        detector = CrashDetector()
+        detector.feed(CRASH_REPORT[0])
+        crash = detector.take_unreported()
+        assert crash is detector.last_crash
+        assert detector.take_unreported() is None
@@ -0,0 +1,97 @@
+from esp_serial.data import SensorData, ShotData
+from esp_serial.decimation import (
+    DecimationMode,
+    Decimator,
+    LatestAggregate,
+    average,
+    decimation_rate,
+    min_max,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def shot(pressure, time=0, status="Extraction"):
+    return ShotData(pressure=pressure, flow=1.0, time=time, status=status)
+
+
+class TestAggregation:
+    def test_average_averages_measurements_and_keeps_latest_state(self):
+        result = average([shot(2.0, 100, "Preinfusion"), shot(4.0, 200), shot(9.0, 300)])
+        assert result.pressure == 5.0
+        assert result.flow == 1.0
+        assert result.time == 300
+        assert result.status == "Extraction"
+
+    def test_average_skips_missing_measurements(self):
+        sensors = [SensorData(motor_thermistor="NaN"), SensorData(motor_thermistor=40.0)]
+        assert average(sensors).motor_thermistor == 40.0
+        sensors = [SensorData(motor_thermistor="NaN"), SensorData(motor_thermistor="NaN")]
+        assert average(sensors).motor_thermistor == "NaN"
+
+    def test_min_max_keeps_peaks_in_order(self):
+        records = [shot(3.0, 0), shot(12.0, 10), shot(5.0, 20), shot(1.0, 30), shot(4.0, 40)]
+        first, second = min_max(records)
+        assert (first.pressure, second.pressure) == (12.0, 1.0)
+        assert (first.time, second.time) == (0, 40)
+
+    def test_min_max_of_two_records_returns_both(self):
+        records = [shot(3.0), shot(1.0)]
+        assert min_max(records) == records
+
+
+class TestDecimator:
+    def test_passes_everything_through_without_rate(self):
+        decimator = Decimator()
+        sample = (shot(1.0), SensorData())
+        assert decimator.add(*sample) == [sample]
+        assert decimator.flush() == []
+
+    def test_averages_buckets(self):
+        clock = FakeClock()
+        decimator = Decimator(10, clock=clock)
+        emitted = []
+        for i in range(25):
+            clock.now = i * 0.01
+            emitted += decimator.add(shot(float(i)), SensorData(tube=float(i)))
+        emitted += decimator.flush()
+
+        assert [s.pressure for s, _ in emitted] == [4.5, 14.5, 22.0]
+        assert [sensors.tube for _, sensors in emitted] == [4.5, 14.5, 22.0]
+
+    def test_min_max_buckets(self):
+        clock = FakeClock()
+        decimator = Decimator(10, DecimationMode.MINMAX, clock=clock)
+        emitted = []
+        for i, pressure in enumerate([1.0, 9.0, 2.0, 3.0, 0.5, 4.0, 4.0, 4.0, 4.0, 4.0]):
+            clock.now = i * 0.01
+            emitted += decimator.add(shot(pressure), SensorData())
+        emitted += decimator.flush()
+
+        assert [s.pressure for s, _ in emitted] == [9.0, 0.5]
+        assert all(type(sensors) is SensorData for _, sensors in emitted)
+
+    def test_decimation_rate(self):
+        assert decimation_rate(10, 10) is None
+        assert decimation_rate(20, 10) is None
+        assert decimation_rate(0, 100) is None
+        assert decimation_rate(10, 100) == 10
+
+
+class TestLatestAggregate:
+    def test_take_averages_since_last_take(self):
+        aggregate = LatestAggregate()
+        assert aggregate.take() is None
+        aggregate.add(shot(2.0), SensorData(tube=80.0))
+        aggregate.add(shot(4.0), SensorData(tube=90.0))
+
+        shot_data, sensor_data = aggregate.take()
+        assert shot_data.pressure == 3.0
+        assert sensor_data.tube == 85.0
+        assert aggregate.take() is None
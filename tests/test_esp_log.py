@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+from esp_serial.esp_log import EspLogForwarder, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+    def test_allows_burst_then_refills(self):
+        bucket = TokenBucket(rate=1.0, burst=2, now=0.0)
+        assert bucket.take(0.0)
+        assert bucket.take(0.0)
+        assert not bucket.take(0.5)
+        assert bucket.take(1.0)
+        assert not bucket.take(1.0)
+
+
+class TestEspLogForwarder:
+    def test_repeated_lines_are_coalesced(self):
+        forwarder = EspLogForwarder()
+        for _ in range(5):
+            forwarder.submit(["info", "pressure sensor timeout"])
+        forwarder.submit(["info", "other"])
+
+        with patch("esp_serial.esp_log.logger") as logger:
+            forwarder.flush()
+        messages = [call.args[0] for call in logger.info.call_args_list]
+        assert messages == ["pressure sensor timeout (repeated 5 times)", "other"]
+        assert forwarder.stats.received == 6
+        assert forwarder.stats.coalesced == 4
+        assert forwarder.stats.forwarded == 2
+
+    def test_pending_lines_are_bounded(self):
+        forwarder = EspLogForwarder()
+        for i in range(EspLogForwarder.MAX_PENDING + 10):
+            forwarder.submit(["debug", f"line {i}"])
+        assert forwarder.stats.dropped == 10
+
+        with patch("esp_serial.esp_log.logger"):
+            forwarder.flush()
+        assert forwarder.stats.forwarded == EspLogForwarder.MAX_PENDING
+
+    def test_sentry_captures_are_rate_limited_per_message(self):
+        clock = FakeClock()
+        forwarder = EspLogForwarder(clock=clock)
+        with (
+            patch("esp_serial.esp_log.sentry_sdk") as sentry,
+            patch("esp_serial.esp_log.logger"),
+        ):
+            scope = sentry.new_scope.return_value.__enter__.return_value
+            for i in range(EspLogForwarder.SENTRY_BURST + 2):
+                forwarder.submit(["warning", "heater fault", f"count={i}", "sentry=true"])
+                forwarder.submit(["warning", "motor fault", "sentry=true"])
+                forwarder.flush()
+
+            # Every message has its own bucket
+            assert forwarder.stats.sentry_captured == 2 * EspLogForwarder.SENTRY_BURST
+            assert forwarder.stats.sentry_suppressed == 4
+            scope.set_context.assert_any_call("esp-data", {"count": "0"})
+
+            clock.now = 1 / EspLogForwarder.SENTRY_RATE
+            forwarder.submit(["warning", "heater fault", "sentry=true"])
+            forwarder.flush()
+            assert forwarder.stats.sentry_captured == 2 * EspLogForwarder.SENTRY_BURST + 1
+
+    def test_malformed_line_is_counted(self):
+        forwarder = EspLogForwarder()
+        forwarder.submit([])
+        with patch("esp_serial.esp_log.logger"):
+            forwarder.flush()
+        assert forwarder.stats.errors == 1
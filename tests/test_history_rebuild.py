@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+
+import pytest
+import zstandard as zstd
+
+from esp_serial.data import ShotData
+import history_rebuild
+from history_rebuild import HistoryRebuild, shot_files
+from shot_database import SearchParams, ShotDataBase
+from shot_format_v2 import write_shot_v2
+from shot_manager import Shot
+from tests.test_shot_database import make_profile, shot_db, shot_points  # noqa: F401
+
+
+def write_json_shot(shot_path, file_entry, time, profile, points=20):
+    path = shot_path / file_entry
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shot = {
+        "id": f"uuid-{file_entry}",
+        "time": time,
+        "profile_name": profile["name"],
+        "profile": profile,
+        "data": shot_points(points),
+    }
+    path.write_bytes(zstd.ZstdCompressor().compress(json.dumps(shot).encode()))
+
+
+def write_v2_shot(shot_path, file_entry, profile, ticks=30):
+    shot = Shot()
+    shot.profile = profile
+    shot.profile_name = profile["name"]
+    for i in range(ticks):
+        shot.shotData.append(ShotData(pressure=9.0, flow=2.0, weight=i / 2, time=i * 100))
+    path = shot_path / file_entry
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_shot_v2(path, shot.to_json(with_data=False), shot.shotData)
+
+
+def history_page():
+    return ShotDataBase.search_history(
+        SearchParams(summary=True, max_results=100, order_by=["date"], sort="asc")
+    )
+
+
+class TestInsertHistoryBatch:
+    def test_ids_in_order(self):
+        espresso = make_profile(id="espresso", name="Espresso")
+        lungo = make_profile(id="lungo", name="Lungo")
+        first = ShotDataBase.insert_history(
+            {"file": "a.json.zst", "time": 1.0, "profile_name": "Espresso", "profile": espresso}
+        )
+
+        entries = [
+            {
+                "file": f"{name}.json.zst",
+                "time": i + 2.0,
+                "profile_name": p["name"],
+                "profile": p,
+            }
+            for i, (name, p) in enumerate(
+                [("b", lungo), ("a", espresso), ("c", espresso), ("b", lungo)]
+            )
+        ]
+        entries[2]["data"] = shot_points(10)
+        ids = ShotDataBase.insert_history_batch(entries)
+
+        assert ids[1] == first
+        assert ids[0] == ids[3]
+        assert len(set(ids)) == 3
+        shots = history_page()
+        assert [shot["file"] for shot in shots] == ["a.json.zst", "b.json.zst", "c.json.zst"]
+        assert shots[2]["summary"]["points"] == 10
+        assert shots[1]["summary"] is None
+        # Each new profile is indexed once
+        assert ShotDataBase.autocomplete_profile_name("Lungo") == [
+            {"profile": "Lungo", "type": "profile"}
+        ]
+
+    def test_shot_without_profile(self):
+        entry = {"file": "a.json.zst", "time": 1.0, "profile_name": "None", "profile": None}
+        with pytest.raises(ValueError):
+            ShotDataBase.insert_history_batch([entry])
+        assert history_page() == []
+
+
+class TestHistoryRebuild:
+    def test_rebuild_from_shot_files(self, tmp_path):
+        shot_path = tmp_path / "shots"
+        espresso = make_profile(id="espresso", name="Espresso")
+        write_json_shot(shot_path, "2026-10-01/08:00:00.shot.json.zst", 1000.0, espresso)
+        write_json_shot(shot_path, "2026-10-02/08:00:00.shot.json.zst", 2000.0, espresso, 40)
+        write_v2_shot(shot_path, "2026-10-03/08:00:00.shot.v2", make_profile(name="Turbo"))
+        broken = shot_path / "2026-10-04" / "08:00:00.shot.json.zst"
+        broken.parent.mkdir()
+        broken.write_bytes(b"not zstd")
+
+        assert len(shot_files(shot_path)) == 4
+        status = HistoryRebuild.run(shot_path, workers=0, batch_size=2)
+        assert status["running"] is False
+        assert (status["files"], status["done"], status["failed"]) == (4, 3, 1)
+        assert status["error"] is None
+
+        shots = history_page()
+        assert [shot["file"] for shot in shots][:2] == [
+            "2026-10-01/08:00:00.shot.json.zst",
+            "2026-10-02/08:00:00.shot.json.zst",
+        ]
+        assert shots[0]["id"] == "uuid-2026-10-01/08:00:00.shot.json.zst"
+        assert shots[0]["profile"]["db_key"] == shots[1]["profile"]["db_key"]
+        assert shots[1]["summary"]["points"] == 40
+        assert shots[2]["summary"]["points"] == 30
+        assert shots[2]["name"] == "Turbo"
+
+        # Running again keeps the stored shots
+        HistoryRebuild.run(shot_path, workers=0)
+        assert len(history_page()) == 3
+
+    def test_worker_processes(self, tmp_path):
+        shot_path = tmp_path / "shots"
+        for day in range(1, 6):
+            write_json_shot(
+                shot_path,
+                f"2026-10-0{day}/08:00:00.shot.json.zst",
+                day * 1000.0,
+                make_profile(),
+            )
+
+        status = HistoryRebuild.run(shot_path, workers=2)
+        assert (status["done"], status["failed"]) == (5, 0)
+        assert [shot["summary"]["points"] for shot in history_page()] == [20] * 5
+
+    def test_only_one_rebuild_at_a_time(self, monkeypatch):
+        release = threading.Event()
+
+        def waiting_files(shot_path=None):
+            release.wait()
+            return []
+
+        monkeypatch.setattr(history_rebuild, "shot_files", waiting_files)
+        results = []
+        starters = [
+            threading.Thread(target=lambda: results.append(HistoryRebuild.start()))
+            for _ in range(4)
+        ]
+        for starter in starters:
+            starter.start()
+        for starter in starters:
+            starter.join()
+        assert sorted(results) == [False, False, False, True]
+        with pytest.raises(RuntimeError):
+            HistoryRebuild.run(workers=0)
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while HistoryRebuild.status()["running"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        status = HistoryRebuild.status()
+        assert status["running"] is False
+        assert status["error"] is None
@@ -0,0 +1,80 @@
+from esp_serial.binary_protocol import FRAME_OVERHEAD, BinaryFrame
+from esp_serial.link_stats import RollingCounter, SerialLinkStats
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRollingCounter:
+    def test_counts_full_seconds_in_window(self):
+        counter = RollingCounter(window=10)
+        for second in range(20):
+            counter.add(second + 0.5, 2)
+        # Second 19 is still filling up
+        assert counter.count(19.5, 1) == 2
+        assert counter.count(19.5, 5) == 10
+        assert counter.count(19.5, 10) == 18
+        assert counter.total == 40
+
+    def test_old_buckets_are_dropped(self):
+        counter = RollingCounter(window=5)
+        counter.add(0.0)
+        counter.add(100.0)
+        assert len(counter._buckets) == 1
+        assert counter.count(101.0, 5) == 1
+
+
+class TestSerialLinkStats:
+    def test_throughput_and_message_counts(self):
+        clock = FakeClock()
+        stats = SerialLinkStats(clock=clock)
+        for i in range(10):
+            clock.now = 100.05 + i * 0.1
+            stats.record_batch(3, 300)
+            stats.record_valid("Data")
+            stats.record_invalid("unknown")
+
+        clock.now = 101.5
+        result = stats.to_dict()
+        assert result["lines_per_second"]["1s"] == 30
+        assert result["bytes_per_second"]["1s"] == 3000
+        assert result["lines_total"] == 30
+        assert result["valid_messages"]["Data"]["total"] == 10
+        assert result["invalid_messages"]["unknown"]["1s"] == 10
+
+    def test_telemetry_gaps(self):
+        stats = SerialLinkStats(clock=FakeClock())
+        for read_at in [0.0, 0.12, 0.24, 0.64, 0.76]:
+            stats.record_telemetry(read_at)
+
+        gaps = stats.to_dict()["telemetry_gaps"]
+        assert gaps["max_ms"] == 400
+        assert gaps["last_ms"] == 120
+        assert gaps["histogram"]["<100ms"] == 0
+        assert gaps["histogram"]["<150ms"] == 3
+        assert gaps["histogram"]["<500ms"] == 1
+        assert sum(gaps["histogram"].values()) == 4
+
+    def test_read_to_emit_latency(self):
+        clock = FakeClock()
+        stats = SerialLinkStats(clock=clock)
+        assert stats.to_dict()["read_to_emit_latency"] == {"samples": 0}
+
+        stats.record_telemetry(clock.now)
+        clock.now += 0.02
+        stats.record_emit()
+        # A repeated emit of the same sample is not counted again
+        clock.now += 0.5
+        stats.record_emit()
+
+        latency = stats.to_dict()["read_to_emit_latency"]
+        assert latency["samples"] == 1
+        assert latency["max_ms"] == 20
+
+    def test_binary_frame_length_is_its_wire_size(self):
+        assert len(BinaryFrame(1, b"1234")) == FRAME_OVERHEAD + 4
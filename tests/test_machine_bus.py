@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from machine_bus import MachineBus, OverflowPolicy, Topic
+from runtime import Runtime
+from tests.test_runtime import loop  # noqa: F401
+
+
+@pytest.fixture
+def bus():
+    yield MachineBus
+    for name in list(MachineBus._subscriptions.keys()):
+        MachineBus.unsubscribe(name)
+
+
+def wait_for(predicate, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+class TestMachineBus:
+    def test_delivers_in_publish_order_across_topics(self, bus):
+        received = []
+        sub = bus.subscribe(
+            "ordered",
+            [Topic.SHOT_TICK, Topic.MACHINE_EVENT],
+            lambda topic, payload: received.append((topic, payload)),
+            OverflowPolicy.BLOCK,
+        )
+        bus.publish(Topic.MACHINE_EVENT, "start")
+        for i in range(10):
+            bus.publish(Topic.SHOT_TICK, i)
+        bus.publish(Topic.MACHINE_EVENT, "stop")
+        bus.publish(Topic.BUTTON, "not subscribed")
+
+        assert sub.drain()
+        assert received[0] == (Topic.MACHINE_EVENT, "start")
+        assert [p for _, p in received[1:-1]] == list(range(10))
+        assert received[-1] == (Topic.MACHINE_EVENT, "stop")
+
+    def test_drop_oldest_keeps_newest(self, bus):
+        gate = threading.Event()
+        received = []
+
+        def slow(topic, payload):
+            gate.wait()
+            received.append(payload)
+
+        sub = bus.subscribe("drop", [Topic.ESP_LOG], slow, capacity=3)
+        bus.publish(Topic.ESP_LOG, 0)
+        assert wait_for(lambda: sub.depth == 0)
+        for i in range(1, 10):
+            bus.publish(Topic.ESP_LOG, i)
+        gate.set()
+
+        assert sub.drain()
+        assert received == [0, 7, 8, 9]
+        assert sub.stats.dropped == 6
+
+    def test_coalesce_latest_keeps_one_per_topic(self, bus):
+        gate = threading.Event()
+        received = []
+
+        def slow(topic, payload):
+            gate.wait()
+            received.append(payload)
+
+        sub = bus.subscribe(
+            "latest",
+            [Topic.SHOT_TICK, Topic.SENSOR_TICK],
+            slow,
+            OverflowPolicy.COALESCE_LATEST,
+        )
+        bus.publish(Topic.SHOT_TICK, "first")
+        assert wait_for(lambda: sub.depth == 0)
+        for i in range(5):
+            bus.publish(Topic.SHOT_TICK, f"shot {i}")
+            bus.publish(Topic.SENSOR_TICK, f"sensor {i}")
+        gate.set()
+
+        assert sub.drain()
+        assert received[0] == "first"
+        assert sorted(received[1:]) == ["sensor 4", "shot 4"]
+        assert sub.stats.coalesced == 8
+
+    def test_block_never_drops_or_waits(self, bus):
+        release = threading.Event()
+        received = []
+
+        def stuck(topic, payload):
+            release.wait()
+            received.append(payload)
+
+        sub = bus.subscribe("block", [Topic.SHOT_TICK], stuck, OverflowPolicy.BLOCK, capacity=2)
+        start = time.monotonic()
+        for i in range(50):
+            bus.publish(Topic.SHOT_TICK, i)
+        assert time.monotonic() - start < 0.1
+        assert sub.stats.backlogged > 0
+
+        release.set()
+        assert sub.drain()
+        assert received == list(range(50))
+        assert sub.stats.dropped == 0
+
+    def test_failing_subscriber_does_not_affect_others(self, bus):
+        received = []
+
+        def broken(topic, payload):
+            raise RuntimeError("broken")
+
+        failing = bus.subscribe("broken", [Topic.BUTTON], broken)
+        working = bus.subscribe(
+            "working", [Topic.BUTTON], lambda topic, payload: received.append(payload)
+        )
+        bus.publish(Topic.BUTTON, "push")
+
+        assert failing.drain() and working.drain()
+        assert failing.stats.errors == 1
+        assert received == ["push"]
+
+    def test_awaits_coroutine_subscribers(self, bus):
+        received = []
+
+        async def emit(topic, payload):
+            await asyncio.sleep(0)
+            received.append(payload)
+
+        sub = bus.subscribe("async", [Topic.BUTTON], emit)
+        bus.publish(Topic.BUTTON, "push")
+        assert sub.drain()
+        assert received == ["push"]
+
+    def test_on_loop_delivers_after_publisher_yields(self, bus, loop):  # noqa: F811
+        received = []
+
+        def record(topic, payload):
+            received.append((payload, asyncio.get_running_loop()))
+
+        sub = bus.subscribe("loop", [Topic.BUTTON], record, on_loop=True)
+
+        async def publish():
+            for i in range(5):
+                bus.publish(Topic.BUTTON, i)
+            delivered_while_publishing = len(received)
+            await asyncio.sleep(0)
+            return delivered_while_publishing
+
+        assert Runtime.spawn(publish()).result(timeout=1) == 0
+        assert sub.drain()
+        assert [payload for payload, _ in received] == list(range(5))
+        assert all(running is loop for _, running in received)
+        assert sub._thread is None
+
+    def test_on_loop_without_loop_delivers_right_away(self, bus):
+        received = []
+        bus.subscribe(
+            "inline",
+            [Topic.BUTTON],
+            lambda topic, payload: received.append(payload),
+            on_loop=True,
+        )
+        bus.publish(Topic.BUTTON, "push")
+        assert received == ["push"]
+
+    def test_reports_lag_per_subscriber(self, bus):
+        sub = bus.subscribe("lag", [Topic.ESP_INFO], lambda topic, payload: None)
+        bus.publish(Topic.ESP_INFO, "info")
+        assert sub.drain()
+
+        stats = bus.stats()["lag"]
+        assert stats["topics"] == ["esp_info"]
+        assert stats["policy"] == "drop_oldest"
+        assert stats["delivered"] == 1
+        assert stats["max_lag"] >= stats["average_lag"] >= 0
+
+    def test_duplicate_subscriber_name_is_rejected(self, bus):
+        bus.subscribe("twice", [Topic.BUTTON], lambda topic, payload: None)
+        with pytest.raises(ValueError):
+            bus.subscribe("twice", [Topic.BUTTON], lambda topic, payload: None)
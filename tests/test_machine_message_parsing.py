@@ -1,5 +1,7 @@
 import pytest
 
+from esp_serial.connection.emulation_data import EmulationData
+from esp_serial.message_schema import MessageRegistry
 from esp_serial.data import (
     SensorData,
     ShotData,
@@ -127,6 +129,20 @@ class TestSensorData:
         assert "w_stat" in sio
         assert sio["p"] == 9.0
 
+    def test_is_slotted(self):
+        data = SensorData.from_args(self.make_args())
+        assert not hasattr(data, "__dict__")
+        with pytest.raises(AttributeError):
+            data.not_a_field = 1
+
+    def test_to_dict_contains_all_fields(self):
+        data = SensorData.from_args(self.make_args())
+        as_dict = data.to_dict()
+        assert list(as_dict.keys())[0] == "external_1"
+        assert len(as_dict) == 23
+        assert as_dict["water_status"] is True
+        assert as_dict["weight_prediction"] == 18.5
+
 
 class TestShotData:
     def make_args(self, with_controllers=True):
@@ -226,6 +242,19 @@ class TestShotData:
         assert reparsed.flow == data.flow
         assert reparsed.main_controller_kind == data.main_controller_kind
 
+    def test_stamp_matches_clone(self):
+        data = ShotData.from_args(self.make_args(with_controllers=True))
+        clone = data.clone_with_time_and_state(1500, True, 1200)
+        stamped = data.stamp_time_and_state(1500, True, 1200)
+        assert stamped is data
+        assert stamped == clone
+        assert stamped.to_sio() == clone.to_sio()
+        assert stamped.to_args() == clone.to_args()
+
+    def test_is_slotted(self):
+        data = ShotData.from_args(self.make_args())
+        assert not hasattr(data, "__dict__")
+
 
 class TestESPInfo:
     def test_parse_full(self):
@@ -350,3 +379,54 @@ class TestMachineNotify:
     def test_parse_empty_args_returns_none(self):
         notify = MachineNotify.from_args([])
         assert notify is None
+
+
+class TestMessageRegistry:
+    def legacy_parse(self, line):
+        prefix, *args = line.split(",")
+        if prefix == "Data":
+            return ShotData.from_args(args)
+        if len(args) == 1:
+            return SensorData.from_color_coded_args(args[0])
+        return SensorData.from_args(args)
+
+    def test_matches_legacy_parser_on_emulated_shot(self):
+        EmulationData.init()
+        for line in EmulationData.ESPRESSO_DATA:
+            prefix, record = MessageRegistry.parse_line(line)
+            assert prefix in ("Data", "Sensors")
+            assert record == self.legacy_parse(line)
+
+    def test_unknown_prefix_returns_none(self):
+        assert MessageRegistry.parse_line("Log,info,hello") is None
+        assert MessageRegistry.parse_line("CW,100") is None
+
+    def test_url_encoded_text_is_decoded(self):
+        line = "Data," + ",".join(TestShotData().make_args(with_controllers=False))
+        line = line.replace("idle,idle", "closing%20valve,My%20Espresso")
+        _, data = MessageRegistry.parse_line(line)
+        assert data.status == "closing valve"
+        assert data.profile == "My Espresso"
+        assert data.state == MachineState.BREWING
+
+    def test_short_data_skips_controllers(self):
+        args = TestShotData().make_args(with_controllers=True)[:10]
+        _, data = MessageRegistry.parse_line("Data," + ",".join(args))
+        assert data == ShotData.from_args(args)
+        assert data.main_controller_kind is None
+
+    def test_invalid_setpoint_falls_back_to_legacy_parser(self):
+        args = TestShotData().make_args(with_controllers=True)
+        args[8] = "garbage"
+        _, data = MessageRegistry.parse_line("Data," + ",".join(args))
+        assert data == ShotData.from_args(args)
+        assert data.main_controller_kind == "Pressure"
+
+    def test_truncated_sensors_returns_none(self):
+        assert MessageRegistry.parse_line("Sensors,1.0,2.0") == ("Sensors", None)
+
+    def test_color_coded_sensors(self):
+        args = TestSensorData().make_args()
+        colored = "".join(f"\033[1;32m name\033[0m{arg}" for arg in args)
+        _, sensor = MessageRegistry.parse_line("Sensors," + colored)
+        assert sensor == SensorData.from_args(args)
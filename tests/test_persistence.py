@@ -0,0 +1,164 @@
+import itertools
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from persistence import JobPriority, PersistenceQueueFull, PersistenceService, _Latency
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(PersistenceService, "_queue", [])
+    monkeypatch.setattr(PersistenceService, "_waiting", {})
+    monkeypatch.setattr(PersistenceService, "_sequence", itertools.count())
+    monkeypatch.setattr(PersistenceService, "_thread", None)
+    monkeypatch.setattr(PersistenceService, "_running", False)
+    monkeypatch.setattr(PersistenceService, "_busy", None)
+    monkeypatch.setattr(
+        PersistenceService, "_counters", dict.fromkeys(PersistenceService._counters, 0)
+    )
+    monkeypatch.setattr(PersistenceService, "_max_depth", 0)
+    monkeypatch.setattr(
+        PersistenceService, "_wait_latency", {p: _Latency() for p in JobPriority}
+    )
+    monkeypatch.setattr(
+        PersistenceService, "_run_latency", {p: _Latency() for p in JobPriority}
+    )
+    monkeypatch.setattr(PersistenceService, "MAX_JOBS", 4)
+    yield PersistenceService
+    PersistenceService.shutdown(timeout=5)
+
+
+def block_worker(service):
+    """Keeps the worker busy until the returned event is set"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocked():
+        started.set()
+        release.wait(5)
+
+    service.submit(JobPriority.SHOT, blocked)
+    assert started.wait(5)
+    return release
+
+
+class TestPersistenceService:
+    def test_runs_inline_before_start(self, service):
+        future = service.submit(JobPriority.SHOT, threading.current_thread)
+        assert future.result(timeout=0) is threading.current_thread()
+        assert service.stats()["completed"] == 1
+
+    def test_single_writer_thread(self, service):
+        service.start()
+        futures = [
+            service.submit(JobPriority.SHOT, lambda: threading.current_thread().name)
+            for _ in range(3)
+        ]
+        assert {future.result(timeout=5) for future in futures} == {"Persist"}
+
+    def test_priorities(self, service):
+        service.start()
+        release = block_worker(service)
+        order = []
+        futures = [
+            service.submit(JobPriority.CLEANUP, order.append, "cleanup"),
+            service.submit(JobPriority.DEBUG_SHOT, order.append, "debug"),
+            service.submit(JobPriority.SHOT, order.append, "shot 1"),
+            service.submit(JobPriority.SHOT, order.append, "shot 2"),
+        ]
+        assert service.stats()["depth"] == 4
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        assert order == ["shot 1", "shot 2", "debug", "cleanup"]
+
+    def test_coalescing(self, service):
+        service.start()
+        release = block_worker(service)
+        calls = []
+        first = service.submit(JobPriority.CLEANUP, calls.append, 1, key="retention")
+        second = service.submit(JobPriority.CLEANUP, calls.append, 2, key="retention")
+        assert first is second
+        release.set()
+        first.result(timeout=5)
+        assert calls == [2]
+        assert service.stats()["coalesced"] == 1
+
+    def test_full_queue_drops_lower_priority(self, service):
+        service.start()
+        release = block_worker(service)
+        cleanups = [
+            service.submit(JobPriority.CLEANUP, lambda: None) for _ in range(service.MAX_JOBS)
+        ]
+        shot = service.submit(JobPriority.SHOT, lambda: "stored")
+
+        # The newest of the lowest priority jobs makes room
+        assert cleanups[-1].cancelled()
+        release.set()
+        assert shot.result(timeout=5) == "stored"
+        with pytest.raises(CancelledError):
+            cleanups[-1].result()
+        assert service.stats()["dropped"] == 1
+
+    def test_full_queue_blocks_then_rejects(self, service):
+        service.start()
+        release = block_worker(service)
+        for _ in range(service.MAX_JOBS):
+            service.submit(JobPriority.SHOT, lambda: None)
+
+        future = service.submit(JobPriority.SHOT, lambda: None, timeout=0.05)
+        with pytest.raises(PersistenceQueueFull):
+            future.result(timeout=0)
+
+        # A blocked submitter gets in once the worker takes a job
+        threading.Timer(0.05, release.set).start()
+        assert service.submit(JobPriority.SHOT, lambda: "late", timeout=5).result(5) == "late"
+        assert service.stats()["rejected"] == 1
+
+    def test_failures_are_reported(self, service):
+        service.start()
+
+        def fail():
+            raise OSError("disk full")
+
+        with pytest.raises(OSError):
+            service.submit(JobPriority.SHOT, fail).result(timeout=5)
+        assert service.submit(JobPriority.SHOT, lambda: 1).result(timeout=5) == 1
+        stats = service.stats()
+        assert stats["failed"] == 1
+        assert stats["completed"] == 1
+
+    def test_shutdown_drains(self, service):
+        service.start()
+        release = block_worker(service)
+        written = []
+        for i in range(3):
+            service.submit(JobPriority.DEBUG_SHOT, written.append, i)
+
+        threading.Timer(0.05, release.set).start()
+        assert service.shutdown(timeout=5)
+        assert written == [0, 1, 2]
+
+        # Late jobs still run, in the caller
+        service.submit(JobPriority.SHOT, written.append, 3)
+        assert written == [0, 1, 2, 3]
+
+    def test_stats(self, service):
+        service.start()
+        release = block_worker(service)
+        service.submit(JobPriority.DEBUG_SHOT, lambda: None, key="debug-shot:a")
+        stats = service.stats()
+        assert stats["busy"] == "block_worker.<locals>.blocked"
+        assert [(job["name"], job["priority"]) for job in stats["pending"]] == [
+            ("debug-shot:a", "debug_shot")
+        ]
+        release.set()
+        service.shutdown(timeout=5)
+
+        stats = service.stats()
+        assert stats["depth"] == 0
+        assert stats["max_depth"] == 1
+        assert stats["latency"]["shot"]["run"]["count"] == 1
+        assert stats["latency"]["debug_shot"]["wait"]["max_ms"] > 0
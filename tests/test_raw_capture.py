@@ -0,0 +1,80 @@
+import os
+import time
+
+from esp_serial.line_framer import LineFramer
+from esp_serial.raw_capture import (
+    CAPTURE_HEADER,
+    CAPTURE_RECORD,
+    RawCapture,
+    RawCaptureWriter,
+    capture_files,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def read_all(path):
+    with RawCapture(path) as capture:
+        return [(timestamp, bytes(chunk)) for timestamp, chunk in capture.records()]
+
+
+class TestRawCapture:
+    def test_roundtrip(self, tmp_path):
+        clock = FakeClock()
+        writer = RawCaptureWriter(tmp_path, clock=clock)
+        chunks = [b"Data,1,2,3\r\nSen", b"sors,4,5\r\n", b"\xaa\x55\x01"]
+        for i, chunk in enumerate(chunks):
+            clock.now = 10.0 + i * 0.05
+            writer.write(memoryview(chunk))
+        writer.close()
+
+        [path] = capture_files(tmp_path)
+        records = read_all(path)
+        assert [chunk for _, chunk in records] == chunks
+        assert [round(timestamp, 3) for timestamp, _ in records] == [0.0, 0.05, 0.1]
+
+    def test_rotates_and_keeps_newest_files(self, tmp_path):
+        chunk = b"x" * 100
+        record_size = CAPTURE_RECORD.size + len(chunk)
+        writer = RawCaptureWriter(
+            tmp_path, max_bytes=CAPTURE_HEADER.size + 2 * record_size, max_files=2
+        )
+        for i in range(7):
+            writer.write(chunk)
+            # File names carry the time they were started at
+            time.sleep(0.001)
+        writer.close()
+
+        files = capture_files(tmp_path)
+        assert len(files) == 2
+        assert [len(read_all(path)) for path in files] == [2, 1]
+
+    def test_truncated_record_is_skipped(self, tmp_path):
+        writer = RawCaptureWriter(tmp_path)
+        writer.write(b"Data,1\r\n")
+        writer.write(b"Data,2\r\n")
+        writer.close()
+        [path] = capture_files(tmp_path)
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 3)
+
+        assert [chunk for _, chunk in read_all(path)] == [b"Data,1\r\n"]
+
+    def test_framer_tap_sees_raw_chunks(self):
+        read_fd, write_fd = os.pipe()
+        try:
+            framer = LineFramer()
+            tapped = []
+            framer.tap = lambda chunk: tapped.append(bytes(chunk))
+            os.write(write_fd, b"Data,1\r\nData")
+            assert framer.read_from(read_fd) == [b"Data,1\r\n"]
+            assert tapped == [b"Data,1\r\nData"]
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
@@ -0,0 +1,107 @@
+import math
+import random
+import statistics
+
+import pytest
+
+from esp_serial.data import ShotData
+from rolling_stats import RollingWindow, ShotStatistics
+from shot_manager import Shot, ShotManager
+
+
+def least_squares_slope(times, values):
+    mean_t = statistics.fmean(times)
+    mean_y = statistics.fmean(values)
+    return sum((t - mean_t) * (y - mean_y) for t, y in zip(times, values)) / sum(
+        (t - mean_t) ** 2 for t in times
+    )
+
+
+class TestRollingWindow:
+    def test_matches_full_recomputation(self):
+        rng = random.Random(4)
+        window = RollingWindow(25)
+        samples = []
+        for i in range(3000):
+            t = 1_780_000_000 + i * 0.1
+            value = rng.uniform(-5, 40)
+            window.push(value, t)
+            samples.append((t, value))
+
+            recent = samples[-25:]
+            values = [value for _t, value in recent]
+            assert window.mean == pytest.approx(statistics.fmean(values))
+            assert window.variance == pytest.approx(statistics.pvariance(values), abs=1e-6)
+            assert window.min == min(values)
+            assert window.max == max(values)
+            if len(recent) > 1:
+                expected = least_squares_slope([t for t, _v in recent], values)
+                assert window.slope == pytest.approx(expected, rel=1e-6, abs=1e-6)
+
+    def test_push_returns_evicted_sample(self):
+        window = RollingWindow(2)
+        assert window.push(1.0) is None
+        assert window.push(2.0) is None
+        assert window.full
+        assert window.push(3.0) == 1.0
+        assert window.slope == pytest.approx(1.0)
+
+    def test_nan_is_ignored(self):
+        window = RollingWindow(3)
+        window.push(1.0)
+        assert window.push(math.nan) is None
+        window.push(3.0)
+        assert len(window) == 2
+        assert window.mean == 2.0
+
+    def test_empty(self):
+        window = RollingWindow(3)
+        assert window.to_dict() == {
+            "samples": 0,
+            "mean": None,
+            "stddev": None,
+            "slope": None,
+            "min": None,
+            "max": None,
+        }
+        with pytest.raises(ValueError):
+            RollingWindow(0)
+
+
+def weights(values):
+    shot_statistics = ShotStatistics()
+    for i, weight in enumerate(values):
+        shot_statistics.feed(ShotData(weight=weight, time=i * 100))
+    return shot_statistics
+
+
+class TestShotStatistics:
+    def test_channels_are_fed_per_tick(self):
+        shot_statistics = ShotStatistics(windows={"pressure": 5})
+        for i in range(20):
+            shot_statistics.feed(ShotData(pressure=i / 2, flow="NaN", weight=1.0, time=i * 100))
+
+        assert shot_statistics.windows["pressure"].mean == pytest.approx(8.5)
+        # Half a bar per tick of 100 ms
+        assert shot_statistics.windows["pressure"].slope == pytest.approx(5.0)
+        assert shot_statistics.windows["weight"].slope == pytest.approx(0.0)
+        assert shot_statistics.to_dict()["flow"]["samples"] == 0
+
+    def test_weight_stable(self):
+        assert not weights([10.0] * 5).weight_stable(10.0)
+        assert weights([10.0] * 6).weight_stable(10.0)
+        # Still dripping
+        assert not weights([10.0, 10.2, 10.4, 10.6, 10.8, 11.0]).weight_stable(11.3)
+        assert weights([10.0, 10.2, 10.4, 10.6, 10.8, 11.0]).weight_stable(10.8)
+        # The cup was taken off the scale
+        assert weights([40.0, 40.0, 40.0, 0.1, 0.0, 0.0]).weight_stable(5.0)
+
+    def test_is_weight_stable(self, monkeypatch):
+        shot = Shot()
+        monkeypatch.setattr(ShotManager, "_current_shot", shot)
+        for i in range(6):
+            shot.append_shot_data(ShotData(weight=36.0, time=i * 100))
+        assert ShotManager.isWeightStable(36.01)
+
+        monkeypatch.setattr(ShotManager, "_current_shot", None)
+        assert not ShotManager.isWeightStable(36.0)
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+
+import pytest
+
+from runtime import Runtime
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    previous = Runtime._loop
+    Runtime._loop = loop
+    yield loop
+    Runtime._loop = previous
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+async def current_loop():
+    return asyncio.get_running_loop()
+
+
+class TestRuntime:
+    def test_spawn_runs_on_shared_loop(self, loop):
+        assert Runtime.spawn(current_loop()).result(timeout=1) is loop
+
+    def test_spawn_keeps_order(self, loop):
+        order = []
+
+        async def append(i):
+            order.append(i)
+
+        futures = [Runtime.spawn(append(i)) for i in range(20)]
+        for future in futures:
+            future.result(timeout=1)
+        assert order == list(range(20))
+
+    def test_spawn_reports_errors(self, loop):
+        async def fail():
+            raise ValueError("failed")
+
+        with pytest.raises(ValueError):
+            Runtime.spawn(fail()).result(timeout=1)
+        assert Runtime._tasks == set()
+
+    def test_spawn_without_loop_runs_inline(self):
+        previous = Runtime._loop
+        Runtime._loop = None
+        try:
+            assert Runtime.spawn(current_loop()).result(timeout=0) is not None
+        finally:
+            Runtime._loop = previous
+
+    def test_run_blocking_uses_shared_executor(self, loop):
+        async def thread_name():
+            return await Runtime.run_blocking(lambda: threading.current_thread().name)
+
+        assert Runtime.spawn(thread_name()).result(timeout=1).startswith("Worker")
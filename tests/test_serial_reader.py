@@ -0,0 +1,148 @@
+import asyncio
+import os
+
+import pytest
+
+from esp_serial.line_framer import LineFramer
+from esp_serial.serial_reader import SerialDisconnected, SerialLineReader
+
+
+class PipePort:
+    """Minimal stand-in for a serial.Serial exposing only the file descriptor"""
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+
+    def fileno(self):
+        return self.read_fd
+
+    def feed(self, data: bytes):
+        os.write(self.write_fd, data)
+
+    def hang_up(self):
+        os.close(self.write_fd)
+        self.write_fd = None
+
+    def close(self):
+        os.close(self.read_fd)
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+
+
+@pytest.fixture
+def port():
+    p = PipePort()
+    yield p
+    p.close()
+
+
+async def collect(reader, count, timeout=0.2):
+    received = []
+    async for batch in reader.batches(timeout=timeout):
+        received.append(batch)
+        if sum(len(b) or 1 for b in received) >= count:
+            break
+    return received
+
+
+class TestLineFramer:
+    def test_returns_all_lines_of_a_chunk_as_one_batch(self):
+        framer = LineFramer()
+        assert framer.feed(b"a,1\nb,2\nc") == [b"a,1\n", b"b,2\n"]
+        assert framer.occupancy == 1
+        assert framer.feed(b",3\n") == [b"c,3\n"]
+        assert framer.occupancy == 0
+
+    def test_counts_bytes_and_lines_per_wakeup(self):
+        framer = LineFramer()
+        framer.feed(b"a\nb\nc\n")
+        framer.feed(b"dd")
+        stats = framer.stats
+        assert stats.wakeups == 2
+        assert stats.bytes_total == 8
+        assert stats.lines_total == 3
+        assert stats.max_lines_per_wakeup == 3
+        assert stats.last_lines_per_wakeup == 0
+        assert stats.max_occupancy == 6
+
+    def test_discards_lines_longer_than_capacity(self):
+        framer = LineFramer(capacity=8)
+        assert framer.feed(b"0123456789abc\nok\n") == [b"ok\n"]
+        assert framer.stats.overflows == 1
+
+    def test_reads_from_file_descriptor(self, port):
+        framer = LineFramer()
+        port.feed(b"Data,1\r\nSensors,2")
+        assert framer.read_from(port.fileno()) == [b"Data,1\r\n"]
+        assert framer.occupancy == len(b"Sensors,2")
+
+
+class TestSerialLineReader:
+    def test_splits_multiple_lines_from_one_chunk(self, port):
+        async def run():
+            reader = SerialLineReader(port)
+            port.feed(b"Data,1,2\r\nSensors,3,4\r\nLog,info,x\r\n")
+            return await collect(reader, 3)
+
+        batches = asyncio.run(run())
+        assert batches == [[b"Data,1,2\r\n", b"Sensors,3,4\r\n", b"Log,info,x\r\n"]]
+
+    def test_joins_partial_lines_across_reads(self, port):
+        async def run():
+            reader = SerialLineReader(port)
+            port.feed(b"Data,1")
+
+            async def finish_line():
+                await asyncio.sleep(0.05)
+                port.feed(b",2\r\nSens")
+
+            asyncio.get_running_loop().create_task(finish_line())
+            return await collect(reader, 1)
+
+        assert asyncio.run(run()) == [[b"Data,1,2\r\n"]]
+
+    def test_yields_empty_batch_on_timeout(self, port):
+        async def run():
+            reader = SerialLineReader(port)
+            return await collect(reader, 1, timeout=0.05)
+
+        assert asyncio.run(run()) == [[]]
+
+    def test_paused_reader_does_not_consume(self, port):
+        paused = True
+
+        async def run():
+            reader = SerialLineReader(port, lambda: paused)
+            port.feed(b"Data,1\r\n")
+            return await collect(reader, 1)
+
+        assert asyncio.run(run()) == [[]]
+        # The bytes are still in the pipe for whoever owns the port meanwhile
+        assert os.read(port.read_fd, 64) == b"Data,1\r\n"
+
+    def test_hangup_stops_reading(self, port):
+        wakeups = []
+
+        async def run():
+            reader = SerialLineReader(port)
+            port.feed(b"Data,1\r\n")
+            port.hang_up()
+            original = reader._on_readable
+
+            def counted():
+                wakeups.append(1)
+                original()
+
+            reader._on_readable = counted
+            received = []
+            with pytest.raises(SerialDisconnected):
+                async for batch in reader.batches(timeout=0.2):
+                    received.append(batch)
+            return reader, received
+
+        reader, received = asyncio.run(run())
+        assert received == [[b"Data,1\r\n"]]
+        assert reader._fd is None
+        # One wakeup for the line, one for the hangup, no spinning afterwards
+        assert len(wakeups) == 2
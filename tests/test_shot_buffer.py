@@ -0,0 +1,159 @@
+import copy
+import json
+import threading
+
+from esp_serial.data import SensorData, ShotData
+from shot_buffer import ShotBuffer
+from shot_manager import Shot
+
+
+def legacy_datapoint(data: ShotData):
+    """The dict Shot.addShotData used to build per datapoint"""
+    return {
+        "shot": {
+            "pressure": max(data.pressure, 0),
+            "flow": max(data.flow, 0),
+            "weight": data.weight,
+            "gravimetric_flow": data.gravimetric_flow,
+            "setpoints": data.to_sio().get("setpoints", {}),
+        },
+        "time": data.time,
+        "profile_time": data.profile_time if data.profile_time is not None else data.time,
+        "status": data.status,
+    }
+
+
+def datapoint(i, **kwargs):
+    values = dict(
+        pressure=1.5 + i,
+        flow=2.0,
+        weight=0.1 * i,
+        status="brewing" if i else "closing valve",
+        time=100 * i,
+        profile_time=80 * i,
+        main_controller_kind="Pressure",
+        main_setpoint=9.0,
+        aux_controller_kind="Flow",
+        aux_setpoint=4.5 + i,
+        is_aux_controller_active=i % 2 == 1,
+        gravimetric_flow=0.5,
+    )
+    values.update(kwargs)
+    return ShotData(**values)
+
+
+def sensors(i):
+    return SensorData(tube=90.0 + i, motor_position=12.5, water_status=i % 2 == 0)
+
+
+class TestShotBuffer:
+    def test_matches_legacy_layout(self):
+        buffer = ShotBuffer()
+        expected = []
+        for i in range(20):
+            data = datapoint(i)
+            buffer.append(data)
+            expected.append(legacy_datapoint(data))
+            if i % 3:
+                buffer.attach_sensors(sensors(i))
+                expected[-1]["sensors"] = sensors(i).to_dict()
+
+        assert len(buffer) == 20
+        assert buffer.to_list() == expected
+        assert json.dumps(buffer.to_list()) == json.dumps(expected)
+
+    def test_negative_readings_are_clamped(self):
+        buffer = ShotBuffer()
+        buffer.append(datapoint(1, pressure=-0.5, flow=-0.25, weight=-1.0))
+        shot = buffer.row(0)["shot"]
+        assert (shot["pressure"], shot["flow"], shot["weight"]) == (0, 0, -1.0)
+
+    def test_setpoints_without_controllers(self):
+        buffer = ShotBuffer()
+        data = datapoint(1, main_controller_kind=None, aux_controller_kind=None)
+        buffer.append(data)
+        assert buffer.row(0)["shot"]["setpoints"] == {"active": None}
+
+    def test_nan_and_missing_profile_time(self):
+        buffer = ShotBuffer()
+        buffer.append(datapoint(2, weight="NaN", gravimetric_flow="NaN", profile_time=None))
+        row = buffer.row(0)
+        assert row["shot"]["weight"] == "NaN"
+        assert row["shot"]["gravimetric_flow"] == "NaN"
+        assert row["profile_time"] == 200
+
+    def test_sensors_replace_the_latest(self):
+        buffer = ShotBuffer()
+        buffer.attach_sensors(sensors(0))
+        buffer.append(datapoint(0))
+        buffer.attach_sensors(sensors(0))
+        buffer.attach_sensors(sensors(1))
+        assert buffer.row(0)["sensors"] == sensors(1).to_dict()
+        assert len(buffer._sensors["tube"]) == 1
+
+    def test_last(self):
+        buffer = ShotBuffer()
+        for i in range(5):
+            buffer.append(datapoint(i, weight=float(i)))
+        assert buffer.last("weight", 3) == [2.0, 3.0, 4.0]
+        assert buffer.last("weight", 10) == [0.0, 1.0, 2.0, 3.0, 4.0]
+        assert buffer.last("weight", 0) == []
+
+    def test_profile_ms_column(self):
+        buffer = ShotBuffer(profile_ms=True)
+        buffer.append(datapoint(1), profile_ms=1234)
+        buffer.attach_sensors(sensors(1))
+        assert list(buffer.row(0)) == [
+            "shot",
+            "time",
+            "profile_time",
+            "status",
+            "profile_ms",
+            "sensors",
+        ]
+        assert buffer.row(0)["profile_ms"] == 1234
+
+    def test_partly_written_rows_are_not_listed(self):
+        buffer = ShotBuffer()
+        buffer.append(datapoint(0))
+        # Another thread is in the middle of append()
+        buffer._shot["pressure"].append(1.0)
+        buffer._time.append(100)
+        buffer._status.append("brewing")
+        assert len(buffer) == 1
+        assert buffer.to_list() == [buffer.row(0)]
+
+    def test_listing_while_appending(self):
+        buffer = ShotBuffer()
+        done = threading.Event()
+
+        def record():
+            for i in range(20000):
+                buffer.append(datapoint(i % 100))
+                buffer.attach_sensors(sensors(i))
+            done.set()
+
+        thread = threading.Thread(target=record)
+        thread.start()
+        while not done.is_set():
+            buffer.to_list()
+        thread.join()
+        assert len(buffer.to_list()) == 20000
+
+    def test_deepcopy_is_independent(self):
+        buffer = ShotBuffer()
+        buffer.append(datapoint(1))
+        copied = copy.deepcopy(buffer)
+        buffer.append(datapoint(2))
+        assert len(copied) == 1
+        assert copied.to_list() == buffer.to_list()[:1]
+
+
+class TestShot:
+    def test_to_json_materializes_the_data(self):
+        shot = Shot()
+        shot.append_shot_data(datapoint(1))
+        shot.addSensorData(sensors(1))
+        data = shot.to_json()["data"]
+        assert data == [{**legacy_datapoint(datapoint(1)), "sensors": sensors(1).to_dict()}]
+        assert shot.get_last_datapoints("pressure") == [2.5]
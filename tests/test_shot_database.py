@@ -1,3 +1,4 @@
+import importlib.util
 import json
 import time
 from pathlib import Path
@@ -5,11 +6,15 @@ from pathlib import Path
 import zstandard as zstd
 
 import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import Column, MetaData, Table, create_engine, insert, select, text
 
 import config as cfg
 import shot_database as sdb_module
-from shot_database import ShotDataBase, SearchParams, SearchOrder
-from database_models import metadata
+from shot_database import InvalidCursor, ShotDataBase, SearchParams, SearchOrder, SearchOrderBy
+from shot_database import profile_content_hash
+from database_models import FTS_TABLES, metadata, profile as profile_table
 
 
 @pytest.fixture(autouse=True)
@@ -36,7 +41,7 @@ def shot_db(tmp_path, monkeypatch):
 
     # Clear any cached FTS table references from metadata
     for table_name in list(metadata.tables.keys()):
-        if table_name in ("profile_fts", "stage_fts"):
+        if table_name in FTS_TABLES:
             metadata.remove(metadata.tables[table_name])
 
     ShotDataBase.init()
@@ -107,6 +112,64 @@ class TestInsertProfile:
         result = ShotDataBase.insert_profile(None)
         assert result == -1
 
+    def test_key_order_and_integral_floats_match(self):
+        key = ShotDataBase.insert_profile(make_profile())
+        reordered = dict(reversed(list(make_profile(final_weight=36.0).items())))
+        reordered["stages"] = [dict(reversed(list(s.items()))) for s in reordered["stages"]]
+        assert ShotDataBase.insert_profile(reordered) == key
+        assert ShotDataBase.profile_exists(reordered)[0] == key
+
+    def test_changed_stage_is_a_new_profile(self):
+        key = ShotDataBase.insert_profile(make_profile())
+        changed = make_profile()
+        changed["stages"][1]["name"] = "Decline"
+        assert not ShotDataBase.profile_exists(changed)
+        assert ShotDataBase.insert_profile(changed) != key
+
+    def test_hash_is_stored(self):
+        profile = make_profile()
+        key = ShotDataBase.insert_profile(profile)
+        with ShotDataBase.engine.connect() as connection:
+            stored = connection.execute(
+                select(profile_table.c.content_hash).where(profile_table.c.key == key)
+            ).scalar_one()
+        assert stored == profile_content_hash(profile)
+        assert len(stored) == 64
+
+
+class TestProfileHashMigration:
+    def test_backfill_keeps_the_oldest_duplicate(self, tmp_path):
+        versions = Path(__file__).parent.parent / "alembic" / "versions"
+        path = next(versions.glob("*-d8a3c6e1f257_*.py"))
+        spec = importlib.util.spec_from_file_location("profile_hash_migration", path)
+        migration = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(migration)
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.sqlite'}")
+        old_profile = Table(
+            "profile",
+            MetaData(),
+            *[
+                Column(column.name, column.type, primary_key=column.primary_key)
+                for column in profile_table.columns
+                if column.name != "content_hash"
+            ],
+        )
+        old_profile.create(engine)
+        profiles = [make_profile(), make_profile(name="Other"), make_profile(final_weight=36.0)]
+        with engine.begin() as connection:
+            connection.execute(insert(old_profile), profiles)
+            with Operations.context(MigrationContext.configure(connection)):
+                migration.upgrade()
+            hashes = connection.execute(
+                text('SELECT content_hash FROM profile ORDER BY "key"')
+            ).scalars()
+            assert list(hashes) == [
+                profile_content_hash(profiles[0]),
+                profile_content_hash(profiles[1]),
+                None,
+            ]
+
 
 class TestInsertHistory:
     def test_insert_returns_id(self):
@@ -505,3 +568,223 @@ class TestDeleteShot:
 
     def test_delete_nonexistent_shot(self):
         ShotDataBase.delete_shot(99999)
+
+
+def insert_shots(count, same_time_every=1):
+    for i in range(count):
+        entry = make_history_entry(
+            id=f"h{i:02d}", file=f"s{i:02d}.zst", time=1_780_000_000.0 + i // same_time_every
+        )
+        ShotDataBase.insert_history(entry)
+
+
+def all_pages(**kwargs):
+    pages = []
+    cursor = None
+    while True:
+        page = ShotDataBase.search_history_page(SearchParams(cursor=cursor, **kwargs))
+        pages.append([shot["id"] for shot in page["history"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+class TestSearchHistoryPagination:
+    def test_defaults_to_metadata_only(self):
+        insert_shots(1)
+        assert ShotDataBase.search_history(SearchParams())[0]["data"] is None
+
+    def test_pages_descending(self):
+        insert_shots(25)
+        pages = all_pages(max_results=10)
+        assert [len(page) for page in pages] == [10, 10, 5]
+        assert sum(pages, []) == [f"h{i:02d}" for i in reversed(range(25))]
+
+    def test_pages_ascending_with_equal_times(self):
+        # Shots sharing a time are ordered by id
+        insert_shots(12, same_time_every=4)
+        pages = all_pages(max_results=5, sort=SearchOrder.ascending)
+        assert [len(page) for page in pages] == [5, 5, 2]
+        assert sum(pages, []) == [f"h{i:02d}" for i in range(12)]
+
+    def test_exact_page_has_no_next_cursor(self):
+        insert_shots(10)
+        page = ShotDataBase.search_history_page(SearchParams(max_results=10))
+        assert len(page["history"]) == 10
+        assert page["next_cursor"] is None
+
+    def test_pages_by_profile(self):
+        for i, name in enumerate(["Lungo", "Espresso", "Lungo", "Bloom", "Espresso"]):
+            profile = make_profile(id=f"p-{name}", name=name)
+            ShotDataBase.insert_history(
+                make_history_entry(profile=profile, id=f"h{i}", file=f"s{i}.zst", time=1e9 + i)
+            )
+        pages = all_pages(
+            max_results=2,
+            order_by=[SearchOrderBy.profile, SearchOrderBy.date],
+            sort=SearchOrder.ascending,
+        )
+        assert sum(pages, []) == ["h3", "h1", "h4", "h0", "h2"]
+
+    def test_invalid_cursor(self):
+        insert_shots(3)
+        with pytest.raises(InvalidCursor):
+            ShotDataBase.search_history_page(SearchParams(cursor="not a cursor"))
+
+        cursor = ShotDataBase.search_history_page(SearchParams(max_results=1))["next_cursor"]
+        with pytest.raises(InvalidCursor):
+            ShotDataBase.search_history_page(
+                SearchParams(cursor=cursor, sort=SearchOrder.ascending)
+            )
+
+    def test_query_lists_shots_once(self):
+        profile = make_profile(
+            stages=[
+                {"key": "s1", "name": "Bloom", "type": "pressure"},
+                {"key": "s2", "name": "Bloom again", "type": "pressure"},
+            ]
+        )
+        ShotDataBase.insert_history(make_history_entry(profile=profile))
+        results = ShotDataBase.search_history(SearchParams(query="Bloom"))
+        assert [shot["id"] for shot in results] == ["hist-001"]
+
+    def test_pages_are_read_from_the_index(self):
+        insert_shots(3)
+        first = ShotDataBase.search_history_page(SearchParams(max_results=1))
+        stmt = ShotDataBase._search_statement(
+            SearchParams(max_results=1, cursor=first["next_cursor"])
+        )
+        compiled = stmt.compile(ShotDataBase.engine)
+        with ShotDataBase.engine.connect() as connection:
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {compiled}", tuple(compiled.params.values())
+            ).fetchall()
+        details = " ".join(row[-1] for row in plan)
+        assert "ix_history_time_id" in details
+        assert "TEMP B-TREE" not in details
+
+
+def insert_named(*names, stages=()):
+    for i, name in enumerate(names):
+        profile = make_profile(
+            id=f"p{i}",
+            name=name,
+            stages=[
+                {"key": f"s{j}", "name": stage, "type": "flow"}
+                for j, stage in enumerate(stages)
+            ],
+        )
+        ShotDataBase.insert_history(
+            make_history_entry(profile=profile, id=f"h{i}", file=f"s{i}.zst")
+        )
+
+
+def found(query):
+    return sorted(
+        shot["name"] for shot in ShotDataBase.search_history(SearchParams(query=query))
+    )
+
+
+class TestFullTextSearch:
+    def test_every_word_as_prefix(self):
+        insert_named("Espresso Crème", "Crema Lungo", "Turbo")
+        assert found("esp cre") == ["Espresso Crème"]
+        assert found("creme") == ["Espresso Crème"]
+        assert found("cre") == ["Crema Lungo", "Espresso Crème"]
+
+    def test_substrings_still_match(self):
+        insert_named("Espresso", "Lungo", stages=["Preinfusion"])
+        assert found("spres") == ["Espresso"]
+        assert found("infus") == ["Espresso", "Lungo"]
+
+    def test_autocomplete_ranks_word_matches_first(self):
+        insert_named("Rebloom", "Bloom Lungo")
+        results = ShotDataBase.autocomplete_profile_name("bloom")
+        assert [r["profile"] for r in results] == ["Bloom Lungo", "Rebloom"]
+
+    def test_substring_search_uses_trigram_index(self):
+        stmt = ShotDataBase._matching_profile_keys("spres")
+        compiled = stmt.compile(ShotDataBase.engine)
+        with ShotDataBase.engine.connect() as connection:
+            plan = connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {compiled}", tuple(compiled.params.values())
+            ).fetchall()
+        details = [row[-1] for row in plan]
+        assert any(
+            d.startswith("SCAN profile_trigram_fts VIRTUAL TABLE INDEX") for d in details
+        )
+        assert any(d.startswith("SCAN profile_fts VIRTUAL TABLE INDEX") for d in details)
+
+    def test_trigram_index_is_filled_on_existing_databases(self):
+        insert_named("Espresso", stages=["Preinfusion"])
+        with ShotDataBase.engine.begin() as connection:
+            connection.exec_driver_sql("DROP TABLE profile_trigram_fts")
+            connection.exec_driver_sql("DROP TABLE stage_trigram_fts")
+        ShotDataBase._init_trigram_tables()
+        assert found("spres") == ["Espresso"]
+        assert found("fusion") == ["Espresso"]
+
+    def test_deleted_profiles_leave_the_index(self):
+        insert_named("Espresso")
+        ShotDataBase.delete_shot(ShotDataBase.search_history(SearchParams())[0]["db_key"])
+        with ShotDataBase.engine.connect() as connection:
+            rows = connection.exec_driver_sql("SELECT * FROM profile_trigram_fts").fetchall()
+        assert rows == []
+
+
+def shot_points(count):
+    return [
+        {
+            "shot": {"pressure": i / 2, "flow": 2.0, "weight": float(i)},
+            "time": i * 100,
+            "status": "brewing",
+        }
+        for i in range(count)
+    ]
+
+
+class TestShotSummary:
+    def test_summary_is_stored_at_ingest(self):
+        ShotDataBase.insert_history(make_history_entry(data=shot_points(20)))
+
+        assert "summary" not in ShotDataBase.search_history(SearchParams())[0]
+        summary = ShotDataBase.search_history(SearchParams(summary=True))[0]["summary"]
+        assert summary["points"] == 20
+        assert summary["peak_pressure"] == 9.5
+        assert summary["final_weight"] == 19.0
+        assert len(summary["preview"]["time"]) == 20
+
+    def test_given_summary_is_used(self):
+        summary = sdb_module.summarize_shot(shot_points(5))
+        ShotDataBase.insert_history(make_history_entry(), summary)
+        assert ShotDataBase.search_history(SearchParams(summary=True))[0]["summary"] == summary
+
+    def test_backfill(self, tmp_path):
+        shots = tmp_path / "shots"
+        _write_compressed_shot(shots, "s1.zst", {"data": shot_points(8)})
+        ShotDataBase.insert_history(make_history_entry(id="h1", file="s1.zst"))
+        ShotDataBase.insert_history(make_history_entry(id="h2", file="missing.zst"))
+        assert [
+            s["summary"] for s in ShotDataBase.search_history(SearchParams(summary=True))
+        ] == [
+            None,
+            None,
+        ]
+
+        assert ShotDataBase.backfill_summaries(limit=1) == 1
+        assert ShotDataBase.backfill_summaries() == 1
+        assert ShotDataBase.backfill_summaries() == 0
+
+        summaries = {
+            s["id"]: s["summary"]
+            for s in ShotDataBase.search_history(SearchParams(summary=True))
+        }
+        assert summaries["h1"]["points"] == 8
+        # Unreadable files get an empty summary and aren't tried again
+        assert summaries["h2"]["points"] == 0
+
+    def test_deleted_with_the_shot(self):
+        db_id = ShotDataBase.insert_history(make_history_entry(data=shot_points(3)))
+        ShotDataBase.delete_shot(db_id)
+        with ShotDataBase.engine.connect() as connection:
+            assert connection.exec_driver_sql("SELECT * FROM shot_summary").fetchall() == []
@@ -0,0 +1,194 @@
+import json
+import math
+
+import pytest
+import zstandard as zstd
+
+import shot_file
+from shot_file import (
+    ZSTD_WINDOW_LOG,
+    WRITE_CHUNK_SIZE,
+    ShotDictionaries,
+    compression_parameters,
+    frame_dictionary_id,
+    iter_json,
+    read_json_zst,
+    recompress_without_dictionary,
+    write_json_zst,
+)
+
+
+def shot(points=500):
+    return {
+        "time": 1780297200.5,
+        "profile_name": "Café crème",
+        "data": [
+            {
+                "shot": {"pressure": i / 10, "flow": 2.0, "weight": "NaN", "setpoints": {}},
+                "time": i * 100,
+                "status": "brewing",
+            }
+            for i in range(points)
+        ],
+        "id": "0d4f",
+        "profile": {"name": "Café crème", "stages": [], "variables": [{"value": math.inf}]},
+    }
+
+
+class TestIterJson:
+    @pytest.mark.parametrize(
+        "data",
+        [
+            shot(),
+            {},
+            {"data": []},
+            {"a": [1, [2, 3], {"b": None}], "c": "ü"},
+            [1, 2, 3],
+            {1: "non string keys"},
+            "text",
+            None,
+        ],
+    )
+    def test_identical_to_dumps(self, data):
+        assert "".join(iter_json(data)) == json.dumps(data, ensure_ascii=False)
+
+    def test_lists_are_encoded_per_item(self):
+        pieces = list(iter_json(shot(100)))
+        assert len(pieces) > 100
+        assert max(map(len, pieces)) < 200
+
+
+class TestWriteJsonZst:
+    def test_round_trip(self, tmp_path):
+        data = shot(5000)
+        path = tmp_path / "2026-10-18" / "08:00:00.shot.json.zst"
+        size = write_json_zst(data, path)
+
+        expected = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        assert size == len(expected) > WRITE_CHUNK_SIZE
+        with open(path, "rb") as file:
+            assert zstd.ZstdDecompressor().stream_reader(file).read() == expected
+        assert read_json_zst(path)["data"][-1]["time"] == 499900
+        assert list(path.parent.iterdir()) == [path]
+
+    def test_frame_parameters(self, tmp_path):
+        path = tmp_path / "shot.json.zst"
+        write_json_zst(shot(), path)
+        frame = zstd.get_frame_parameters(path.read_bytes())
+        assert frame.has_checksum
+        assert frame.window_size <= 1 << ZSTD_WINDOW_LOG
+
+    def test_bounded_tables(self):
+        params = compression_parameters()
+        assert params.window_log == ZSTD_WINDOW_LOG
+        assert params.hash_log <= ZSTD_WINDOW_LOG
+        assert params.chain_log <= ZSTD_WINDOW_LOG
+
+    def test_failed_write_keeps_existing_file(self, tmp_path):
+        path = tmp_path / "shot.json.zst"
+        write_json_zst({"id": "old"}, path)
+
+        with pytest.raises(TypeError):
+            write_json_zst({"id": "new", "data": [object()]}, path)
+
+        assert read_json_zst(path) == {"id": "old"}
+        assert list(tmp_path.iterdir()) == [path]
+
+
+@pytest.fixture
+def dictionaries(tmp_path, monkeypatch):
+    monkeypatch.setattr(shot_file, "ZSTD_DICTIONARY_PATH", tmp_path / "dictionaries")
+    monkeypatch.setattr(ShotDictionaries, "_cache", {})
+    monkeypatch.setattr(ShotDictionaries, "_current", None)
+    # Keep training fast
+    monkeypatch.setattr(ShotDictionaries, "SIZE", 16 * 1024)
+    monkeypatch.setattr(ShotDictionaries, "MAX_SAMPLE_BYTES", 100 * 16 * 1024)
+    return tmp_path / "dictionaries"
+
+
+def short_shot(seed):
+    data = shot(40 + seed)
+    data["id"] = f"shot-{seed}"
+    data["time"] += seed * 3600
+    return data
+
+
+def shot_files(directory, count):
+    paths = []
+    for seed in range(count):
+        path = directory / f"{seed:02d}.shot.json.zst"
+        write_json_zst(short_shot(seed), path)
+        paths.append(path)
+    return paths
+
+
+class TestShotDictionaries:
+    def test_needs_enough_files(self, tmp_path, dictionaries):
+        paths = shot_files(tmp_path, ShotDictionaries.MIN_FILES - 1)
+        assert ShotDictionaries.train(paths) is None
+        assert ShotDictionaries.current() is None
+
+    def test_frames_reference_the_dictionary(self, tmp_path, dictionaries):
+        dictionary = ShotDictionaries.train(shot_files(tmp_path, 40))
+        assert ShotDictionaries.current() is dictionary
+        assert [d["name"] for d in ShotDictionaries.available()] == [
+            f"0001-{dictionary.dict_id()}{ShotDictionaries.SUFFIX}"
+        ]
+
+        data = short_shot(99)
+        plain = tmp_path / "plain.shot.json.zst"
+        trained = tmp_path / "trained.shot.json.zst"
+        write_json_zst(data, plain)
+        write_json_zst(data, trained, dictionary=dictionary)
+
+        with open(trained, "rb") as file:
+            assert frame_dictionary_id(file) == dictionary.dict_id()
+        with open(plain, "rb") as file:
+            assert frame_dictionary_id(file) == 0
+        assert trained.stat().st_size < plain.stat().st_size
+        assert read_json_zst(trained) == read_json_zst(plain) == json.loads(json.dumps(data))
+
+    def test_dictionary_is_resolved_from_disk(self, tmp_path, dictionaries):
+        dictionary = ShotDictionaries.train(shot_files(tmp_path, 10))
+        path = tmp_path / "trained.shot.json.zst"
+        write_json_zst(short_shot(7), path, dictionary=dictionary)
+
+        # A fresh start only has the files
+        ShotDictionaries._cache.clear()
+        ShotDictionaries._current = None
+        assert read_json_zst(path)["id"] == "shot-7"
+        assert ShotDictionaries.current().dict_id() == dictionary.dict_id()
+
+    def test_versions_accumulate(self, tmp_path, dictionaries):
+        paths = shot_files(tmp_path, 10)
+        first = ShotDictionaries.train(paths)
+        path = tmp_path / "first.shot.json.zst"
+        write_json_zst(short_shot(3), path, dictionary=first)
+
+        more = tmp_path / "more"
+        more.mkdir()
+        second = ShotDictionaries.train(shot_files(more, 12))
+        assert second.dict_id() != first.dict_id()
+        assert ShotDictionaries.current() is second
+        assert len(ShotDictionaries.available()) == 2
+        assert read_json_zst(path)["id"] == "shot-3"
+
+    def test_missing_dictionary(self, tmp_path, dictionaries):
+        dictionary = ShotDictionaries.train(shot_files(tmp_path, 10))
+        path = tmp_path / "trained.shot.json.zst"
+        write_json_zst(short_shot(1), path, dictionary=dictionary)
+
+        for file in dictionaries.iterdir():
+            file.unlink()
+        ShotDictionaries._cache.clear()
+        with pytest.raises(FileNotFoundError):
+            read_json_zst(path)
+
+    def test_recompress_without_dictionary(self, tmp_path, dictionaries):
+        dictionary = ShotDictionaries.train(shot_files(tmp_path, 10))
+        path = tmp_path / "trained.shot.json.zst"
+        write_json_zst(short_shot(2), path, dictionary=dictionary)
+
+        portable = recompress_without_dictionary(path)
+        decompressed = zstd.ZstdDecompressor().stream_reader(portable).read()
+        assert json.loads(decompressed)["id"] == "shot-2"
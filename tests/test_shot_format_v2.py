@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from esp_serial.data import SensorData, ShotData
+from shot_buffer import ShotBuffer
+from shot_format_v2 import (
+    SHOT_V2_SUFFIX,
+    ShotFileV2,
+    ShotFormatError,
+    is_shot_v2,
+    write_shot_v2,
+)
+from shot_manager import Shot
+
+
+def record(buffer: ShotBuffer, ticks: int = 300, profile_ms: bool = False):
+    for i in range(ticks):
+        buffer.attach_sensors(SensorData(tube=90.0 + i / 100, water_status=i % 2 == 0))
+        buffer.append(
+            ShotData(
+                pressure=i / 30,
+                flow=2.0,
+                weight="NaN" if i == 7 else i / 10,
+                status="heating" if i < 20 else "brewing",
+                time=i * 100,
+                profile_time=i * 90,
+                main_controller_kind="Pressure",
+                main_setpoint=9.0,
+                aux_controller_kind="Flow" if i > 100 else None,
+                aux_setpoint=4.0,
+                is_aux_controller_active=i > 200,
+            ),
+            profile_ms=i * 101 if profile_ms else None,
+        )
+
+
+@pytest.fixture
+def shot():
+    shot = Shot()
+    shot.profile_name = "Café crème"
+    shot.profile = {"name": "Café crème", "stages": []}
+    record(shot.shotData)
+    return shot
+
+
+class TestShotFormatV2:
+    def test_legacy_json_round_trip(self, tmp_path, shot):
+        path = tmp_path / f"08:00:00{SHOT_V2_SUFFIX}"
+        write_shot_v2(path, shot.to_json(with_data=False), shot.shotData)
+
+        assert is_shot_v2(path)
+        legacy = ShotFileV2.open(path).to_legacy_json()
+        assert legacy == shot.to_json()
+        assert json.dumps(legacy) == json.dumps(shot.to_json())
+
+    def test_profile_ms_column(self, tmp_path):
+        buffer = ShotBuffer(profile_ms=True)
+        record(buffer, 50, profile_ms=True)
+        write_shot_v2(tmp_path / "debug.v2", {"time": 1.0, "data": []}, buffer)
+
+        legacy = ShotFileV2.open(tmp_path / "debug.v2").to_legacy_json()
+        assert legacy["data"] == buffer.to_list()
+        assert legacy["data"][3]["profile_ms"] == 303
+
+    def test_read_only_requested_channels(self, tmp_path, shot):
+        path = tmp_path / "shot.v2"
+        write_shot_v2(path, shot.to_json(with_data=False), shot.shotData)
+
+        shot_file = ShotFileV2.open(path)
+        assert shot_file.rows == 300
+        assert "sensors.tube" in shot_file.channels
+
+        selected = shot_file.read(["pressure", "status"], start_ms=1000, end_ms=2500)
+        assert selected["pressure"] == [i / 30 for i in range(10, 26)]
+        assert selected["status"] == ["heating"] * 10 + ["brewing"] * 6
+        assert set(shot_file._cache) == {"time", "pressure", "status"}
+
+    def test_read_sensors_and_nan(self, tmp_path, shot):
+        path = tmp_path / "shot.v2"
+        write_shot_v2(path, shot.to_json(with_data=False), shot.shotData)
+
+        selected = ShotFileV2.open(path).read(
+            ["weight", "sensors.tube", "sensors.water_status"], end_ms=700
+        )
+        assert selected["weight"][7] is None
+        assert selected["sensors.tube"][0] == 90.01
+        # The last datapoint gets its sensors with the next tick
+        assert selected["sensors.tube"][-1] == 90.08
+        assert ShotFileV2.open(path).read(["sensors.tube"])["sensors.tube"][-1] is None
+
+    def test_unknown_channel(self, tmp_path, shot):
+        path = tmp_path / "shot.v2"
+        write_shot_v2(path, shot.to_json(with_data=False), shot.shotData)
+        with pytest.raises(KeyError):
+            ShotFileV2.open(path).read(["nope"])
+
+    def test_invalid_files(self, tmp_path, shot):
+        path = tmp_path / "shot.v2"
+        write_shot_v2(path, shot.to_json(with_data=False), shot.shotData)
+        data = path.read_bytes()
+
+        with pytest.raises(ShotFormatError):
+            ShotFileV2(b"METSHOT1" + data[8:])
+        with pytest.raises(ShotFormatError):
+            ShotFileV2(data[:10])
+        with pytest.raises(ShotFormatError):
+            ShotFileV2(data[: len(data) - 20]).channel(ShotFileV2(data).channels[-1])
@@ -0,0 +1,159 @@
+import pytest
+
+import shot_manager as shot_manager_module
+from esp_serial.data import SensorData, ShotData
+from shot_file import read_json_zst
+from shot_journal import JOURNAL_SUFFIX, ShotJournal, journal_files, read_journal
+from shot_manager import Shot, ShotDataBase, ShotManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def record_shot(shot: Shot, journal: ShotJournal, ticks: int, clock: FakeClock = None):
+    """Feeds ticks the way ShotManager does, sensors first"""
+    start = len(shot.shotData)
+    for i in range(start, start + ticks):
+        shot.addSensorData(SensorData(tube=90.0 + i))
+        shot.append_shot_data(ShotData(pressure=i / 10, status="brewing", time=i * 100))
+        journal.update(shot)
+        if clock is not None:
+            clock.now += 0.1
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    calls = []
+    monkeypatch.setattr("shot_journal.os.fsync", lambda fd: calls.append(fd))
+    return calls
+
+
+class TestShotJournal:
+    def test_chunks_hold_back_the_latest_datapoint(self, tmp_path, fsyncs):
+        shot = Shot()
+        journal = ShotJournal(tmp_path, shot, clock=FakeClock())
+        assert journal.path == tmp_path / f"{shot.id}{JOURNAL_SUFFIX}"
+
+        record_shot(shot, journal, ShotJournal.CHUNK_TICKS)
+        assert read_journal(journal.path)["data"] == []
+
+        record_shot(shot, journal, 1)
+        recovered = read_journal(journal.path)
+        assert len(recovered["data"]) == ShotJournal.CHUNK_TICKS
+        assert recovered["data"] == shot.to_json()["data"][: ShotJournal.CHUNK_TICKS]
+        assert "sensors" in recovered["data"][-1]
+
+    def test_close_journals_everything(self, tmp_path, fsyncs):
+        shot = Shot()
+        shot.profile_name = "Espresso"
+        shot.profile = {"name": "Espresso"}
+        journal = ShotJournal(tmp_path, shot, clock=FakeClock())
+        record_shot(shot, journal, 45)
+        shot.extractionTime = 4.2
+        journal.close(shot)
+
+        recovered = read_journal(journal.path)
+        expected = {**shot.to_json(), "extraction_time": 4.2}
+        assert recovered == expected
+        journal.discard()
+        assert journal_files(tmp_path) == []
+
+    def test_fsync_is_batched(self, tmp_path, fsyncs):
+        clock = FakeClock()
+        shot = Shot()
+        journal = ShotJournal(tmp_path, shot, clock=clock)
+        assert len(fsyncs) == 1
+
+        # 20 s of ticks at 10 Hz write a chunk every 2 s, the chunks written at 6 s,
+        # 12 s and 18 s are the first ones FSYNC_INTERVAL after the previous sync
+        record_shot(shot, journal, 200, clock)
+        assert journal.records_written == 2 + 9
+        assert len(fsyncs) == 1 + 3
+
+        journal.close(shot)
+        assert len(fsyncs) == 1 + 3 + 1
+
+    def test_torn_record_is_ignored(self, tmp_path, fsyncs):
+        shot = Shot()
+        journal = ShotJournal(tmp_path, shot, clock=FakeClock())
+        record_shot(shot, journal, 2 * ShotJournal.CHUNK_TICKS + 1)
+        journal.close()
+
+        data = journal.path.read_bytes()
+        journal.path.write_bytes(data[:-10])
+        recovered = read_journal(journal.path)
+        assert len(recovered["data"]) == ShotJournal.CHUNK_TICKS
+        assert recovered["id"] == shot.id
+
+    def test_unknown_file(self, tmp_path):
+        path = tmp_path / f"garbage{JOURNAL_SUFFIX}"
+        path.write_bytes(b"not a journal")
+        assert read_journal(path) is None
+
+
+class TestRecoverJournals:
+    @pytest.fixture
+    def history(self, tmp_path, monkeypatch, fsyncs):
+        shots = tmp_path / "shots"
+        journals = tmp_path / "journal"
+        monkeypatch.setattr(shot_manager_module, "SHOT_PATH", shots)
+        monkeypatch.setattr(shot_manager_module, "SHOT_JOURNAL_PATH", journals)
+
+        inserted = []
+        monkeypatch.setattr(
+            ShotDataBase,
+            "history_exists",
+            staticmethod(lambda entry: any(e["file"] == entry["file"] for e in inserted)),
+        )
+        monkeypatch.setattr(
+            ShotDataBase, "insert_history", staticmethod(lambda entry: inserted.append(entry))
+        )
+        return shots, journals, inserted
+
+    def test_orphaned_journal_is_added_to_history(self, history):
+        shots, journals, inserted = history
+        shot = Shot()
+        journal = ShotJournal(journals, shot, clock=FakeClock())
+        record_shot(shot, journal, 3 * ShotJournal.CHUNK_TICKS + 5)
+        # Power cut: the journal is never closed
+
+        ShotManager.recoverJournals()
+
+        assert len(inserted) == 1
+        entry = inserted[0]
+        assert entry["id"] == shot.id
+        assert len(entry["data"]) == 3 * ShotJournal.CHUNK_TICKS
+        stored = read_json_zst(shots / entry["file"])
+        assert stored["data"] == entry["data"]
+        assert journal_files(journals) == []
+
+        # Nothing is added twice
+        ShotManager.recoverJournals()
+        assert len(inserted) == 1
+
+    def test_stored_shot_is_not_inserted_twice(self, history):
+        shots, journals, inserted = history
+        shot = Shot()
+        journal = ShotJournal(journals, shot, clock=FakeClock())
+        record_shot(shot, journal, ShotJournal.CHUNK_TICKS + 1)
+        journal.close(shot)
+
+        _folder, file_path = ShotManager._timestampToFilePaths(shot.startTime)
+        inserted.append({"file": str(file_path)})
+        ShotManager.recoverJournals()
+        assert len(inserted) == 1
+        assert journal_files(journals) == []
+
+    def test_empty_journal_is_removed(self, history):
+        _shots, journals, inserted = history
+        journal = ShotJournal(journals, Shot(), clock=FakeClock())
+        journal.close()
+
+        ShotManager.recoverJournals()
+        assert inserted == []
+        assert journal_files(journals) == []
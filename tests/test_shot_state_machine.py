@@ -0,0 +1,136 @@
+import pytest
+
+from esp_serial.connection.emulation_data import EmulationData
+from esp_serial.data import MachineStatus, ShotData
+from esp_serial.line_framer import LineFramer
+from esp_serial.message_schema import MessageRegistry
+from esp_serial.raw_capture import RawCapture, RawCaptureWriter, capture_files
+from shot_state_machine import ShotEvent, ShotStateMachine
+
+# The emulated ESP sends one line every 75ms
+LINE_INTERVAL = 0.075
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def tick(status, stable_weight=False):
+    return ShotData(status=status, stable_weight=stable_weight)
+
+
+@pytest.fixture(scope="module")
+def espresso_capture(tmp_path_factory):
+    """The emulated espresso shot as a raw serial capture"""
+    directory = tmp_path_factory.mktemp("capture")
+    EmulationData.init()
+    clock = FakeClock()
+    writer = RawCaptureWriter(directory, clock=clock)
+    for line in EmulationData.ESPRESSO_DATA:
+        line = line.strip(" \t\r\n")
+        if line:
+            writer.write(f"{line}\r\n".encode())
+            clock.now += LINE_INTERVAL
+    writer.close()
+    return capture_files(directory)[0]
+
+
+def replay(path, state: ShotStateMachine, clock: FakeClock):
+    """Feeds every Data message of a capture at its recorded time"""
+    framer = LineFramer()
+    ticks = []
+    with RawCapture(path) as capture:
+        for timestamp, chunk in capture.records():
+            clock.now = timestamp
+            for line in framer.feed(chunk):
+                parsed = MessageRegistry.parse_line(line.decode().strip("\r\n"))
+                if parsed is None or parsed[0] != "Data":
+                    continue
+                data = parsed[1]
+                ticks.append((data, state.feed(data, profile_ready=True)))
+    return ticks
+
+
+class TestShotStateMachineReplay:
+    def test_espresso_shot(self, espresso_capture):
+        clock = FakeClock()
+        state = ShotStateMachine(clock=clock)
+        ticks = replay(espresso_capture, state, clock)
+
+        events = [event for _, tick_events in ticks for event in tick_events]
+        kinds = [event.kind for event in events if event.kind != ShotEvent.DEBUG_START]
+        assert kinds == [ShotEvent.SHOT_START, ShotEvent.EXTRACTION_END, ShotEvent.SHOT_END]
+
+        # Preinfusion and infusion take 306 Data messages, one every 150ms
+        extraction_end = next(e for e in events if e.kind == ShotEvent.EXTRACTION_END).value
+        assert extraction_end == pytest.approx(306 * 2 * LINE_INTERVAL * 1000, abs=1)
+
+        brewing = [data for data, _ in ticks if data.is_extracting]
+        assert brewing[0].status == "Preinfusion"
+        assert brewing[-1].status == MachineStatus.RETRACTING
+        retracting = [data for data in brewing if data.status == MachineStatus.RETRACTING]
+        assert all(data.profile_time == extraction_end for data in retracting)
+        assert retracting[-1].time > extraction_end
+        assert not state.brewing
+
+    def test_replay_is_deterministic(self, espresso_capture):
+        stamped = []
+        for _ in range(2):
+            clock = FakeClock()
+            ticks = replay(espresso_capture, ShotStateMachine(clock=clock), clock)
+            stamped.append([(d.time, d.profile_time, d.is_extracting) for d, _ in ticks])
+        assert stamped[0] == stamped[1]
+
+
+class TestShotStateMachine:
+    def test_stable_weight_ends_shot_while_retracting(self):
+        clock = FakeClock()
+        state = ShotStateMachine(stable_time_threshold=2.0, clock=clock)
+        state.feed(tick(MachineStatus.CLOSING_VALVE), False)
+        assert [e.kind for e in state.feed(tick("Infusion"), False)] == [ShotEvent.SHOT_START]
+
+        for i in range(30):
+            clock.now += 0.1
+            events = state.feed(tick(MachineStatus.RETRACTING, stable_weight=i >= 5), False)
+            if ShotEvent.SHOT_END in [e.kind for e in events]:
+                break
+        # Stable from the 6th tick on, over after another 2 seconds
+        assert i == 25
+        assert not state.brewing
+
+    def test_unstable_weight_restarts_the_wait(self):
+        clock = FakeClock()
+        state = ShotStateMachine(stable_time_threshold=1.0, clock=clock)
+        state.feed(tick(MachineStatus.CLOSING_VALVE), False)
+        state.feed(tick("Infusion"), False)
+        for stable in [True] * 5 + [False] + [True] * 5:
+            clock.now += 0.1
+            state.feed(tick(MachineStatus.RETRACTING, stable), False)
+        assert state.brewing
+
+    def test_idle_clears_loaded_profile(self):
+        state = ShotStateMachine(clock=FakeClock())
+        state.feed(tick(MachineStatus.IDLE), False)
+        events = state.feed(tick(MachineStatus.HEATING), True)
+        assert [e.kind for e in events] == [ShotEvent.DEBUG_START, ShotEvent.HEATING_START]
+
+        events = state.feed(tick(MachineStatus.IDLE), True)
+        assert [e.kind for e in events] == [
+            ShotEvent.DEBUG_END,
+            ShotEvent.IDLE,
+            ShotEvent.HEATING_END,
+        ]
+        assert not state.profile_ready
+        assert state.is_idle
+
+    def test_purge_ends_shot(self):
+        state = ShotStateMachine(clock=FakeClock())
+        state.feed(tick(MachineStatus.CLOSING_VALVE), False)
+        state.feed(tick("Infusion"), False)
+        events = state.feed(tick(MachineStatus.PURGE), False)
+        assert [e.kind for e in events] == [ShotEvent.SHOT_END]
+        assert events and not state.brewing
@@ -0,0 +1,58 @@
+import pytest
+
+from esp_serial.data import SensorData, ShotData
+from shot_manager import Shot
+from shot_summary import summarize_shot
+
+
+def record(ticks=300, retract_from=250):
+    shot = Shot()
+    for i in range(ticks):
+        shot.addSensorData(SensorData(external_1=92.0 + (i % 3)))
+        shot.append_shot_data(
+            ShotData(
+                pressure=min(i / 10, 9.0),
+                flow=2.0 if i % 2 else 4.0,
+                weight="NaN" if i == ticks - 1 else i / 8,
+                status="retracting" if i >= retract_from else "brewing",
+                time=i * 100,
+            )
+        )
+    return shot.to_json()["data"]
+
+
+class TestSummarizeShot:
+    def test_extraction_values(self):
+        summary = summarize_shot(record())
+        assert summary["points"] == 300
+        assert summary["total_time"] == pytest.approx(29.9)
+        assert summary["extraction_time"] == pytest.approx(24.9)
+        # The last weight was unreadable
+        assert summary["final_weight"] == pytest.approx(298 / 8, abs=0.01)
+        assert summary["peak_pressure"] == 9.0
+        assert summary["avg_flow"] == 3.0
+        assert summary["peak_flow"] == 4.0
+        assert summary["end_status"] == "retracting"
+
+    def test_temperatures(self):
+        summary = summarize_shot(record())
+        # Sensors are attached with the tick after a datapoint
+        assert summary["min_temperature"] == 92.0
+        assert summary["max_temperature"] == 94.0
+        assert summary["avg_temperature"] == pytest.approx(93.0, abs=0.01)
+
+    def test_preview(self):
+        preview = summarize_shot(record(), preview_points=30)["preview"]
+        assert set(preview) == {"time", "pressure", "flow", "weight"}
+        assert len(preview["time"]) == len(preview["pressure"]) == 30
+        assert preview["time"][:2] == [0, 1000]
+        assert preview["flow"][0] == 3.0
+        assert preview["pressure"][-1] == 9.0
+
+    def test_short_and_empty_shots(self):
+        assert len(summarize_shot(record(ticks=5))["preview"]["time"]) == 5
+        empty = summarize_shot([])
+        assert empty["points"] == 0
+        assert empty["total_time"] is None
+        assert empty["peak_pressure"] is None
+        assert empty["preview"] == {"time": [], "pressure": [], "flow": [], "weight": []}
@@ -2,6 +2,7 @@ import os
 import json
 import subprocess
 from log import MeticulousLogger
+from runtime import Runtime
 from config import (
     MeticulousConfig,
     CONFIG_USER,
@@ -10,6 +11,7 @@ from config import (
     DEFAULT_TIME_ZONE,
 )
 import asyncio
+from concurrent.futures import Future
 from datetime import datetime
 
 logger = MeticulousLogger.getLogger(__name__)
@@ -27,6 +29,7 @@ class TimezoneManager:
 
     __system_timezone: str = ""
     __system_synced: bool = False
+    __sync_task: Future = None
 
     @staticmethod
     def init():
@@ -249,12 +252,14 @@ class TimezoneManager:
     def tz_background_update():
         tz_config = MeticulousConfig[CONFIG_USER][TIMEZONE_SYNC]
         if tz_config == "automatic" and not TimezoneManager.__system_synced:
-            try:
-                logger.info("Timezone is set to automatic, fetching timezone in the background")
-                loop = asyncio.get_event_loop()
-                loop.run_until_complete(TimezoneManager.request_and_sync_tz())
-            except Exception as e:
-                logger.error(f"Error while fetching timezone in the background: {e}")
+            # The previous request retries for up to 20 s, don't pile up new ones
+            task = TimezoneManager.__sync_task
+            if task is not None and not task.done():
+                return
+            logger.info("Timezone is set to automatic, fetching timezone in the background")
+            TimezoneManager.__sync_task = Runtime.spawn(
+                TimezoneManager.request_and_sync_tz(), "timezone-sync"
+            )
 
     @staticmethod
     async def request_and_sync_tz() -> str:
@@ -272,9 +277,8 @@ class TimezoneManager:
                             str_content = await response.text()
                             tz = json.loads(str_content).get("tz")
                             if tz is not None:
-                                TimezoneManager.update_timezone(
-                                    tz
-                                )  # raises TimezoneManagerError if fails
+                                # raises TimezoneManagerError if fails
+                                await Runtime.run_blocking(TimezoneManager.update_timezone, tz)
                                 TimezoneManager.__system_synced = True
                                 return tz
                             else:
@@ -235,8 +235,6 @@ class WifiManager:
 
     def tryAutoConnect():
         logger.info("Starting Networking background Thread")
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         while True:
             time.sleep(10)
 